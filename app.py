@@ -1,30 +1,492 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, g, has_request_context
 import requests
 import os
-from datetime import datetime, timedelta
-import google.generativeai as genai
+import re
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import tempfile
+from datetime import datetime, timedelta, date, timezone
+from urllib.parse import urlsplit
+import click
+import numpy as np
+from cache import TTLCache
+from geocode_store import GeocodeStore
+from gazetteer import Gazetteer, geonamescache, load_geonames, normalize
+from upstream import UpstreamClient
+from quota import TokenBucket, QuotaExhaustedError, INTERACTIVE, SECONDARY, BACKGROUND
+from metrics import MetricsRegistry
+from http_cache import CachePolicy, StaticAssets, IMMUTABLE_MAX_AGE, MIN_COMPRESS_SIZE, compress, content_etag, is_compressible, negotiate_encoding
+from refresher import HotKeyRefresher
+from history_archive import HistoryArchive
+from predictions import PredictionStore, points_for
+from rule_engine import compile_activity_rules, compile_health_rules, FAVORABLE
+from climatology import ClimatologyStore, MAX_TEMP, MIN_TEMP, PRECIPITATION, percentile_of, summarize
 
 app = Flask(__name__)
 
+# Upstream URLs can be pointed elsewhere (e.g. at the stub servers in bench/) through the environment.
 # Base URL for OpenWeatherMap API (Current Weather)
-OWM_BASE_URL = 'http://api.openweathermap.org/data/2.5/weather'
+OWM_BASE_URL = os.getenv('OWM_BASE_URL', 'http://api.openweathermap.org/data/2.5/weather')
+# Base URL for OpenWeatherMap API (5 day / 3 hour Forecast)
+OWM_FORECAST_URL = os.getenv('OWM_FORECAST_URL', 'http://api.openweathermap.org/data/2.5/forecast')
 # Base URL for Open-Meteo Historical API
-OPEN_METEO_HISTORICAL_URL = 'https://archive-api.open-meteo.com/v1/archive'
+OPEN_METEO_HISTORICAL_URL = os.getenv('OPEN_METEO_HISTORICAL_URL', 'https://archive-api.open-meteo.com/v1/archive')
 
 # Nominatim Geocoding URL
-NOMINATIM_BASE_URL = 'https://nominatim.openstreetmap.org/search'
+NOMINATIM_BASE_URL = os.getenv('NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org/search')
 
-def geocode_city(city_name):
+# Cooperative I/O mode, set by wsgi_async.py. Blocking upstream calls then only suspend the current
+# greenlet, so a process can hold hundreds of in-flight requests; pools are sized to match.
+ASYNC_IO = os.getenv('CLIMACAST_ASYNC_IO', 'false').lower() == 'true'
+
+# Shared pooled/retrying HTTP client used for every upstream call.
+upstream_client = UpstreamClient(
+    pool_maxsize=int(os.getenv('UPSTREAM_POOL_MAXSIZE', '200' if ASYNC_IO else '20')),
+    connect_timeout=float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.getenv('UPSTREAM_READ_TIMEOUT', '10')),
+    retries=int(os.getenv('UPSTREAM_RETRIES', '2')),
+    failure_threshold=int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('UPSTREAM_BREAKER_RESET', '30')),
+)
+
+# Call budgets every outbound call draws from, at one of three priorities: INTERACTIVE (/api/weather,
+# the dashboard), SECONDARY (perfect-day, health, batch, history, AI) and BACKGROUND (cache refresh).
+# Lower priorities leave part of each bucket to the higher ones; a 429 pauses the bucket for its Retry-After.
+# OWM's free tier allows 60 calls per minute.
+owm_budget = TokenBucket.per_minute(int(os.getenv('OWM_CALLS_PER_MIN', '60')), burst=int(os.getenv('OWM_BURST', '10')))
+# Nominatim's usage policy allows at most 1 request per second.
+nominatim_budget = TokenBucket(rate=float(os.getenv('NOMINATIM_RATE_PER_SEC', '1')), capacity=1, reserve=(0.0, 0.0, 0.0),
+                               max_wait=(float(os.getenv('NOMINATIM_MAX_WAIT', '2')), 1.0, 0.0))
+# Open-Meteo's free archive allows 600 calls per minute but only 5000 per hour.
+open_meteo_budget = TokenBucket.per_minute(int(os.getenv('OPEN_METEO_CALLS_PER_MIN', '80')), burst=20)
+# Gemini is called through its SDK, so the AI routes draw from this budget themselves.
+gemini_budget = TokenBucket.per_minute(int(os.getenv('GEMINI_CALLS_PER_MIN', '15')), burst=5)
+upstream_client.set_budget(OWM_BASE_URL, owm_budget)
+upstream_client.set_budget(OWM_FORECAST_URL, owm_budget)
+upstream_client.set_budget(NOMINATIM_BASE_URL, nominatim_budget)
+upstream_client.set_budget(OPEN_METEO_HISTORICAL_URL, open_meteo_budget)
+UPSTREAM_BUDGETS = {'owm': owm_budget, 'nominatim': nominatim_budget, 'open_meteo': open_meteo_budget, 'gemini': gemini_budget}
+
+# Process-wide metrics, served on /metrics in the Prometheus text format.
+metrics_registry = MetricsRegistry()
+# Adds a Server-Timing header with the request's total time and the upstream calls made on its thread.
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+UPSTREAM_NAMES = {urlsplit(OWM_BASE_URL).netloc: 'owm', urlsplit(OWM_FORECAST_URL).netloc: 'owm',
+                  urlsplit(NOMINATIM_BASE_URL).netloc: 'nominatim', urlsplit(OPEN_METEO_HISTORICAL_URL).netloc: 'open_meteo'}
+request_duration = metrics_registry.histogram(
+    'climacast_http_request_duration_seconds', 'Time spent handling HTTP requests.', ('endpoint', 'method', 'status'))
+upstream_duration = metrics_registry.histogram(
+    'climacast_upstream_request_duration_seconds', 'Latency of each upstream call attempt.', ('upstream', 'outcome'))
+upstream_events = metrics_registry.counter(
+    'climacast_upstream_events_total', 'Upstream retries, timeouts, 429s, open-circuit and budget refusals.', ('upstream', 'event'))
+
+def observe_upstream_call(upstream, outcome, seconds):
+    """Records one upstream call attempt in the latency histogram (and in Server-Timing if enabled)."""
+    upstream_duration.observe(seconds, (upstream, outcome))
+    if SERVER_TIMING_ENABLED and has_request_context():
+        g.setdefault('upstream_timings', []).append((upstream, seconds))
+
+upstream_client.on_call = lambda host, outcome, seconds: observe_upstream_call(UPSTREAM_NAMES.get(host, host), outcome, seconds)
+upstream_client.on_event = lambda host, event: upstream_events.inc((UPSTREAM_NAMES.get(host, host), event))
+
+# Writable directory for on-disk stores (geocode cache, ...). Defaults to Flask's instance folder.
+INSTANCE_DIR = os.getenv('CLIMACAST_INSTANCE_DIR', app.instance_path)
+try:
+    os.makedirs(INSTANCE_DIR, exist_ok=True)
+except OSError:
+    # Read-only deployments (e.g. serverless) only allow writes under the temp directory.
+    INSTANCE_DIR = os.path.join(tempfile.gettempdir(), 'climacast')
+    os.makedirs(INSTANCE_DIR, exist_ok=True)
+
+# Persistent geocode cache. "Not found" answers expire sooner so new places can show up.
+GEOCODE_CACHE_TTL = int(os.getenv('GEOCODE_CACHE_TTL', str(30 * 86400)))
+GEOCODE_NEGATIVE_CACHE_TTL = int(os.getenv('GEOCODE_NEGATIVE_CACHE_TTL', '86400'))
+geocode_store = GeocodeStore(os.path.join(INSTANCE_DIR, 'geocode.sqlite3'),
+                             positive_ttl=GEOCODE_CACHE_TTL, negative_ttl=GEOCODE_NEGATIVE_CACHE_TTL)
+
+# Local city gazetteer (GeoNames cities above a population floor), the first tier of city
+# resolution and the source of autocomplete suggestions. Building it takes ~2 s, so the first
+# city lookup starts it in the background and lookups use it once it is ready.
+GAZETTEER_ENABLED = os.getenv('GAZETTEER_ENABLED', 'true').lower() == 'true' and geonamescache is not None
+GAZETTEER_MIN_POPULATION = int(os.getenv('GAZETTEER_MIN_POPULATION', '15000'))
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+_gazetteer_builder = None
+_gazetteer_builder_lock = threading.Lock()
+# Misspelling matches per normalized name (False for none); each search takes tens of milliseconds.
+gazetteer_fuzzy_cache = TTLCache(maxsize=int(os.getenv('GAZETTEER_FUZZY_CACHE_SIZE', '4096')), ttl=86400)
+
+# Permanent archive of past daily observations, keyed by a quantized grid cell and date.
+HISTORY_GRID_DEG = float(os.getenv('HISTORY_GRID_DEG', '0.1'))
+history_archive = HistoryArchive(os.path.join(INSTANCE_DIR, 'history.sqlite3'), grid_deg=HISTORY_GRID_DEG)
+
+# Daily Prediction Challenge. Predictions share the history archive's grid cells, so the resolver
+# (`flask predictions-resolve`, run nightly from deploy/crontab) scores each cell from one archive
+# request. The store must outlive deployments and be on the host that runs the resolver: on
+# serverless hosts INSTANCE_DIR is a per-instance temp directory, so point PREDICTIONS_DB_PATH
+# at persistent storage there.
+PREDICTIONS_DB_PATH = os.getenv('PREDICTIONS_DB_PATH', os.path.join(INSTANCE_DIR, 'predictions.sqlite3'))
+prediction_store = PredictionStore(PREDICTIONS_DB_PATH, grid_deg=HISTORY_GRID_DEG)
+if os.getenv('VERCEL') and not os.getenv('PREDICTIONS_DB_PATH'):
+    app.logger.warning("PREDICTIONS_DB_PATH is not set; prediction challenge entries are kept in ephemeral storage.")
+PREDICTION_MAX_LEAD_DAYS = int(os.getenv('PREDICTION_MAX_LEAD_DAYS', '7'))
+PREDICTION_SCORE_BATCH = int(os.getenv('PREDICTION_SCORE_BATCH', '5000'))
+PLAYER_ID_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+PLAYER_NAME_MAX_LENGTH = 32
+
+# Climatology store: 30+ years of daily series per ERA5-sized grid cell as memory-mapped arrays.
+CLIMATOLOGY_GRID_DEG = float(os.getenv('CLIMATOLOGY_GRID_DEG', '0.25'))
+CLIMATOLOGY_START_YEAR = int(os.getenv('CLIMATOLOGY_START_YEAR', '1980'))
+# Queue a background backfill of a missing cell on the first /api/climatology request for it (answered
+# with 202) instead of returning 404. Off by default: a cell costs several long Open-Meteo calls, so
+# cells are normally filled ahead of time with `flask climatology-backfill`.
+CLIMATOLOGY_AUTO_BACKFILL = os.getenv('CLIMATOLOGY_AUTO_BACKFILL', 'false').lower() == 'true'
+# The Open-Meteo archive publishes days with a delay of about five days.
+ARCHIVE_LAG_DAYS = 6
+climatology_store = ClimatologyStore(os.path.join(INSTANCE_DIR, 'climatology'), grid_deg=CLIMATOLOGY_GRID_DEG,
+                                     base_date=date(CLIMATOLOGY_START_YEAR, 1, 1))
+# Auto-backfills run one at a time, off the request threads and the shared io_executor.
+climatology_backfill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='climacast-backfill')
+_climatology_backfills = {} # cell -> Future of its queued or running backfill
+_climatology_backfills_lock = threading.Lock()
+
+# Gemini model used by the AI routes; created once per process by get_gemini_model(). The SDK takes
+# longer to import than the rest of the app together, so it is only imported on the first AI request.
+GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL', 'gemini-pro')
+# Alternative API endpoint, e.g. "http://127.0.0.1:8104" for the bench/ stub. Only reachable over REST.
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+# The default gRPC transport blocks the whole process under gevent; REST goes through patched sockets.
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT', 'rest' if ASYNC_IO or GEMINI_API_ENDPOINT else None)
+_gemini_model = None
+_gemini_lock = threading.Lock()
+
+# Cache of Gemini responses. Near-identical inputs are bucketed onto one key so they share an answer.
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', '3600'))
+AI_CACHE_MAXSIZE = int(os.getenv('AI_CACHE_MAXSIZE', '1024'))
+ai_response_cache = TTLCache(maxsize=AI_CACHE_MAXSIZE, ttl=AI_CACHE_TTL)
+
+# Shared pool for upstream work that runs alongside a request (e.g. the dashboard's history lookup).
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv('IO_EXECUTOR_WORKERS', '200' if ASYNC_IO else '16')),
+                                 thread_name_prefix='climacast-io')
+
+# History exports: days per Open-Meteo request, and a small pool of their own that prefetches the
+# next chunk at BACKGROUND priority, so long exports cannot tie up io_executor or interactive quota.
+EXPORT_CHUNK_DAYS = int(os.getenv('EXPORT_CHUNK_DAYS', '366'))
+export_executor = ThreadPoolExecutor(max_workers=int(os.getenv('EXPORT_PREFETCH_WORKERS', '2')),
+                                     thread_name_prefix='climacast-export')
+
+# Batch weather endpoint: max locations per request and max concurrent upstream lookups.
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '200'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '64' if ASYNC_IO else '16'))
+
+# Shared current-conditions cache. OWM refreshes its data roughly every 10 minutes,
+# so entries are kept for that long by default.
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', '600'))
+WEATHER_CACHE_MAXSIZE = int(os.getenv('WEATHER_CACHE_MAXSIZE', '512'))
+# Decimal places used when keying the cache by coordinates (2 places is roughly 1 km).
+COORD_CACHE_PRECISION = 2
+# Expired entries are kept this long: served while a reload of them is in flight, and as a
+# stale-flagged fallback when the OWM budget is exhausted.
+WEATHER_CACHE_STALE_TTL = int(os.getenv('WEATHER_CACHE_STALE_TTL', '3600'))
+current_conditions_cache = TTLCache(maxsize=WEATHER_CACHE_MAXSIZE, ttl=WEATHER_CACHE_TTL,
+                                    stale_ttl=WEATHER_CACHE_STALE_TTL)
+
+# Background refresh of the most requested current-conditions entries shortly before they expire,
+# so popular places never pay a cold miss. Off on serverless hosts, which freeze idle processes.
+WEATHER_REFRESH_ENABLED = os.getenv('WEATHER_REFRESH_ENABLED', 'false' if os.getenv('VERCEL') else 'true').lower() == 'true'
+WEATHER_REFRESH_TOP_N = int(os.getenv('WEATHER_REFRESH_TOP_N', '32'))
+WEATHER_REFRESH_LEAD = float(os.getenv('WEATHER_REFRESH_LEAD', '60'))
+WEATHER_REFRESH_INTERVAL = float(os.getenv('WEATHER_REFRESH_INTERVAL', '5'))
+# Upstream calls per minute the refreshers of the whole deployment may spend; keeps headroom in
+# OWM's 60/min free tier. Each worker process runs its own refresher, so it gets an equal share
+# (WEB_CONCURRENCY is the worker count, as gunicorn reads it).
+WEATHER_REFRESH_PER_MIN = float(os.getenv('WEATHER_REFRESH_PER_MIN', '20'))
+WEATHER_REFRESH_WORKERS = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+# Cities kept warm from the start: the divisional capitals HEALTH_CONCERNS_BN is aimed at.
+WEATHER_REFRESH_SEED_CITIES = [name.strip() for name in os.getenv(
+    'WEATHER_REFRESH_SEED_CITIES', 'Dhaka,Chittagong,Khulna,Rajshahi,Barisal,Sylhet,Rangpur,Mymensingh').split(',') if name.strip()]
+weather_refresher = HotKeyRefresher(current_conditions_cache, top_n=WEATHER_REFRESH_TOP_N,
+                                    lead_time=WEATHER_REFRESH_LEAD, interval=WEATHER_REFRESH_INTERVAL,
+                                    limiter=TokenBucket(rate=WEATHER_REFRESH_PER_MIN / WEATHER_REFRESH_WORKERS / 60, reserve=(0.0, 0.0, 0.0),
+                                                        max_wait=(0.0, 0.0, 0.0)),
+                                    logger=app.logger)
+
+# 5-day/3-hour forecasts change only when OWM runs a new model cycle.
+FORECAST_CACHE_TTL = int(os.getenv('FORECAST_CACHE_TTL', '1800'))
+FORECAST_CACHE_STALE_TTL = int(os.getenv('FORECAST_CACHE_STALE_TTL', str(6 * 3600)))
+forecast_cache = TTLCache(maxsize=WEATHER_CACHE_MAXSIZE, ttl=FORECAST_CACHE_TTL, stale_ttl=FORECAST_CACHE_STALE_TTL)
+
+# --- HTTP caching ---
+HTTP_COMPRESSION_ENABLED = os.getenv('HTTP_COMPRESSION', 'true').lower() == 'true'
+# How long browsers and the CDN may reuse responses built from current conditions.
+CURRENT_CONDITIONS_MAX_AGE = int(os.getenv('CURRENT_CONDITIONS_MAX_AGE', '60'))
+# Last ETag sent per URL (path and query). Entries never outlive the cached upstream data the
+# response was built from, so a matching If-None-Match can be answered without running the route.
+etag_index = TTLCache(maxsize=int(os.getenv('ETAG_INDEX_MAXSIZE', '4096')), ttl=86400)
+static_assets = StaticAssets(app.static_folder)
+HTTP_CACHE_POLICIES = {
+    '/': CachePolicy(),  # Always revalidated: it references the current static fingerprints.
+    '/api/weather': CachePolicy(max_age=CURRENT_CONDITIONS_MAX_AGE, stale_while_revalidate=300, revalidate_for=WEATHER_CACHE_TTL),
+    '/api/perfect_day_forecast': CachePolicy(max_age=CURRENT_CONDITIONS_MAX_AGE, stale_while_revalidate=300, revalidate_for=FORECAST_CACHE_TTL),
+    '/api/health_weather_advice': CachePolicy(max_age=CURRENT_CONDITIONS_MAX_AGE, stale_while_revalidate=300, revalidate_for=WEATHER_CACHE_TTL),
+    '/api/city_dashboard': CachePolicy(max_age=CURRENT_CONDITIONS_MAX_AGE, stale_while_revalidate=300, revalidate_for=WEATHER_CACHE_TTL),
+    # Observed history of past years does not change.
+    '/api/weather_history_on_this_day': CachePolicy(max_age=IMMUTABLE_MAX_AGE, immutable=True, revalidate_for=86400),
+    '/api/climatology': CachePolicy(max_age=3600, revalidate_for=3600),
+    # Suggestions only change when the bundled dataset does.
+    '/api/cities/autocomplete': CachePolicy(max_age=86400, revalidate_for=86400),
+    '/api/cities/reverse': CachePolicy(max_age=86400, revalidate_for=86400),
+    # Totals change when the resolver runs in another process, so the server never answers 304 on its own.
+    '/api/predictions/leaderboard': CachePolicy(max_age=300, stale_while_revalidate=3600),
+}
+
+def _city_cache_key(city_name):
+    return ('city', ' '.join(city_name.split()).casefold())
+
+def _coord_cache_key(lat, lon):
+    return ('coord', round(float(lat), COORD_CACHE_PRECISION), round(float(lon), COORD_CACHE_PRECISION))
+
+def _is_owm_success(data):
+    return isinstance(data, dict) and str(data.get('cod', '200')) == '200'
+
+def _is_quota_error(error):
+    """True for a refused budget draw or an upstream 429."""
+    if isinstance(error, QuotaExhaustedError):
+        return True
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.exceptions.HTTPError) and response is not None and response.status_code == 429
+
+def _quota_error_body(error, message):
+    """JSON error body for a quota failure, with a `retry_after` hint when one is known."""
+    body = {'error': message}
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is not None:
+        body['retry_after'] = round(retry_after, 1)
+    return body
+
+def _stale_fallback(cache, key, error):
+    """
+    Returns the newest cached payload for `key` marked with `stale: True` when `error` is a quota
+    failure and an expired entry is still retained, otherwise None.
+    """
+    if not _is_quota_error(error):
+        return None
+    data = cache.get_stale(key)
+    if data is None:
+        return None
+    app.logger.warning(f"Upstream quota exhausted; serving stale cached data for {key}: {error}")
+    _mark_response_degraded()
+    return dict(data, stale=True)
+
+def _mark_response_degraded():
+    """Keeps the current response (stale or partial data) out of shared caches and the ETag index."""
+    if has_request_context():
+        g.response_degraded = True
+
+def _note_data_fresh_for(seconds):
+    """Limits how long the current response's ETag is trusted to `seconds`."""
+    if has_request_context():
+        g.data_fresh_for = min(seconds, g.get('data_fresh_for', seconds))
+
+def _note_data_expiry(cache, key):
+    """Limits how long the current response's ETag is trusted to the remaining TTL of `key` in `cache`."""
+    remaining = cache.expires_in(key)
+    if remaining is not None:
+        _note_data_fresh_for(remaining)
+
+def _current_conditions_loader(api_key, city=None, lat=None, lon=None):
+    """
+    Returns (cache_key, loader) for an OWM current-weather lookup by city name or lat/lon.
+    `loader(priority)` draws from the OWM budget at `priority` (BACKGROUND by default).
+    """
+    if city is not None:
+        key = _city_cache_key(city)
+        params = {'q': city, 'appid': api_key, 'units': 'metric'}
+    else:
+        key = _coord_cache_key(lat, lon)
+        params = {'lat': lat, 'lon': lon, 'appid': api_key, 'units': 'metric'}
+
+    def load(priority=BACKGROUND):
+        response = upstream_client.get(OWM_BASE_URL, params=params, timeout=10, priority=priority)
+        response.raise_for_status()
+        data = response.json()
+        coord = data.get('coord') if _is_owm_success(data) else None
+        if city is not None and isinstance(coord, dict) and 'lat' in coord and 'lon' in coord:
+            # Let later coordinate lookups for the same place hit the cache too.
+            current_conditions_cache.set(_coord_cache_key(coord['lat'], coord['lon']), data)
+        return data
+
+    return key, load
+
+def start_weather_refresher(api_key):
+    """Starts the background refresher and pins the seed cities (once per process)."""
+    if not WEATHER_REFRESH_ENABLED or weather_refresher.running:
+        return
+    weather_refresher.start()
+    threading.Thread(target=_pin_seed_cities, args=(api_key,), name='climacast-refresh-seeds', daemon=True).start()
+
+def _pin_seed_cities(api_key):
+    """
+    Pins the seed cities under the cache keys their lookups use: by the gazetteer's coordinates
+    for names it knows (see lookup_city_weather), so this waits for the gazetteer, else by name.
+    """
+    gazetteer = get_gazetteer()
+    for city in WEATHER_REFRESH_SEED_CITIES:
+        place = gazetteer.resolve(city, fuzzy=False) if gazetteer is not None else None
+        if place is not None:
+            loader = _current_conditions_loader(api_key, lat=place['latitude'], lon=place['longitude'])
+        else:
+            loader = _current_conditions_loader(api_key, city=city)
+        weather_refresher.pin(*loader, cacheable=_is_owm_success)
+
+def fetch_current_conditions(api_key, city=None, lat=None, lon=None, priority=INTERACTIVE):
     """
-    Geocodes a city name to latitude and longitude using Nominatim.
+    Returns the OWM current-weather payload for a city name or a lat/lon pair.
+    Successful payloads are served from `current_conditions_cache`, keyed by the normalized
+    city name and by the rounded coordinates, and concurrent misses share one upstream call.
+    Each lookup counts towards the key's popularity for `weather_refresher`.
+    When the OWM budget is exhausted the newest cached payload is returned with `stale: True`.
+    Raises the same `requests` exceptions as a direct call, plus `QuotaExhaustedError`.
+    """
+    key, load = _current_conditions_loader(api_key, city=city, lat=lat, lon=lon)
+    if WEATHER_REFRESH_ENABLED:
+        start_weather_refresher(api_key)
+        weather_refresher.touch(key, load, cacheable=_is_owm_success)
+    try:
+        data = current_conditions_cache.get_or_load(key, lambda: load(priority), cacheable=_is_owm_success)
+        _note_data_expiry(current_conditions_cache, key)
+        return data
+    except requests.exceptions.RequestException as e:
+        stale = _stale_fallback(current_conditions_cache, key, e)
+        if stale is None:
+            raise
+        return stale
+
+def fetch_forecast(api_key, city, priority=SECONDARY):
+    """
+    Returns the OWM 5-day/3-hour forecast payload for a city, cached per normalized city name
+    in `forecast_cache`. When the OWM budget is exhausted the newest cached payload is returned
+    with `stale: True`. Raises the same `requests` exceptions as a direct call, plus `QuotaExhaustedError`.
+    """
+    def load():
+        response = upstream_client.get(OWM_FORECAST_URL, params={'q': city, 'appid': api_key, 'units': 'metric'},
+                                       timeout=10, priority=priority)
+        response.raise_for_status()
+        return response.json()
+    key = _city_cache_key(city)
+    try:
+        data = forecast_cache.get_or_load(key, load, cacheable=_is_owm_success)
+        _note_data_expiry(forecast_cache, key)
+        return data
+    except requests.exceptions.RequestException as e:
+        stale = _stale_fallback(forecast_cache, key, e)
+        if stale is None:
+            raise
+        return stale
+
+def get_gazetteer(wait=True):
+    """
+    Returns the process-wide city gazetteer, building it on first use. With `wait=False` it
+    returns None instead of waiting while the gazetteer is not built yet, and builds it in the
+    background. Also returns None if it is disabled or could not be built (logged; retried later).
+    """
+    global _gazetteer
+    if _gazetteer is not None or not GAZETTEER_ENABLED:
+        return _gazetteer
+    if not wait:
+        start_gazetteer_build()
+        return None
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            started = time.perf_counter()
+            try:
+                _gazetteer = Gazetteer(load_geonames(GAZETTEER_MIN_POPULATION))
+            except Exception as e:
+                app.logger.error(f"Could not build the city gazetteer: {e}", exc_info=True)
+                return None
+            app.logger.info(f"City gazetteer built with {len(_gazetteer)} places in {time.perf_counter() - started:.2f}s.")
+    return _gazetteer
+
+def start_gazetteer_build():
+    """Builds the gazetteer in a background thread, unless it is built or being built already."""
+    global _gazetteer_builder
+    with _gazetteer_builder_lock:
+        if _gazetteer is None and GAZETTEER_ENABLED and (_gazetteer_builder is None or not _gazetteer_builder.is_alive()):
+            _gazetteer_builder = threading.Thread(target=get_gazetteer, name='gazetteer-build', daemon=True)
+            _gazetteer_builder.start()
+
+def resolve_city_locally(city_name, fuzzy=False):
+    """
+    Looks a typed city name up in the gazetteer, tolerating misspellings with `fuzzy`.
+    Returns the matched place dict (see Gazetteer.resolve), or None if there is no match or the
+    gazetteer is still being built (lookups never wait for it). Fuzzy answers are cached in
+    `gazetteer_fuzzy_cache`.
+    """
+    gazetteer = get_gazetteer(wait=False)
+    if gazetteer is None:
+        return None
+    try:
+        if not fuzzy:
+            return gazetteer.resolve(city_name, fuzzy=False)
+        key = normalize(city_name)
+        place = gazetteer_fuzzy_cache.get(key)
+        if place is None:
+            place = gazetteer.resolve(city_name) or False
+            gazetteer_fuzzy_cache.set(key, place)
+        return place or None
+    except Exception as e:
+        app.logger.error(f"Gazetteer lookup failed for '{city_name}': {e}")
+        return None
+
+def geocode_city(city_name, priority=INTERACTIVE):
+    """
+    Geocodes a city name to latitude and longitude: an exact gazetteer name, then a remembered
+    Nominatim answer, then the closest gazetteer misspelling, and otherwise Nominatim.
     Returns (latitude, longitude) or None if not found or an error occurs.
+    Nominatim results, including "not found", are remembered in `geocode_store`; upstream calls
+    draw from `nominatim_budget` at `priority`.
+    """
+    place = resolve_city_locally(city_name)
+    if place is not None:
+        return place['latitude'], place['longitude']
+    hit, coords = _remembered_geocode(city_name)
+    if hit:
+        return coords
+    place = resolve_city_locally(city_name, fuzzy=True)
+    if place is not None:
+        app.logger.info(f"Gazetteer resolved '{city_name}' to '{place['name']}' ({place['country']}).")
+        return place['latitude'], place['longitude']
+
+    coords, cacheable = _geocode_city_upstream(city_name, priority)
+    if cacheable:
+        try:
+            geocode_store.store(city_name, coords)
+        except Exception as e:
+            app.logger.error(f"Geocode store write failed for '{city_name}': {e}")
+    return coords
+
+def _remembered_geocode(city_name):
+    """Returns `geocode_store`'s (hit, coords) for a city name; (False, None) if the store fails."""
+    try:
+        return geocode_store.lookup(city_name)
+    except Exception as e:
+        app.logger.error(f"Geocode store lookup failed for '{city_name}': {e}")
+        return False, None
+
+def _geocode_city_upstream(city_name, priority=INTERACTIVE):
+    """
+    Queries Nominatim for a city. Returns (coords, cacheable) where `cacheable` is False
+    for transient failures (errors, timeouts, rate limiting) that must not be remembered.
     """
     headers = {
         'User-Agent': 'ClimaCast/1.0 FlaskApp (Flask Weather App)' # Nominatim requires a User-Agent
     }
     params = {'q': city_name, 'format': 'json', 'limit': 1}
     try:
-        response = requests.get(NOMINATIM_BASE_URL, params=params, headers=headers, timeout=5) # Added timeout
+        response = upstream_client.get(NOMINATIM_BASE_URL, params=params, headers=headers, timeout=5, priority=priority)
         response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
         data = response.json()
         if data and isinstance(data, list) and len(data) > 0:
@@ -35,31 +497,257 @@ def geocode_city(city_name):
                 try:
                     lat = float(lat_str)
                     lon = float(lon_str)
-                    return lat, lon
+                    return (lat, lon), True
                 except ValueError:
                     app.logger.error(f"Nominatim geocoding for '{city_name}': Invalid lat/lon format {data[0]}.")
-                    return None
+                    return None, False
             else:
                 app.logger.info(f"Nominatim geocoding for '{city_name}': Lat/lon not found in response {data[0]}.")
-                return None
+                return None, True
         else:
-            app.logger.info(f"Nominatim geocoding for '{city_name}': No results found. Data: {data}")
-            return None
+            app.logger.info(f"Nominatim geocoding for '{city_name}': No results found.")
+            return None, True
     except requests.exceptions.HTTPError as http_err:
         app.logger.error(f"Nominatim HTTPError for city '{city_name}': {http_err}")
-        return None
+        return None, False
     except requests.exceptions.Timeout:
         app.logger.error(f"Nominatim timeout for city '{city_name}'.")
-        return None
+        return None, False
+    except QuotaExhaustedError:
+        app.logger.warning(f"Nominatim rate limit reached; skipping geocoding for '{city_name}'.")
+        return None, False
     except requests.exceptions.RequestException as req_err:
         app.logger.error(f"Nominatim RequestException for city '{city_name}': {req_err}")
-        return None
+        return None, False
     except ValueError as json_err: # Catch JSON decoding errors
         app.logger.error(f"Nominatim JSON decoding error for city '{city_name}': {json_err}")
-        return None
+        return None, False
     except Exception as e:
         app.logger.error(f"Unexpected error in geocode_city for '{city_name}': {e}", exc_info=True)
-        return None
+        return None, False
+
+def fetch_open_meteo_daily(lat, lon, start_date, end_date, timeout=10, priority=SECONDARY, wait_for_quota=False):
+    """
+    Fetches daily max/min temperature and precipitation from the Open-Meteo archive
+    for an inclusive date range. Returns a list of (iso_date, max_temp, min_temp, precipitation).
+    Raises `requests` exceptions for upstream failures and ValueError for malformed responses.
+    With `wait_for_quota`, a call refused by the Open-Meteo budget is retried once it refills
+    instead of raising `QuotaExhaustedError`.
+    """
+    params = {
+        'latitude': lat, 'longitude': lon,
+        'start_date': str(start_date), 'end_date': str(end_date),
+        'daily': 'temperature_2m_max,temperature_2m_min,precipitation_sum', 'timezone': 'auto',
+    }
+    while True:
+        try:
+            response = upstream_client.get(OPEN_METEO_HISTORICAL_URL, params=params, timeout=timeout, priority=priority)
+            break
+        except QuotaExhaustedError as e:
+            if not wait_for_quota:
+                raise
+            time.sleep(max(e.retry_after or 0, 1.0))
+    response.raise_for_status()
+    daily_data = response.json().get('daily')
+    if not daily_data: raise ValueError("Open-Meteo: 'daily' data key missing.")
+    days = daily_data.get('time'); max_temps = daily_data.get('temperature_2m_max')
+    min_temps = daily_data.get('temperature_2m_min'); precip_sums = daily_data.get('precipitation_sum')
+    if not (isinstance(days, list) and days and isinstance(max_temps, list) and isinstance(min_temps, list)
+            and isinstance(precip_sums, list) and len(days) == len(max_temps) == len(min_temps) == len(precip_sums)):
+        raise ValueError("Open-Meteo: Expected daily data arrays not found or empty.")
+    return list(zip(days, max_temps, min_temps, precip_sums))
+
+def fetch_daily_history(lat, lon, dates):
+    """
+    Returns {date: {'max_temp', 'min_temp', 'precipitation'}} for the given ISO dates
+    (all in the past) at the grid cell containing (lat, lon).
+    Dates missing from `history_archive` are fetched with a single Open-Meteo archive request
+    spanning them, and every returned day is archived for later lookups.
+    Raises `requests` exceptions for upstream failures and ValueError for malformed responses.
+    """
+    results = history_archive.get_many(lat, lon, dates)
+    missing = sorted(set(dates) - set(results))
+    if not missing:
+        return results
+
+    cell_lat, cell_lon = history_archive.cell_center(lat, lon)
+    # Days the archive has not published yet come back as nulls; only keep real observations.
+    rows = [row for row in fetch_open_meteo_daily(cell_lat, cell_lon, missing[0], missing[-1])
+            if any(v is not None for v in row[1:])]
+    history_archive.put_many(lat, lon, rows)
+    wanted = set(missing)
+    for day, max_temp, min_temp, precipitation in rows:
+        if day in wanted:
+            results[day] = {'max_temp': max_temp, 'min_temp': min_temp, 'precipitation': precipitation}
+    return results
+
+def fetch_history_range(lat, lon, start_date, end_date, wait_for_quota=False, priority=SECONDARY):
+    """
+    Returns (iso_date, max_temp, min_temp, precipitation) rows for an inclusive range of past dates
+    at the grid cell containing (lat, lon). The range comes from `history_archive` when it holds
+    every day, otherwise from one Open-Meteo request at `priority`, whose observed days are then
+    archived. Raises like `fetch_open_meteo_daily`.
+    """
+    rows = history_archive.get_range(lat, lon, start_date.isoformat(), end_date.isoformat())
+    if len(rows) == (end_date - start_date).days + 1:
+        return rows
+    cell_lat, cell_lon = history_archive.cell_center(lat, lon)
+    rows = fetch_open_meteo_daily(cell_lat, cell_lon, start_date, end_date, timeout=60, priority=priority,
+                                  wait_for_quota=wait_for_quota)
+    history_archive.put_many(lat, lon, [row for row in rows if any(v is not None for v in row[1:])])
+    return rows
+
+def backfill_climatology(lat, lon, end_date=None, chunk_years=10, wait_for_quota=False, priority=SECONDARY):
+    """
+    Fills the climatology cell containing (lat, lon) up to `end_date`. Returns the number of days written.
+    With `wait_for_quota`, chunks refused by the Open-Meteo budget are retried once it refills
+    instead of raising `QuotaExhaustedError`.
+    """
+    if end_date is None:
+        end_date = date.today() - timedelta(days=ARCHIVE_LAG_DAYS)
+
+    def fetch_range(la, lo, start, end):
+        return fetch_open_meteo_daily(la, lo, start, end, timeout=60, priority=priority, wait_for_quota=wait_for_quota)
+
+    return climatology_store.backfill(lat, lon, end_date, fetch_range, chunk_days=int(chunk_years * 365.25))
+
+def queue_climatology_backfill(lat, lon):
+    """
+    Backfills the climatology cell containing (lat, lon) on `climatology_backfill_executor` at
+    background priority, unless that cell is already queued.
+    """
+    cell = climatology_store.cell(lat, lon)
+    with _climatology_backfills_lock:
+        if cell in _climatology_backfills:
+            return
+
+        def run():
+            try:
+                written = backfill_climatology(lat, lon, wait_for_quota=True, priority=BACKGROUND)
+                app.logger.info(f"Climatology cell {climatology_store.cell_center(lat, lon)} backfilled with {written} days.")
+            except Exception as e:
+                app.logger.error(f"Background climatology backfill for {lat},{lon} failed: {e}")
+            finally:
+                with _climatology_backfills_lock:
+                    _climatology_backfills.pop(cell, None)
+
+        _climatology_backfills[cell] = climatology_backfill_executor.submit(run)
+
+def resolve_predictions(until_date=None, max_requests=None, wait_for_quota=False):
+    """
+    Scores every pending prediction dated up to `until_date` (default: the newest archived day)
+    against the observed daily maximum. Predictions are grouped by grid cell; each cell's days
+    come from `history_archive`, and the days it lacks from one Open-Meteo request spanning them,
+    so a run costs at most one upstream call per cell. Cells with the most predictions go first,
+    and `max_requests` caps the calls of one run; cells left over stay pending for the next run.
+    Returns counts of the run's groups, requests, scored and still-pending predictions.
+    """
+    if until_date is None:
+        until_date = date.today() - timedelta(days=ARCHIVE_LAG_DAYS)
+    stats = {'groups': 0, 'requests': 0, 'scored': 0, 'pending': 0, 'failed_groups': 0}
+    scores = []
+    for cell_lat, cell_lon, first_date, last_date, count in prediction_store.pending_groups(str(until_date)):
+        stats['groups'] += 1
+        lat, lon = prediction_store.cell_center(cell_lat, cell_lon)
+        observed = {row[0]: row[1] for row in history_archive.get_range(lat, lon, first_date, last_date) if row[1] is not None}
+        pending = prediction_store.pending_in_cell(cell_lat, cell_lon, first_date, last_date)
+        missing = sorted({day for _, day, _ in pending} - set(observed))
+        if missing and max_requests is not None and stats['requests'] >= max_requests:
+            stats['pending'] += count
+            continue
+        if missing:
+            stats['requests'] += 1
+            try:
+                rows = fetch_open_meteo_daily(lat, lon, missing[0], missing[-1], timeout=30, priority=BACKGROUND,
+                                              wait_for_quota=wait_for_quota)
+            except QuotaExhaustedError as e:
+                app.logger.warning(f"Open-Meteo budget exhausted while resolving predictions: {e}")
+                stats['pending'] += count
+                break
+            except (requests.exceptions.RequestException, ValueError) as e:
+                app.logger.error(f"Could not resolve predictions for cell {lat},{lon}: {e}")
+                stats['pending'] += count; stats['failed_groups'] += 1
+                continue
+            rows = [row for row in rows if any(v is not None for v in row[1:])]
+            history_archive.put_many(lat, lon, rows)
+            observed.update((row[0], row[1]) for row in rows if row[1] is not None)
+        for prediction_id, day, predicted in pending:
+            actual = observed.get(day)
+            if actual is None:
+                stats['pending'] += 1 # Not published yet
+                continue
+            scores.append((prediction_id, actual, points_for(predicted, actual)))
+        if len(scores) >= PREDICTION_SCORE_BATCH:
+            stats['scored'] += prediction_store.record_scores(scores); scores = []
+    stats['scored'] += prediction_store.record_scores(scores)
+    return stats
+
+def get_gemini_model():
+    """
+    Returns the process-wide Gemini model, importing and configuring the SDK on first use.
+    Raises RuntimeError if GEMINI_API_KEY is not set; import and configuration errors propagate.
+    """
+    global _gemini_model
+    if _gemini_model is None:
+        with _gemini_lock:
+            if _gemini_model is None:
+                gemini_api_key = os.getenv('GEMINI_API_KEY')
+                if not gemini_api_key:
+                    raise RuntimeError("GEMINI_API_KEY not set.")
+                import google.generativeai as genai
+                genai.configure(api_key=gemini_api_key, transport=GEMINI_TRANSPORT,
+                                client_options={'api_endpoint': GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None)
+                _gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _gemini_model
+
+def _response_text(response):
+    """Concatenated text of a Gemini response or stream chunk ('' if it has none)."""
+    if response.parts:
+        return "".join(part.text for part in response.parts if hasattr(part, 'text'))
+    return getattr(response, 'text', '') or ''
+
+def _log_preview(value, limit=200):
+    """`value` as a string of at most `limit` characters, for logging upstream payloads."""
+    text = str(value)
+    return text if len(text) <= limit else f"{text[:limit]}... ({len(text)} chars)"
+
+def _gemini_quota_refusal():
+    """The 429 response for an AI request refused by `gemini_budget`."""
+    app.logger.warning("Gemini call budget exhausted; refusing AI request.")
+    return jsonify({'error': 'The AI service is busy right now. Please try again shortly.',
+                    'retry_after': round(gemini_budget.wait_time(SECONDARY), 1)}), 429
+
+def _observe_gemini_call(started, error=None):
+    """Records a Gemini call that began at `started` (perf_counter) and ended with `error` or successfully."""
+    code = getattr(error, 'code', None)
+    if error is None: outcome = '2xx'
+    elif code == 429: outcome = '4xx'; upstream_events.inc(('gemini', 'rate_limited'))
+    elif code == 504: outcome = 'timeout'; upstream_events.inc(('gemini', 'timeout'))
+    else: outcome = 'error'
+    observe_upstream_call('gemini', outcome, time.perf_counter() - started)
+
+def _is_gemini_rate_limited(error):
+    """True for a Gemini 429 (ResourceExhausted), which also pauses `gemini_budget`."""
+    if getattr(error, 'code', None) != 429:
+        return False
+    gemini_budget.defer(upstream_client.default_retry_after)
+    return True
+
+_DECIMAL_RE = re.compile(r'-?\d+\.\d+')
+
+def summary_cache_key(prompt):
+    """
+    Cache key for a summary prompt: the prompt's weather fingerprint with whitespace and case
+    normalized and decimal readings rounded to whole numbers.
+    """
+    normalized = ' '.join(prompt.split()).casefold()
+    normalized = _DECIMAL_RE.sub(lambda m: str(round(float(m.group()))), normalized)
+    return ('summary', hashlib.sha1(normalized.encode('utf-8')).hexdigest())
+
+def feels_like_cache_key(temp, feels_like, wind_speed, humidity, description):
+    """Cache key for a feels-like explanation: readings bucketed to 1 °C, 1 m/s and 5 % humidity."""
+    return ('feels_like', round(temp), round(feels_like), round(wind_speed), 5 * round(humidity / 5),
+            ' '.join(str(description).split()).casefold())
 
 # --- Perfect Day Forecaster Data ---
 PERFECT_DAY_ACTIVITIES = {
@@ -83,11 +771,226 @@ HEALTH_CONCERNS_BN = {
 }
 # --- End Health & Wellness Data ---
 
+# Both rule tables compiled once into threshold arrays for batch (many observations) scoring.
+ACTIVITY_RULES = compile_activity_rules(PERFECT_DAY_ACTIVITIES)
+HEALTH_RULES = compile_health_rules(HEALTH_CONCERNS_BN)
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request_timing(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    request_duration.observe(elapsed, (endpoint, request.method, str(response.status_code)))
+    if SERVER_TIMING_ENABLED:
+        totals = {}
+        for upstream, seconds in g.get('upstream_timings', ()):
+            count, total = totals.get(upstream, (0, 0.0))
+            totals[upstream] = (count + 1, total + seconds)
+        entries = [f"app;dur={elapsed * 1000:.1f}"]
+        entries += [f'{upstream};dur={total * 1000:.1f};desc="{count} call(s)"' for upstream, (count, total) in totals.items()]
+        response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+@app.before_request
+def _answer_revalidation_from_index():
+    """Answers a conditional GET with 304 when the URL's last ETag is still trusted, without running the route."""
+    if request.method not in ('GET', 'HEAD') or not request.if_none_match or request.url_rule is None:
+        return None
+    policy = HTTP_CACHE_POLICIES.get(request.url_rule.rule)
+    if policy is None or not policy.revalidate_for:
+        return None
+    etag = etag_index.get(request.full_path)
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    g.revalidated_from_index = True
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = policy.header()
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.after_request
+def _apply_http_caching(response):
+    """Adds ETag and Cache-Control headers to cacheable GETs, answers conditional requests and compresses bodies."""
+    if g.get('revalidated_from_index'):
+        return response
+    if request.endpoint == 'static':
+        return _cache_static_response(response)
+    policy = HTTP_CACHE_POLICIES.get(request.url_rule.rule) if request.url_rule is not None else None
+    if policy is not None and request.method in ('GET', 'HEAD') and response.status_code == 200 and not response.is_streamed:
+        etag = content_etag(response.get_data())
+        response.set_etag(etag, weak=True) # Weak: the same ETag covers the gzip, brotli and identity encodings
+        if g.get('response_degraded'):
+            response.headers['Cache-Control'] = 'no-cache'
+        else:
+            response.headers['Cache-Control'] = policy.header()
+            revalidate_for = min(policy.revalidate_for, g.get('data_fresh_for', policy.revalidate_for))
+            if revalidate_for > 0:
+                etag_index.set(request.full_path, etag, ttl=revalidate_for)
+        response.make_conditional(request)
+    if HTTP_COMPRESSION_ENABLED and response.status_code == 200 and not response.is_streamed and is_compressible(response.mimetype):
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.accept_encodings)
+        data = response.get_data()
+        if encoding and len(data) >= MIN_COMPRESS_SIZE and 'Content-Encoding' not in response.headers:
+            response.set_data(compress(data, encoding))
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+def _cache_static_response(response):
+    """
+    Static files requested with their current fingerprint (`?v=`) are cached as immutable; other
+    requests revalidate. Compressible files are served from pre-compressed copies.
+    """
+    filename = (request.view_args or {}).get('filename', '')
+    fingerprint = static_assets.fingerprint(filename)
+    if fingerprint and request.args.get('v') == fingerprint:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    if not HTTP_COMPRESSION_ENABLED or response.status_code != 200 or not is_compressible(response.mimetype):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(request.accept_encodings)
+    body = static_assets.compressed(filename, encoding) if encoding else None
+    if body is None:
+        return response
+    original = response.response
+    response.direct_passthrough = False
+    response.set_data(body)
+    if hasattr(original, 'close'):
+        original.close()
+    response.headers['Content-Encoding'] = encoding
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.url_defaults
+def _fingerprint_static_urls(endpoint, values):
+    """Adds the file's content hash to url_for('static', ...) URLs as `?v=` so they can be cached as immutable."""
+    if endpoint == 'static' and 'v' not in values:
+        fingerprint = static_assets.fingerprint(values.get('filename', ''))
+        if fingerprint:
+            values['v'] = fingerprint
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+# --- Helper function to process OWM data ---
+def process_owm_response(data, original_city_name):
+    """
+    Shapes an OWM current-weather payload into the /api/weather JSON.
+    Returns (weather_info, None) or (None, (error_dict, status_code)).
+    """
+    if not all(k in data for k in ['weather', 'main', 'wind', 'coord']):
+        app.logger.error(f"Malformed OWM data for city '{original_city_name}': Core keys missing. Keys: {sorted(data)}")
+        return None, ({'error': 'Received incomplete data from weather service.'}, 500)
+    if not data['weather']:
+        app.logger.error(f"Malformed OWM data for city '{original_city_name}': 'weather' array empty.")
+        return None, ({'error': 'Received incomplete weather details from weather service.'}, 500)
+
+    weather_info = {
+        'city': data.get('name', original_city_name), # Use original city name if OWM doesn't provide one
+        'temperature': data['main']['temp'],
+        'feels_like': data['main']['feels_like'], # Added feels_like temperature
+        'description': data['weather'][0]['description'],
+        'weather_main': data['weather'][0]['main'],
+        'weather_id': data['weather'][0]['id'],
+        'humidity': data['main']['humidity'],
+        'pressure': data['main']['pressure'],
+        'wind_speed': data['wind']['speed'],
+        'latitude': data['coord']['lat'],
+        'longitude': data['coord']['lon']
+    }
+    if data.get('stale'):
+        weather_info['stale'] = True # Served from cache because the upstream quota ran out
+    return weather_info, None
+# --- End Helper function ---
+
+def lookup_city_weather(api_key, city, priority=INTERACTIVE):
+    """
+    Looks up current weather for a city name. Names the local gazetteer knows exactly, and names
+    geocoded before (`geocode_store`), are looked up by coordinates straight away. Other names go
+    to OWM by name; when OWM does not know one (404), it is located from the gazetteer's closest
+    misspelling or, failing that, by `geocode_city` (Nominatim) and looked up by coordinates.
+    Returns (json_body, status_code) as served by /api/weather.
+    Upstream calls draw from their budgets at `priority`.
+    """
+    place = resolve_city_locally(city)
+    if place is not None:
+        coords = place['latitude'], place['longitude']
+    else:
+        hit, coords = _remembered_geocode(city)
+        if not hit or coords is None:
+            body, status_code = _lookup_city_weather_by_name(api_key, city, priority)
+            if status_code != 404:
+                return body, status_code
+            app.logger.warning(f"OWM city '{city}' not found (404). Attempting geocoding fallback.")
+            place = resolve_city_locally(city, fuzzy=True)
+            if place is not None:
+                app.logger.info(f"Gazetteer resolved '{city}' to '{place['name']}' ({place['country']}).")
+                coords = place['latitude'], place['longitude']
+            else:
+                coords = geocode_city(city, priority=priority)
+            if not coords:
+                app.logger.warning(f"Geocoding failed for city '{city}'. Returning original 404.")
+                return {'error': f"City '{city}' not found and could not be precisely located. Please check the spelling or try a nearby larger city."}, 404
+    body, status_code = lookup_coordinate_weather(api_key, *coords, priority=priority)
+    if status_code == 200 and place is not None:
+        body['city'] = place['name']
+    return body, status_code
+
+def _lookup_city_weather_by_name(api_key, city, priority=INTERACTIVE):
+    """
+    Looks up current weather by asking OWM for a city name. Returns (json_body, status_code) like
+    lookup_city_weather, with status 404 when OWM does not know the name.
+    """
+    try:
+        app.logger.info(f"Attempting OWM lookup for city: '{city}'")
+        data = fetch_current_conditions(api_key, city=city, priority=priority)
+        if 'cod' in data and str(data['cod']) != '200':
+            owm_status_code = int(data['cod'])
+            error_message = data.get('message', 'An error occurred with the weather service.')
+            if owm_status_code == 404: error_message = f"City '{city}' not found by weather service."
+            elif owm_status_code == 401: error_message = 'Unauthorized. Check your API key.'
+            elif owm_status_code == 429: error_message = 'Rate limit exceeded. Please try again later.'
+            app.logger.warning(f"OpenWeatherMap API error for city '{city}': {error_message} (status: {owm_status_code})")
+            return {'error': error_message}, owm_status_code
+        weather_info, error_tuple = process_owm_response(data, city)
+        if error_tuple:
+            return error_tuple
+        return weather_info, 200
+    except requests.exceptions.HTTPError as http_err:
+        # OWM answers unknown names with an HTTP 404, which the loader raises.
+        status_code = http_err.response.status_code if http_err.response is not None else 500
+        error_message = 'An error occurred while fetching weather data.'
+        if status_code == 401: error_message = 'Unauthorized. Invalid API key.'
+        elif status_code == 404: error_message = f"City '{city}' not found by weather service."
+        elif status_code == 429: error_message = 'Rate limit exceeded with weather service. Please try again later.'
+        app.logger.warning(f"HTTPError from OWM (city name) for city '{city}': {http_err}")
+        return {'error': error_message}, status_code
+    except requests.exceptions.Timeout:
+        app.logger.error(f"Timeout when calling OpenWeatherMap for city '{city}'.")
+        return {'error': 'The request to the weather service timed out. Please try again later.'}, 504
+    except QuotaExhaustedError as e:
+        app.logger.warning(f"Weather service budget exhausted for city '{city}': {e}")
+        return _quota_error_body(e, 'Rate limit exceeded. Please try again later.'), 429
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"RequestException when calling OpenWeatherMap for city '{city}': {e}")
+        return {'error': 'Could not connect to the weather service. Please check your network or try again later.'}, 503
+    except Exception as e:
+        app.logger.error(f"An unexpected error occurred in /api/weather for city '{city}': {e}", exc_info=True)
+        return {'error': 'An unexpected server error occurred. Please try again later.'}, 500
+
 @app.route('/api/weather', methods=['GET'])
 def get_weather():
     api_key = os.getenv('OPENWEATHERMAP_API_KEY')
@@ -97,116 +1000,126 @@ def get_weather():
     city = request.args.get('city')
     if not city:
         return jsonify({'error': 'City parameter is required.'}), 400
+    body, status_code = lookup_city_weather(api_key, city)
+    return jsonify(body), status_code
 
-    # --- Helper function to process OWM data ---
-    def process_owm_response(data, original_city_name):
-        if not all(k in data for k in ['weather', 'main', 'wind', 'coord']):
-            app.logger.error(f"Malformed OWM data for city '{original_city_name}': Core keys missing. Data: {data}")
-            return None, ({'error': 'Received incomplete data from weather service.'}, 500)
-        if not data['weather']:
-            app.logger.error(f"Malformed OWM data for city '{original_city_name}': 'weather' array empty. Data: {data}")
-            return None, ({'error': 'Received incomplete weather details from weather service.'}, 500)
-
-        weather_info = {
-            'city': data.get('name', original_city_name), # Use original city name if OWM doesn't provide one
-            'temperature': data['main']['temp'],
-            'feels_like': data['main']['feels_like'], # Added feels_like temperature
-            'description': data['weather'][0]['description'],
-            'weather_main': data['weather'][0]['main'],
-            'weather_id': data['weather'][0]['id'],
-            'humidity': data['main']['humidity'],
-            'pressure': data['main']['pressure'],
-            'wind_speed': data['wind']['speed'],
-            'latitude': data['coord']['lat'],
-            'longitude': data['coord']['lon']
-        }
-        return weather_info, None
-    # --- End Helper function ---
+AUTOCOMPLETE_MAX_LIMIT = 20
 
-    params_city = {'q': city, 'appid': api_key, 'units': 'metric'}
-    owm_response_data = None
-    owm_status_code = None
+@app.route('/api/cities/autocomplete', methods=['GET'])
+def city_autocomplete():
+    """
+    City suggestions for the text typed so far (`q`), from the local gazetteer: up to `limit`
+    (default 8) places by name prefix, most populous first, or close misspellings when nothing matches.
+    """
+    query = request.args.get('q', '').strip()
+    if not query: return jsonify({"error": "The q parameter is required."}), 400
+    try:
+        limit = int(request.args.get('limit', 8))
+        if not (1 <= limit <= AUTOCOMPLETE_MAX_LIMIT): raise ValueError("Out of range.")
+    except ValueError: return jsonify({"error": f"limit must be between 1 and {AUTOCOMPLETE_MAX_LIMIT}."}), 400
+    gazetteer = get_gazetteer()
+    if gazetteer is None: return jsonify({'error': 'City suggestions are not available right now.'}), 503
+    return jsonify({"query": query, "suggestions": gazetteer.complete(query, limit=limit)}), 200
 
+@app.route('/api/cities/reverse', methods=['GET'])
+def city_reverse():
+    """
+    The gazetteer city nearest to a coordinate, with its canonical coordinates and `distance_km`.
+    `max_distance_km` optionally limits the search; nothing within it is a 404.
+    """
+    latitude_str = request.args.get('latitude')
+    longitude_str = request.args.get('longitude')
+    if not latitude_str or not longitude_str: return jsonify({"error": "Latitude and longitude parameters are required."}), 400
     try:
-        # Initial OWM Call (by city name)
-        app.logger.info(f"Attempting OWM lookup for city: '{city}'")
-        response = requests.get(OWM_BASE_URL, params=params_city, timeout=10) # Added timeout
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        data = response.json()
+        latitude = float(latitude_str); longitude = float(longitude_str)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180): raise ValueError("Lat/lon out of range.")
+    except ValueError: return jsonify({"error": "Invalid latitude or longitude format or value."}), 400
+    try:
+        max_distance_km = float(request.args['max_distance_km']) if request.args.get('max_distance_km') else None
+        if max_distance_km is not None and not max_distance_km > 0: raise ValueError("Not positive.")
+    except ValueError: return jsonify({"error": "max_distance_km must be a positive number."}), 400
+    gazetteer = get_gazetteer()
+    if gazetteer is None: return jsonify({'error': 'Reverse geocoding is not available right now.'}), 503
+    place = gazetteer.nearest(latitude, longitude, max_distance_km=max_distance_km)
+    if place is None: return jsonify({'error': 'No city found near these coordinates.'}), 404
+    return jsonify({"latitude": latitude, "longitude": longitude, "city": place}), 200
 
+def lookup_coordinate_weather(api_key, lat, lon, priority=INTERACTIVE):
+    """Looks up current weather for a coordinate. Returns (json_body, status_code) like lookup_city_weather."""
+    label = f"{lat},{lon}"
+    try:
+        data = fetch_current_conditions(api_key, lat=lat, lon=lon, priority=priority)
         if 'cod' in data and str(data['cod']) != '200':
-            owm_status_code = int(data['cod'])
-            # Specific handling for 404 to trigger geocoding
-            if owm_status_code == 404:
-                app.logger.warning(f"OWM city '{city}' not found (404). Attempting geocoding fallback.")
-                # Fallback to geocoding
-                coords = geocode_city(city)
-                if coords:
-                    lat, lon = coords
-                    app.logger.info(f"Geocoding successful for '{city}': lat={lat}, lon={lon}. Querying OWM by coords.")
-                    params_coords = {'lat': lat, 'lon': lon, 'appid': api_key, 'units': 'metric'}
-                    response_coords = requests.get(OWM_BASE_URL, params=params_coords, timeout=10) # Added timeout
-                    response_coords.raise_for_status()
-                    data_coords = response_coords.json()
-
-                    if 'cod' in data_coords and str(data_coords['cod']) != '200':
-                        owm_status_code_coords = int(data_coords['cod'])
-                        error_message_coords = data_coords.get('message', 'Error from weather service on geocoded location.')
-                        app.logger.warning(f"OWM API error for geocoded '{city}' (lat:{lat},lon:{lon}): {error_message_coords} (status: {owm_status_code_coords})")
-                        return jsonify({'error': f"Weather data not found for the coordinates of '{city}'. Original error: {error_message_coords}"}), owm_status_code_coords
-
-                    owm_response_data = data_coords # Use data from coord-based lookup
-                else:
-                    app.logger.warning(f"Geocoding failed for city '{city}'. Returning original 404.")
-                    return jsonify({'error': f"City '{city}' not found and could not be precisely located. Please check the spelling or try a nearby larger city."}), 404
-            else: # Other OWM errors (401, 429, etc.)
-                error_message = data.get('message', 'An error occurred with the weather service.')
-                if owm_status_code == 401: error_message = 'Unauthorized. Check your API key.'
-                elif owm_status_code == 429: error_message = 'Rate limit exceeded. Please try again later.'
-                app.logger.warning(f"OpenWeatherMap API error for city '{city}': {error_message} (status: {owm_status_code})")
-                return jsonify({'error': error_message}), owm_status_code
-        else: # Successful initial OWM call by city name
-            owm_response_data = data
-
-        # Process the successful OWM response (either from city or coords)
-        if owm_response_data:
-            weather_info, error_tuple = process_owm_response(owm_response_data, city)
-            if error_tuple:
-                return jsonify(error_tuple[0]), error_tuple[1]
-            return jsonify(weather_info), 200
-        else: # Should be caught by specific errors above, but as a fallback
-            app.logger.error(f"Reached unexpected state in /api/weather for city '{city}' where owm_response_data is None.")
-            return jsonify({'error': 'An unexpected issue occurred processing weather data.'}), 500
-
+            error_message = data.get('message', 'An error occurred with the weather service.')
+            app.logger.warning(f"OpenWeatherMap API error for coordinates {label}: {error_message} (status: {data['cod']})")
+            return {'error': error_message}, int(data['cod'])
+        weather_info, error_tuple = process_owm_response(data, label)
+        if error_tuple:
+            return error_tuple
+        return weather_info, 200
     except requests.exceptions.HTTPError as http_err:
-        # This block will catch HTTP errors from OWM (city or coord lookup) if not already handled by cod checks
         status_code = http_err.response.status_code if http_err.response is not None else 500
         error_message = 'An error occurred while fetching weather data.'
-        # Check if this error is for the geocoded attempt
-        if 'params_coords' in locals(): # implies geocoding was attempted
-             error_message = f"Weather data not found for the geocoded location of '{city}'."
-             app.logger.error(f"HTTPError from OWM (geocoded) for city '{city}': {http_err}")
-        else: # Error from initial city lookup
-            if status_code == 401: error_message = 'Unauthorized. Invalid API key.'
-            # 404 for city name should have been handled by 'cod': 404 block, but if it gets here, handle it.
-            elif status_code == 404: error_message = f"City '{city}' not found by weather service (direct HTTPError)."
-            elif status_code == 429: error_message = 'Rate limit exceeded with weather service. Please try again later.'
-            app.logger.error(f"HTTPError from OWM (city name) for city '{city}': {http_err}")
-        return jsonify({'error': error_message}), status_code
+        if status_code == 401: error_message = 'Unauthorized. Invalid API key.'
+        elif status_code == 429: error_message = 'Rate limit exceeded with weather service. Please try again later.'
+        app.logger.error(f"HTTPError from OWM for coordinates {label}: {http_err}")
+        return {'error': error_message}, status_code
     except requests.exceptions.Timeout:
-        # Distinguish timeout source if possible
-        if 'params_coords' in locals() and 'response_coords' not in locals(): # Timeout during geocoded OWM call
-            app.logger.error(f"Timeout when calling OpenWeatherMap for geocoded city '{city}'.")
-            return jsonify({'error': f'The request to the weather service for geocoded location of "{city}" timed out.'}), 504
-        else: # Timeout during initial OWM call or geocoding itself (handled by geocode_city)
-            app.logger.error(f"Timeout when calling OpenWeatherMap for city '{city}'.")
-            return jsonify({'error': 'The request to the weather service timed out. Please try again later.'}), 504
+        app.logger.error(f"Timeout when calling OpenWeatherMap for coordinates {label}.")
+        return {'error': 'The request to the weather service timed out. Please try again later.'}, 504
+    except QuotaExhaustedError as e:
+        app.logger.warning(f"Weather service budget exhausted for coordinates {label}: {e}")
+        return _quota_error_body(e, 'Rate limit exceeded. Please try again later.'), 429
     except requests.exceptions.RequestException as e:
-        app.logger.error(f"RequestException when calling OpenWeatherMap for city '{city}': {e}")
-        return jsonify({'error': 'Could not connect to the weather service. Please check your network or try again later.'}), 503
+        app.logger.error(f"RequestException when calling OpenWeatherMap for coordinates {label}: {e}")
+        return {'error': 'Could not connect to the weather service. Please check your network or try again later.'}, 503
     except Exception as e:
-        app.logger.error(f"An unexpected error occurred in /api/weather for city '{city}': {e}", exc_info=True)
-        return jsonify({'error': 'An unexpected server error occurred. Please try again later.'}), 500
+        app.logger.error(f"An unexpected error occurred looking up coordinates {label}: {e}", exc_info=True)
+        return {'error': 'An unexpected server error occurred. Please try again later.'}, 500
+
+def _lookup_batch_item(api_key, item):
+    """Resolves one /api/weather/batch location (a city name or a {latitude, longitude} object)."""
+    if isinstance(item, str) and item.strip():
+        return lookup_city_weather(api_key, item.strip(), priority=SECONDARY)
+    if isinstance(item, dict):
+        if isinstance(item.get('city'), str) and item['city'].strip():
+            return lookup_city_weather(api_key, item['city'].strip(), priority=SECONDARY)
+        try:
+            lat = float(item['latitude']); lon = float(item['longitude'])
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180): raise ValueError("Lat/lon out of range.")
+        except (KeyError, TypeError, ValueError):
+            return {'error': 'Invalid latitude or longitude format or value.'}, 400
+        return lookup_coordinate_weather(api_key, lat, lon, priority=SECONDARY)
+    return {'error': 'Each location must be a city name or an object with latitude and longitude.'}, 400
+
+@app.route('/api/weather/batch', methods=['POST'])
+def get_weather_batch():
+    """
+    Current weather for many locations in one call. The JSON body is
+    {"locations": ["Dhaka", {"latitude": 22.33, "longitude": 91.83}, ...]}; results come back
+    in the same order, each with its own status and either `data` or `error`.
+    """
+    api_key = os.getenv('OPENWEATHERMAP_API_KEY')
+    if not api_key:
+        app.logger.error("OPENWEATHERMAP_API_KEY not set for weather batch.")
+        return jsonify({'error': 'API key not configured. Please contact administrator.'}), 500
+    request_data = request.get_json(silent=True)
+    locations = request_data.get('locations') if isinstance(request_data, dict) else None
+    if not isinstance(locations, list) or not locations:
+        return jsonify({'error': 'A non-empty "locations" list is required in the JSON body.'}), 400
+    if len(locations) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} locations are allowed per request.'}), 400
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_CONCURRENCY, len(locations))) as executor:
+        outcomes = list(executor.map(lambda item: _lookup_batch_item(api_key, item), locations))
+
+    results = []
+    for item, (body, status_code) in zip(locations, outcomes):
+        entry = {'query': item, 'status': status_code}
+        if status_code == 200: entry['data'] = body
+        else: entry['error'] = body.get('error', 'Unknown error.')
+        results.append(entry)
+    return jsonify({'results': results}), 200
 
 # --- Helper for Perfect Day Forecaster ---
 def analyze_activity_conditions(activity_key, activity_prefs, current_weather):
@@ -237,6 +1150,105 @@ def analyze_activity_conditions(activity_key, activity_prefs, current_weather):
     if max_humidity is not None and humidity > max_humidity: return f"{activity_name}: Humidity ({humidity}%) is too high (max {max_humidity}%)."
     return f"{activity_name}: Current conditions are favorable."
 
+def activity_suggestions(activity_keys, current_weather_data):
+    """Maps each known activity's display name to its suggestion text; unknown keys are ignored."""
+    suggestions = {}
+    for activity_key in activity_keys:
+        if activity_key in PERFECT_DAY_ACTIVITIES:
+            activity_prefs = PERFECT_DAY_ACTIVITIES[activity_key]
+            suggestion_text = analyze_activity_conditions(activity_key, activity_prefs, current_weather_data)
+            suggestions[activity_prefs.get("display_name", activity_key.capitalize())] = suggestion_text
+        else: app.logger.warning(f"Activity key '{activity_key}' not found. Silently ignoring.")
+    return suggestions
+
+FORECAST_STEP_HOURS = 3
+
+def find_best_activity_windows(forecast_steps, activity_keys, window_hours=2, top_n=3):
+    """
+    Scores every forecast step against the requested activities in one batched rule-engine
+    pass and returns {display_name: [window, ...]} with the `top_n` best non-overlapping runs
+    of consecutive steps covering `window_hours`. Fully favorable windows rank first, then
+    windows by their mean score. Each window lists the distinct reasons for its steps.
+    """
+    rule_indices = [ACTIVITY_RULES.index[key] for key in activity_keys]
+    outcome, score = ACTIVITY_RULES.score([step['temperature'] for step in forecast_steps],
+                                          [step['wind_speed_kmh'] for step in forecast_steps],
+                                          [step['humidity'] for step in forecast_steps],
+                                          [step['weather_main'] for step in forecast_steps])
+    outcome = outcome[:, rule_indices]; score = score[:, rule_indices]
+    width = max(1, -(-window_hours // FORECAST_STEP_HOURS))
+    n_windows = len(forecast_steps) - width + 1
+    if n_windows <= 0:
+        return {ACTIVITY_RULES.display_names[r]: [] for r in rule_indices}
+
+    # Sliding-window sums over the step axis for all activities at once.
+    zero_row = np.zeros((1, len(rule_indices)))
+    score_sums = np.concatenate([zero_row, np.cumsum(score, axis=0)])
+    favorable_sums = np.concatenate([zero_row, np.cumsum(outcome == FAVORABLE, axis=0)])
+    window_score = (score_sums[width:] - score_sums[:-width]) / width
+    window_favorable = (favorable_sums[width:] - favorable_sums[:-width]) == width
+    rank_key = window_score + window_favorable  # favorable windows (>= 1) sort above the rest
+
+    windows = {}
+    for column, rule_index in enumerate(rule_indices):
+        chosen = []
+        taken = np.zeros(len(forecast_steps), dtype=bool)
+        for start in np.argsort(-rank_key[:, column], kind='stable'):
+            if len(chosen) >= top_n: break
+            if taken[start:start + width].any(): continue
+            taken[start:start + width] = True
+            steps = forecast_steps[start:start + width]
+            reasons = list(dict.fromkeys(ACTIVITY_RULES.reason(rule_index, outcome[start + i, column], step) for i, step in enumerate(steps)))
+            chosen.append({
+                "start": steps[0]['time'], "end": datetime.fromtimestamp(steps[-1]['dt'] + FORECAST_STEP_HOURS * 3600, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "score": round(float(window_score[start, column]), 3), "favorable": bool(window_favorable[start, column]),
+                "reasons": reasons,
+            })
+        windows[ACTIVITY_RULES.display_names[rule_index]] = chosen
+    return windows
+
+def _perfect_day_windows_response(api_key, city, activity_keys):
+    """Forecast mode of /api/perfect_day_forecast: best upcoming windows per activity."""
+    try:
+        window_hours = int(request.args.get('window_hours', 2)); top_n = int(request.args.get('top', 3))
+        if not (1 <= window_hours <= 24 and 1 <= top_n <= 10): raise ValueError("Out of range.")
+    except ValueError: return jsonify({"error": "window_hours must be 1-24 and top must be 1-10."}), 400
+    known_keys = [key for key in activity_keys if key in ACTIVITY_RULES.index]
+    for key in activity_keys:
+        if key not in ACTIVITY_RULES.index: app.logger.warning(f"Activity key '{key}' not found. Silently ignoring.")
+    if not known_keys: return jsonify({"error": "None of the specified activities were recognized."}), 400
+    try:
+        data = fetch_forecast(api_key, city)
+        if 'cod' in data and str(data['cod']) != '200':
+            status_code = int(data['cod'])
+            app.logger.warning(f"OpenWeatherMap forecast error for city '{city}': {data.get('message')} (status: {status_code})")
+            return jsonify({'error': data.get('message', 'An error occurred with the weather service.')}), status_code
+        forecast_steps = [{
+            'dt': entry['dt'], 'time': entry.get('dt_txt') or datetime.fromtimestamp(entry['dt'], timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            'temperature': entry['main']['temp'], 'wind_speed_kmh': round(entry['wind']['speed'] * 3.6, 1),
+            'humidity': entry['main']['humidity'], 'weather_main': entry['weather'][0]['main'],
+        } for entry in data.get('list', []) if entry.get('weather')]
+    except requests.exceptions.HTTPError as http_err:
+        status_code = http_err.response.status_code if http_err.response is not None else 500
+        error_message = 'Error fetching forecast data.'
+        if status_code == 401: error_message = 'Unauthorized. Invalid API key for weather service.'
+        elif status_code == 404: error_message = f"Forecast for city '{city}' not found by weather service."
+        elif status_code == 429: error_message = 'Rate limit exceeded with weather service. Please try again later.'
+        app.logger.error(f"HTTPError for perfect_day_forecast (forecast mode) city '{city}': {http_err}")
+        return jsonify({'error': error_message}), status_code
+    except requests.exceptions.Timeout: app.logger.error(f"Timeout for perfect_day_forecast (forecast mode) city '{city}'."); return jsonify({'error': 'The request to the weather service timed out. Please try again later.'}), 504
+    except QuotaExhaustedError as e: app.logger.warning(f"Weather service budget exhausted for perfect_day_forecast (forecast mode) city '{city}': {e}"); return jsonify(_quota_error_body(e, 'Rate limit exceeded with weather service. Please try again later.')), 429
+    except requests.exceptions.RequestException as e: app.logger.error(f"RequestException for perfect_day_forecast (forecast mode) city '{city}': {e}"); return jsonify({'error': 'Could not connect to weather service for forecast. Please check your network.'}), 503
+    except (KeyError, IndexError, TypeError) as e: app.logger.error(f"Malformed forecast data for city '{city}': {e}"); return jsonify({'error': 'Received malformed data from weather service.'}), 500
+    result = {
+        "city": data.get('city', {}).get('name', city), "mode": "forecast", "window_hours": window_hours,
+        "timezone_offset_seconds": data.get('city', {}).get('timezone'),
+        "windows": find_best_activity_windows(forecast_steps, known_keys, window_hours=window_hours, top_n=top_n),
+        "note": "Windows are scored on the 5-day/3-hour forecast; times are in UTC."
+    }
+    if data.get('stale'): result['stale'] = True
+    return jsonify(result), 200
+
 @app.route('/api/perfect_day_forecast', methods=['GET'])
 def perfect_day_forecast():
     # ... (implementation as before) ...
@@ -248,13 +1260,13 @@ def perfect_day_forecast():
     activity_keys_raw = [key.strip() for key in activities_str.split(',')]
     activity_keys = [key for key in activity_keys_raw if key]
     if not activity_keys: return jsonify({"error": "No valid activities specified."}), 400
-    params = {'q': city, 'appid': api_key, 'units': 'metric'}
+    if request.args.get('mode') == 'forecast': return _perfect_day_windows_response(api_key, city, activity_keys)
+    # Current-conditions mode: the policy's revalidate_for covers the longer-lived forecast mode.
+    _note_data_fresh_for(WEATHER_CACHE_TTL)
     try:
-        response = requests.get(OWM_BASE_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = fetch_current_conditions(api_key, city=city, priority=SECONDARY)
         if 'weather' not in data or not data['weather'] or 'main' not in data or 'wind' not in data or 'coord' not in data: # Added coord check
-            app.logger.error(f"Malformed weather data for city '{city}' in perfect_day_forecast. Data: {data}")
+            app.logger.error(f"Malformed weather data for city '{city}' in perfect_day_forecast. Keys: {sorted(data)}")
             return jsonify({'error': 'Received malformed data from weather service.'}), 500
         if 'cod' in data and str(data['cod']) != '200':
             error_message = data.get('message', 'An error occurred with the weather service.')
@@ -278,19 +1290,14 @@ def perfect_day_forecast():
         app.logger.error(f"HTTPError for perfect_day_forecast city '{city}': {http_err}")
         return jsonify({'error': error_message}), status_code
     except requests.exceptions.Timeout: app.logger.error(f"Timeout for perfect_day_forecast city '{city}'."); return jsonify({'error': 'The request to the weather service timed out. Please try again later.'}), 504
+    except QuotaExhaustedError as e: app.logger.warning(f"Weather service budget exhausted for perfect_day_forecast city '{city}': {e}"); return jsonify(_quota_error_body(e, 'Rate limit exceeded with weather service. Please try again later.')), 429
     except requests.exceptions.RequestException as e: app.logger.error(f"RequestException for perfect_day_forecast city '{city}': {e}"); return jsonify({'error': 'Could not connect to weather service for forecast. Please check your network.'}), 503
     except Exception as e: app.logger.error(f"Unexpected error in perfect_day_forecast for city '{city}': {e}", exc_info=True); return jsonify({'error': 'An unexpected server error occurred while generating forecast.'}), 500
-    suggestions = {}
-    valid_activities_processed = 0
-    for activity_key in activity_keys:
-        if activity_key in PERFECT_DAY_ACTIVITIES:
-            activity_prefs = PERFECT_DAY_ACTIVITIES[activity_key]
-            suggestion_text = analyze_activity_conditions(activity_key, activity_prefs, current_weather_data)
-            suggestions[activity_prefs.get("display_name", activity_key.capitalize())] = suggestion_text
-            valid_activities_processed +=1
-        else: app.logger.warning(f"Activity key '{activity_key}' not found. Silently ignoring.")
-    if valid_activities_processed == 0 and activity_keys: return jsonify({"error": "None of the specified activities were recognized."}), 400
-    return jsonify({"city": data.get('name', city), "current_weather_summary": f"{current_weather_data['temperature']}°C, {current_weather_data['description']}, Wind: {current_weather_data['wind_speed_kmh']} km/h", "suggestions": suggestions, "note": "Suggestions are based on current weather conditions. Future versions will use a multi-day forecast." }), 200
+    suggestions = activity_suggestions(activity_keys, current_weather_data)
+    if not suggestions and activity_keys: return jsonify({"error": "None of the specified activities were recognized."}), 400
+    result = {"city": data.get('name', city), "current_weather_summary": f"{current_weather_data['temperature']}°C, {current_weather_data['description']}, Wind: {current_weather_data['wind_speed_kmh']} km/h", "suggestions": suggestions, "note": "Suggestions are based on current weather conditions. Future versions will use a multi-day forecast." }
+    if data.get('stale'): result['stale'] = True
+    return jsonify(result), 200
 
 # --- Helper for Health Weather Advice ---
 def check_health_condition_triggers(concern_triggers, current_weather):
@@ -319,6 +1326,17 @@ def check_health_condition_triggers(concern_triggers, current_weather):
                 return True
     return False
 
+def triggered_health_advice(concern_keys, current_weather_data):
+    """Advice texts of the known health concerns whose triggers fire; unknown keys are ignored."""
+    triggered_advice_list = []
+    for concern_key in concern_keys:
+        if concern_key in HEALTH_CONCERNS_BN:
+            concern_def = HEALTH_CONCERNS_BN[concern_key]
+            if check_health_condition_triggers(concern_def["triggers"], current_weather_data):
+                triggered_advice_list.append(concern_def["advice"])
+        else: app.logger.warning(f"Health concern key '{concern_key}' not found. Silently ignoring.")
+    return triggered_advice_list
+
 @app.route('/api/health_weather_advice', methods=['GET'])
 def health_weather_advice():
     # ... (implementation as before) ...
@@ -330,13 +1348,10 @@ def health_weather_advice():
     concern_keys_raw = [key.strip() for key in concerns_str.split(',')]
     concern_keys = [key for key in concern_keys_raw if key]
     if not concern_keys: return jsonify({"error": "No valid health concerns specified."}), 400
-    params = {'q': city, 'appid': api_key, 'units': 'metric'}
     try:
-        response = requests.get(OWM_BASE_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = fetch_current_conditions(api_key, city=city, priority=SECONDARY)
         if 'weather' not in data or not data['weather'] or 'main' not in data or 'wind' not in data or 'coord' not in data: # Added coord check
-            app.logger.error(f"Malformed weather data for city '{city}' in health_weather_advice. Data: {data}")
+            app.logger.error(f"Malformed weather data for city '{city}' in health_weather_advice. Keys: {sorted(data)}")
             return jsonify({'error': 'Received malformed data from weather service.'}), 500
         if 'cod' in data and str(data['cod']) != '200':
             error_message = data.get('message', 'An error occurred with the weather service.')
@@ -360,16 +1375,54 @@ def health_weather_advice():
         app.logger.error(f"HTTPError for health_weather_advice city '{city}': {http_err}")
         return jsonify({'error': error_message}), status_code
     except requests.exceptions.Timeout: return jsonify({'error': 'The request to the weather service timed out. Please try again later.'}), 504
+    except QuotaExhaustedError as e: app.logger.warning(f"Weather service budget exhausted for health_weather_advice city '{city}': {e}"); return jsonify(_quota_error_body(e, 'Rate limit exceeded with weather service. Please try again later.')), 429
     except requests.exceptions.RequestException as e: app.logger.error(f"RequestException for health_weather_advice city '{city}': {e}"); return jsonify({'error': 'Could not connect to weather service for health advice. Please check your network.'}), 503
     except Exception as e: app.logger.error(f"Unexpected error in health_weather_advice for city '{city}': {e}", exc_info=True); return jsonify({'error': 'An unexpected server error occurred while generating health advice.'}), 500
-    triggered_advice_list = []
-    for concern_key in concern_keys:
-        if concern_key in HEALTH_CONCERNS_BN:
-            concern_def = HEALTH_CONCERNS_BN[concern_key]
-            if check_health_condition_triggers(concern_def["triggers"], current_weather_data):
-                triggered_advice_list.append(concern_def["advice"])
-        else: app.logger.warning(f"Health concern key '{concern_key}' not found. Silently ignoring.")
-    return jsonify({"city": data.get('name', city), "triggered_advice": triggered_advice_list, "disclaimer": "This health advice is based on general weather correlations and is not a substitute for professional medical advice."}), 200
+    triggered_advice_list = triggered_health_advice(concern_keys, current_weather_data)
+    result = {"city": data.get('name', city), "triggered_advice": triggered_advice_list, "disclaimer": "This health advice is based on general weather correlations and is not a substitute for professional medical advice."}
+    if data.get('stale'): result['stale'] = True
+    return jsonify(result), 200
+
+NONEXISTENT_DATE_ERROR = "This date does not exist in this year."
+
+def lookup_history_on_this_day(latitude, longitude, today_date_obj):
+    """
+    Daily max/min/precipitation at (latitude, longitude) on this calendar day in each of the
+    three previous years. Returns a list of per-year dicts, each with either values or an `error`.
+    """
+    target_dates = {}
+    for i in range(1, 4):
+        target_hist_year = today_date_obj.year - i
+        try: target_dates[target_hist_year] = today_date_obj.replace(year=target_hist_year).strftime("%Y-%m-%d")
+        except ValueError: target_dates[target_hist_year] = None # Feb 29 in a non-leap year
+    fetch_error = None
+    try:
+        observed = fetch_daily_history(latitude, longitude, [d for d in target_dates.values() if d])
+    except requests.exceptions.Timeout as e: app.logger.error(f"Timeout fetching Open-Meteo history for {latitude},{longitude}"); observed = {}; fetch_error = "Timeout fetching data for this year."
+    except requests.exceptions.HTTPError as e: app.logger.error(f"HTTPError Open-Meteo history for {latitude},{longitude}: {e}"); observed = {}; fetch_error = f"Weather service error (HTTP {e.response.status_code})."
+    except QuotaExhaustedError as e: app.logger.warning(f"Open-Meteo budget exhausted for history at {latitude},{longitude}: {e}"); observed = {}; fetch_error = "Rate limit reached for the history service. Please try again later."
+    except requests.exceptions.RequestException as e: app.logger.error(f"RequestException Open-Meteo history for {latitude},{longitude}: {e}"); observed = {}; fetch_error = "Network error for this year."
+    except (ValueError, KeyError) as e: app.logger.error(f"Data error Open-Meteo history for {latitude},{longitude}: {e}"); observed = {}; fetch_error = "Data format error for this year."
+    except Exception as e: app.logger.error(f"Unexpected error Open-Meteo history for {latitude},{longitude}: {e}", exc_info=True); observed = {}; fetch_error = "Unexpected error for this year."
+    historical_results = []
+    for target_hist_year, historical_date in target_dates.items():
+        if historical_date is None:
+            historical_results.append({"year": target_hist_year, "date": f"{target_hist_year:04d}-{today_date_obj.month:02d}-{today_date_obj.day:02d}", "error": NONEXISTENT_DATE_ERROR})
+        elif historical_date in observed:
+            day = observed[historical_date]
+            historical_results.append({
+                "year": target_hist_year, "date": historical_date,
+                "max_temp": day['max_temp'] if day['max_temp'] is not None else "N/A",
+                "min_temp": day['min_temp'] if day['min_temp'] is not None else "N/A",
+                "precipitation": day['precipitation'] if day['precipitation'] is not None else "N/A"
+            })
+        else:
+            historical_results.append({"year": target_hist_year, "date": historical_date, "error": fetch_error or "Data format error for this year."})
+    return historical_results
+
+def _history_is_complete(history):
+    """True when every year has observed values, or its date does not exist in that year."""
+    return all('error' not in entry or entry['error'] == NONEXISTENT_DATE_ERROR for entry in history)
 
 @app.route('/api/weather_history_on_this_day', methods=['GET'])
 def weather_history_on_this_day():
@@ -384,64 +1437,328 @@ def weather_history_on_this_day():
     except ValueError: return jsonify({"error": "Invalid latitude or longitude format or value."}), 400
     try: today_date_obj = datetime.strptime(current_date_str, "%Y-%m-%d")
     except ValueError: return jsonify({"error": "Invalid current_date format. Please use YYYY-MM-DD."}), 400
-    current_month = today_date_obj.month; current_day = today_date_obj.day; current_year_for_loop = today_date_obj.year
-    historical_results = []
-    for i in range(1, 4):
-        target_hist_year = current_year_for_loop - i
-        historical_date_to_fetch = f"{target_hist_year:04d}-{current_month:02d}-{current_day:02d}"
-        api_url = (f"{OPEN_METEO_HISTORICAL_URL}?latitude={latitude}&longitude={longitude}"
-                   f"&start_date={historical_date_to_fetch}&end_date={historical_date_to_fetch}"
-                   f"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum&timezone=auto")
+    history = lookup_history_on_this_day(latitude, longitude, today_date_obj)
+    if not _history_is_complete(history): _mark_response_degraded()
+    return jsonify({"history": history})
+
+def _player_id_arg(value):
+    """Returns a valid player id, or None."""
+    return value if isinstance(value, str) and PLAYER_ID_RE.match(value) else None
+
+@app.route('/api/predictions', methods=['POST'])
+def submit_prediction():
+    """
+    Submits a Daily Prediction Challenge entry. The JSON body has `player_id` (a random id the
+    browser keeps), optional `player_name`, `city`, `latitude`, `longitude`, `date` (YYYY-MM-DD,
+    tomorrow up to PREDICTION_MAX_LEAD_DAYS ahead, by the server's date) and `predicted_max_temp` (-50 to 60 °C).
+    One prediction per player, location and date; a repeat is a 409.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict): return jsonify({'error': 'A JSON object body is required.'}), 400
+    player_id = _player_id_arg(data.get('player_id'))
+    if player_id is None: return jsonify({'error': 'player_id must be 8-64 letters, digits, "-" or "_".'}), 400
+    player_name = ' '.join(str(data.get('player_name') or '').split())[:PLAYER_NAME_MAX_LENGTH] or f"Player {player_id[:4]}"
+    city = ' '.join(str(data.get('city') or '').split())
+    if not city: return jsonify({'error': 'City is required.'}), 400
+    try:
+        latitude = float(data['latitude']); longitude = float(data['longitude'])
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180): raise ValueError("Lat/lon out of range.")
+    except (KeyError, TypeError, ValueError): return jsonify({"error": "Invalid latitude or longitude format or value."}), 400
+    try: target_date = datetime.strptime(str(data.get('date')), "%Y-%m-%d").date()
+    except ValueError: return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD."}), 400
+    # A day already under way could be predicted from its own observations.
+    if not (date.today() < target_date <= date.today() + timedelta(days=PREDICTION_MAX_LEAD_DAYS)):
+        return jsonify({'error': f'Predictions must be for a day from tomorrow up to {PREDICTION_MAX_LEAD_DAYS} days ahead.'}), 400
+    try:
+        predicted = float(data['predicted_max_temp'])
+        if not (-50 <= predicted <= 60): raise ValueError("Out of range.")
+    except (KeyError, TypeError, ValueError): return jsonify({'error': 'predicted_max_temp must be a number between -50 and 60.'}), 400
+    prediction = prediction_store.add(player_id, player_name, city, latitude, longitude, target_date.isoformat(), predicted)
+    if prediction is None: return jsonify({'error': f'Prediction already made for {city} for {target_date.isoformat()}.'}), 409
+    return jsonify(prediction), 201
+
+@app.route('/api/predictions', methods=['GET'])
+def list_predictions():
+    """A player's latest predictions (`player_id`), with scores once resolved, and their leaderboard standing."""
+    player_id = _player_id_arg(request.args.get('player_id'))
+    if player_id is None: return jsonify({'error': 'A valid player_id parameter is required.'}), 400
+    return jsonify({"predictions": prediction_store.for_player(player_id),
+                    "standing": prediction_store.player_standing(player_id)}), 200
+
+@app.route('/api/predictions/leaderboard', methods=['GET'])
+def prediction_leaderboard():
+    """Top players (`limit`, default 10, at most 100) by points from the resolver's running totals."""
+    try:
+        limit = int(request.args.get('limit', 10))
+        if not (1 <= limit <= 100): raise ValueError("Out of range.")
+    except ValueError: return jsonify({"error": "limit must be between 1 and 100."}), 400
+    return jsonify({"leaderboard": prediction_store.leaderboard(limit)}), 200
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_CSV_HEADER = "date,max_temp,min_temp,precipitation\n"
+EXPORT_EARLIEST_DATE = date(1940, 1, 1) # Start of the Open-Meteo archive
+
+def _date_chunks(start_date, end_date, days):
+    """Yields consecutive inclusive (start, end) date ranges of at most `days` days covering start_date..end_date."""
+    while start_date <= end_date:
+        chunk_end = min(start_date + timedelta(days=days - 1), end_date)
+        yield start_date, chunk_end
+        start_date = chunk_end + timedelta(days=1)
+
+def _export_line(row, export_format):
+    day, max_temp, min_temp, precipitation = row
+    if export_format == 'ndjson':
+        return json.dumps({'date': day, 'max_temp': max_temp, 'min_temp': min_temp, 'precipitation': precipitation}) + "\n"
+    return ','.join([day] + ['' if value is None else str(value) for value in (max_temp, min_temp, precipitation)]) + "\n"
+
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    """
+    Daily max/min temperature and precipitation at `latitude`/`longitude` for every day from
+    `start_date` to `end_date` (inclusive, any length, up to the newest archived day), as CSV
+    (default) or NDJSON (`format`). The range is loaded in EXPORT_CHUNK_DAYS chunks and streamed;
+    the next chunk is fetched on `export_executor` at BACKGROUND priority while the current one is
+    written, so memory stays flat and rows arrive after the first chunk.
+    Values are those of the history grid cell containing the coordinate. A failure after
+    streaming has started ends the body with an error line (`# error: ...` in CSV).
+    """
+    latitude_str = request.args.get('latitude')
+    longitude_str = request.args.get('longitude')
+    if not latitude_str or not longitude_str: return jsonify({"error": "Latitude and longitude parameters are required."}), 400
+    try:
+        latitude = float(latitude_str); longitude = float(longitude_str)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180): raise ValueError("Lat/lon out of range.")
+    except ValueError: return jsonify({"error": "Invalid latitude or longitude format or value."}), 400
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), "%Y-%m-%d").date()
+        end_date = datetime.strptime(request.args.get('end_date', ''), "%Y-%m-%d").date()
+    except ValueError: return jsonify({"error": "start_date and end_date are required in YYYY-MM-DD format."}), 400
+    latest_date = date.today() - timedelta(days=ARCHIVE_LAG_DAYS)
+    if not (EXPORT_EARLIEST_DATE <= start_date <= end_date <= latest_date):
+        return jsonify({"error": f"The date range must run forwards from {EXPORT_EARLIEST_DATE.isoformat()} and end by {latest_date.isoformat()}."}), 400
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS: return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}."}), 400
+
+    chunks = _date_chunks(start_date, end_date, EXPORT_CHUNK_DAYS)
+    label = f"{latitude},{longitude} {start_date.isoformat()}..{end_date.isoformat()}"
+    # The first chunk is loaded before responding, so an unreachable upstream still gets a proper status.
+    try: first_rows = fetch_history_range(latitude, longitude, *next(chunks))
+    except QuotaExhaustedError as e: app.logger.warning(f"Open-Meteo budget exhausted for export {label}: {e}"); return jsonify(_quota_error_body(e, "Rate limit reached for the history service. Please try again later.")), 429
+    except requests.exceptions.Timeout: app.logger.error(f"Timeout fetching Open-Meteo history for export {label}"); return jsonify({"error": "The history service timed out. Please try again later."}), 504
+    except requests.exceptions.RequestException as e: app.logger.error(f"RequestException Open-Meteo history for export {label}: {e}"); return jsonify({"error": "Could not connect to the history service. Please try again later."}), 503
+    except ValueError as e: app.logger.error(f"Data error Open-Meteo history for export {label}: {e}"); return jsonify({"error": "The history service returned malformed data."}), 502
+
+    def generate(rows):
+        if export_format == 'csv':
+            yield EXPORT_CSV_HEADER
+        future = None
         try:
-            response = requests.get(api_url, timeout=10); response.raise_for_status(); data = response.json()
-            daily_data = data.get('daily')
-            if not daily_data: raise ValueError("Open-Meteo: 'daily' data key missing.")
-            max_temps = daily_data.get('temperature_2m_max'); min_temps = daily_data.get('temperature_2m_min')
-            precip_sums = daily_data.get('precipitation_sum'); dates = daily_data.get('time')
-            if not (dates and isinstance(dates, list) and len(dates) > 0 and
-                    max_temps and isinstance(max_temps, list) and len(max_temps) > 0 and
-                    min_temps and isinstance(min_temps, list) and len(min_temps) > 0 and
-                    precip_sums and isinstance(precip_sums, list) and len(precip_sums) > 0):
-                raise ValueError("Open-Meteo: Expected daily data arrays not found or empty.")
-            if dates[0] != historical_date_to_fetch: app.logger.warning(f"Open-Meteo date mismatch for {historical_date_to_fetch}. Got {dates[0]}")
-            historical_results.append({
-                "year": target_hist_year, "date": historical_date_to_fetch,
-                "max_temp": max_temps[0] if max_temps[0] is not None else "N/A",
-                "min_temp": min_temps[0] if min_temps[0] is not None else "N/A",
-                "precipitation": precip_sums[0] if precip_sums[0] is not None else "N/A"
-            })
-        except requests.exceptions.Timeout: app.logger.error(f"Timeout fetching Open-Meteo for {historical_date_to_fetch}"); historical_results.append({"year": target_hist_year, "date": historical_date_to_fetch, "error": "Timeout fetching data for this year."})
-        except requests.exceptions.HTTPError as e: app.logger.error(f"HTTPError Open-Meteo for {historical_date_to_fetch}: {e}"); historical_results.append({"year": target_hist_year, "date": historical_date_to_fetch, "error": f"Weather service error (HTTP {e.response.status_code})."})
-        except requests.exceptions.RequestException as e: app.logger.error(f"RequestException Open-Meteo for {historical_date_to_fetch}: {e}"); historical_results.append({"year": target_hist_year, "date": historical_date_to_fetch, "error": "Network error for this year."})
-        except (ValueError, KeyError) as e: app.logger.error(f"Data error Open-Meteo for {historical_date_to_fetch}: {e}. Data: {data if 'data' in locals() else 'N/A'}"); historical_results.append({"year": target_hist_year, "date": historical_date_to_fetch, "error": "Data format error for this year."})
-        except Exception as e: app.logger.error(f"Unexpected error Open-Meteo for {historical_date_to_fetch}: {e}", exc_info=True); historical_results.append({"year": target_hist_year, "date": historical_date_to_fetch, "error": "Unexpected error for this year."})
-    return jsonify({"history": historical_results})
+            for chunk in chunks:
+                future = export_executor.submit(fetch_history_range, latitude, longitude, *chunk, wait_for_quota=True, priority=BACKGROUND)
+                yield ''.join(_export_line(row, export_format) for row in rows)
+                try: rows = future.result()
+                except Exception as e:
+                    app.logger.error(f"History export {label} failed at {chunk[0].isoformat()}: {e}")
+                    message = f"Could not load the days from {chunk[0].isoformat()} on."
+                    yield json.dumps({'error': message}) + "\n" if export_format == 'ndjson' else f"# error: {message}\n"
+                    return
+            yield ''.join(_export_line(row, export_format) for row in rows)
+        finally:
+            if future is not None: future.cancel() # The client went away mid-stream
 
-@app.route('/api/generate-summary', methods=['POST'])
-def generate_summary():
-    gemini_api_key = os.getenv('GEMINI_API_KEY')
-    if not gemini_api_key:
-        app.logger.error("GEMINI_API_KEY not set.")
-        return jsonify({'error': 'Gemini API key not configured. Please contact administrator.'}), 500
+    filename = f"climacast-history-{latitude}-{longitude}-{start_date.isoformat()}-{end_date.isoformat()}.{export_format}"
+    return Response(generate(first_rows), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no'})
+
+DASHBOARD_SECTIONS = ('weather', 'activities', 'health', 'history')
+
+@app.route('/api/city_dashboard', methods=['GET'])
+def city_dashboard():
+    """
+    Everything the page shows for one search in a single round trip. Takes `city` or
+    `latitude`/`longitude`, and optionally `sections` (any of weather, activities, health,
+    history; all by default), `activities`, `concerns` and `current_date`. The location is
+    resolved and its conditions fetched once; the history lookup runs in parallel as soon
+    as coordinates are known.
+    """
+    api_key = os.getenv('OPENWEATHERMAP_API_KEY')
+    if not api_key:
+        app.logger.error("OPENWEATHERMAP_API_KEY not set for city_dashboard.")
+        return jsonify({'error': 'API key not configured. Please contact administrator.'}), 500
+    city = request.args.get('city')
+    latitude_str = request.args.get('latitude'); longitude_str = request.args.get('longitude')
+    coords = None
+    if latitude_str or longitude_str:
+        try:
+            coords = (float(latitude_str), float(longitude_str))
+            if not (-90 <= coords[0] <= 90 and -180 <= coords[1] <= 180): raise ValueError("Lat/lon out of range.")
+        except (TypeError, ValueError): return jsonify({"error": "Invalid latitude or longitude format or value."}), 400
+    elif not city:
+        return jsonify({"error": "City or latitude and longitude parameters are required."}), 400
+
+    sections_str = request.args.get('sections')
+    sections = [key.strip() for key in sections_str.split(',') if key.strip()] if sections_str else list(DASHBOARD_SECTIONS)
+    unknown_sections = [key for key in sections if key not in DASHBOARD_SECTIONS]
+    if unknown_sections or not sections:
+        return jsonify({"error": f"Unknown sections: {', '.join(unknown_sections)}. Valid sections: {', '.join(DASHBOARD_SECTIONS)}."}), 400
+    activities_str = request.args.get('activities'); concerns_str = request.args.get('concerns')
+    activity_keys = [key.strip() for key in activities_str.split(',') if key.strip()] if activities_str else list(PERFECT_DAY_ACTIVITIES)
+    concern_keys = [key.strip() for key in concerns_str.split(',') if key.strip()] if concerns_str else list(HEALTH_CONCERNS_BN)
+    try: today_date_obj = datetime.strptime(request.args['current_date'], "%Y-%m-%d") if request.args.get('current_date') else datetime.now()
+    except ValueError: return jsonify({"error": "Invalid current_date format. Please use YYYY-MM-DD."}), 400
+
+    history_future = None
+    if 'history' in sections and coords:
+        history_future = io_executor.submit(lookup_history_on_this_day, coords[0], coords[1], today_date_obj)
+
+    if coords: weather_info, status_code = lookup_coordinate_weather(api_key, *coords)
+    else: weather_info, status_code = lookup_city_weather(api_key, city)
+    if status_code != 200:
+        if history_future: history_future.cancel()
+        return jsonify(weather_info), status_code
+
+    if 'history' in sections and history_future is None:
+        history_future = io_executor.submit(lookup_history_on_this_day, weather_info['latitude'], weather_info['longitude'], today_date_obj)
 
+    current_weather_data = {
+        'temperature': weather_info['temperature'], 'feels_like': weather_info['feels_like'],
+        'wind_speed_ms': weather_info['wind_speed'], 'wind_speed_kmh': round(weather_info['wind_speed'] * 3.6, 1),
+        'humidity': weather_info['humidity'], 'weather_main': weather_info['weather_main'], 'description': weather_info['description']
+    }
+    result = {"location": {"city": weather_info['city'], "latitude": weather_info['latitude'], "longitude": weather_info['longitude']}}
+    if 'weather' in sections:
+        result['weather'] = weather_info
+    if 'activities' in sections:
+        result['activities'] = {
+            "current_weather_summary": f"{current_weather_data['temperature']}°C, {current_weather_data['description']}, Wind: {current_weather_data['wind_speed_kmh']} km/h",
+            "suggestions": activity_suggestions(activity_keys, current_weather_data),
+        }
+    if 'health' in sections:
+        result['health'] = {
+            "triggered_advice": triggered_health_advice(concern_keys, current_weather_data),
+            "disclaimer": "This health advice is based on general weather correlations and is not a substitute for professional medical advice.",
+        }
+    if history_future is not None:
+        try: result['history'] = {"history": history_future.result()}
+        except Exception as e: app.logger.error(f"History lookup failed in city_dashboard: {e}", exc_info=True); result['history'] = {"error": "Could not load weather history."}
+        if 'error' in result['history'] or not _history_is_complete(result['history']['history']): _mark_response_degraded()
+    return jsonify(result), 200
+
+@app.route('/api/climatology', methods=['GET'])
+def climatology():
+    """
+    How unusual is a day: percentile and anomaly of a temperature and/or precipitation
+    against the same +/- window_days around the date in each of the previous `years` years.
+    """
+    latitude_str = request.args.get('latitude')
+    longitude_str = request.args.get('longitude')
+    if not latitude_str or not longitude_str: return jsonify({"error": "Latitude and longitude parameters are required."}), 400
     try:
-        genai.configure(api_key=gemini_api_key)
-    except Exception as e:
-        app.logger.error(f"Failed to configure Gemini API: {e}", exc_info=True)
-        return jsonify({'error': 'Failed to configure AI summarization service.'}), 500
+        latitude = float(latitude_str); longitude = float(longitude_str)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180): raise ValueError("Lat/lon out of range.")
+    except ValueError: return jsonify({"error": "Invalid latitude or longitude format or value."}), 400
+    try: target_date = datetime.strptime(request.args['date'], "%Y-%m-%d").date() if request.args.get('date') else date.today()
+    except ValueError: return jsonify({"error": "Invalid date format. Please use YYYY-MM-DD."}), 400
+    try:
+        years = int(request.args.get('years', 30)); window_days = int(request.args.get('window_days', 7))
+        temperature = float(request.args['temperature']) if request.args.get('temperature') else None
+        precipitation = float(request.args['precipitation']) if request.args.get('precipitation') else None
+    except ValueError: return jsonify({"error": "years and window_days must be integers; temperature and precipitation must be numbers."}), 400
+    if not (1 <= years <= target_date.year - CLIMATOLOGY_START_YEAR) or not (0 <= window_days <= 30):
+        return jsonify({"error": f"years must be between 1 and {target_date.year - CLIMATOLOGY_START_YEAR}, window_days between 0 and 30."}), 400
+
+    series = climatology_store.load(latitude, longitude)
+    if series is None:
+        if not CLIMATOLOGY_AUTO_BACKFILL:
+            return jsonify({"error": "No climatology data for this location yet."}), 404
+        queue_climatology_backfill(latitude, longitude)
+        return jsonify({"status": "backfilling", "message": "Climatology for this location is being prepared. Please try again in a few minutes."}), 202, {'Retry-After': '120'}
+
+    if not request.args.get('date'):
+        # "Today" rolls over at midnight, and the URL stays the same.
+        _note_data_fresh_for((datetime.combine(target_date + timedelta(days=1), datetime.min.time()) - datetime.now()).total_seconds())
+    sample = climatology_store.sample(series, target_date, years=years, window_days=window_days)
+    result = {
+        "latitude": latitude, "longitude": longitude, "grid_cell": list(climatology_store.cell_center(latitude, longitude)),
+        "date": target_date.isoformat(), "years": years, "window_days": window_days,
+        "climatology": {"max_temp": summarize(sample[:, MAX_TEMP]), "min_temp": summarize(sample[:, MIN_TEMP]),
+                        "precipitation": summarize(sample[:, PRECIPITATION])},
+    }
+    if temperature is not None:
+        max_stats = result["climatology"]["max_temp"]
+        result["temperature"] = {
+            "value": temperature,
+            "percentile_vs_max": percentile_of(sample[:, MAX_TEMP], temperature),
+            "percentile_vs_min": percentile_of(sample[:, MIN_TEMP], temperature),
+            "anomaly_vs_mean_max": round(temperature - max_stats["mean"], 2) if max_stats else None,
+        }
+    if precipitation is not None:
+        precip_stats = result["climatology"]["precipitation"]
+        result["precipitation"] = {
+            "value": precipitation,
+            "percentile": percentile_of(sample[:, PRECIPITATION], precipitation),
+            "anomaly_vs_mean": round(precipitation - precip_stats["mean"], 2) if precip_stats else None,
+        }
+    return jsonify(result), 200
+
+@app.cli.command('climatology-backfill')
+@click.argument('locations', nargs=-1, required=True)
+@click.option('--end-date', default=None, help='Last day to fill (YYYY-MM-DD). Defaults to the newest archived day.')
+@click.option('--chunk-years', default=10, show_default=True, help='Years requested from Open-Meteo per call.')
+def climatology_backfill_command(locations, end_date, chunk_years):
+    """Fill the climatology store for LOCATIONS given as "lat,lon" pairs."""
+    end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    for location in locations:
+        try:
+            lat, lon = (float(part) for part in location.split(','))
+        except ValueError:
+            raise click.BadParameter(f"Expected 'lat,lon', got '{location}'.")
+        written = backfill_climatology(lat, lon, end_date=end, chunk_years=chunk_years, wait_for_quota=True)
+        click.echo(f"{location}: cell {climatology_store.cell_center(lat, lon)} filled with {written} days.")
+
+@app.cli.command('predictions-resolve')
+@click.option('--until', default=None, help='Last prediction date to score (YYYY-MM-DD). Defaults to the newest archived day.')
+@click.option('--max-requests', type=int, default=None, help='Most Open-Meteo requests to make in this run.')
+def predictions_resolve_command(until, max_requests):
+    """Score pending Daily Prediction Challenge entries against observed temperatures."""
+    until_date = datetime.strptime(until, "%Y-%m-%d").date() if until else None
+    started = time.perf_counter()
+    stats = resolve_predictions(until_date=until_date, max_requests=max_requests, wait_for_quota=True)
+    click.echo(f"Scored {stats['scored']} predictions in {stats['groups']} cells with {stats['requests']} Open-Meteo requests"
+               f" in {time.perf_counter() - started:.1f} s; {stats['pending']} still pending, {stats['failed_groups']} cells failed.")
 
+@app.route('/api/generate-summary', methods=['POST'])
+def generate_summary():
     request_data = request.get_json()
     if not request_data or 'prompt' not in request_data:
         return jsonify({'error': 'Prompt is required in the JSON body.'}), 400
 
     prompt = request_data['prompt']
-    if not prompt.strip():
+    if not isinstance(prompt, str) or not prompt.strip():
         return jsonify({'error': 'Prompt cannot be empty.'}), 400
 
+    cache_key = summary_cache_key(prompt)
+    cached_summary = ai_response_cache.get(cache_key)
+    if cached_summary is not None:
+        return jsonify({'summary': cached_summary}), 200
+
+    # Cached answers need neither the key nor the SDK; build the model only on a miss.
+    if not os.getenv('GEMINI_API_KEY'):
+        app.logger.error("GEMINI_API_KEY not set.")
+        return jsonify({'error': 'Gemini API key not configured. Please contact administrator.'}), 500
+    try:
+        model = get_gemini_model()
+    except Exception as e:
+        app.logger.error(f"Failed to configure Gemini API: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to configure AI summarization service.'}), 500
+    if not gemini_budget.acquire(SECONDARY):
+        return _gemini_quota_refusal()
+
+    started = time.perf_counter()
     try:
-        model = genai.GenerativeModel('gemini-pro')
         # Using the synchronous version as Flask typically runs in a synchronous manner
         response = model.generate_content(prompt)
+        _observe_gemini_call(started)
 
         # Check if the response has parts and text, handle potential issues
         if response.parts:
@@ -449,7 +1766,7 @@ def generate_summary():
         elif hasattr(response, 'text'): # Fallback for simpler response structure
              summary_text = response.text
         else: # If no text found, it might be a blocked prompt or other issue
-            app.logger.warning(f"Gemini response for prompt '{prompt[:50]}...' did not contain text. Response: {response}")
+            app.logger.warning(f"Gemini response for prompt '{prompt[:50]}...' did not contain text. Response: {_log_preview(response)}")
             # Check for prompt feedback which might indicate safety blocking
             if response.prompt_feedbacks:
                 for feedback in response.prompt_feedbacks:
@@ -458,15 +1775,20 @@ def generate_summary():
             return jsonify({'error': 'Failed to generate summary, empty response from AI service.'}), 500
 
         if not summary_text.strip():
-             app.logger.warning(f"Gemini generated an empty summary for prompt '{prompt[:50]}...'. Response: {response}")
+             app.logger.warning(f"Gemini generated an empty summary for prompt '{prompt[:50]}...'. Response: {_log_preview(response)}")
              return jsonify({'error': 'AI service generated an empty summary.'}), 500
 
+        ai_response_cache.set(cache_key, summary_text)
         return jsonify({'summary': summary_text}), 200
 
     except AttributeError as ae: # Catch issues like 'text' not being available if API changes or error in response structure
-        app.logger.error(f"Gemini API response attribute error: {ae}. Response: {response if 'response' in locals() else 'N/A'}", exc_info=True)
+        app.logger.error(f"Gemini API response attribute error: {ae}. Response: {_log_preview(response) if 'response' in locals() else 'N/A'}", exc_info=True)
         return jsonify({'error': 'Failed to parse AI summary response.'}), 500
     except Exception as e:
+        if 'response' not in locals(): _observe_gemini_call(started, e)
+        if _is_gemini_rate_limited(e):
+            app.logger.warning(f"Gemini rate limit hit: {e}")
+            return jsonify({'error': 'The AI service is busy right now. Please try again shortly.'}), 429
         # More specific error logging for common Gemini API issues if possible
         # For example, if there's a specific exception for API authentication or quota
         app.logger.error(f"Gemini API call failed: {e}", exc_info=True)
@@ -474,23 +1796,74 @@ def generate_summary():
         # For now, a generic message:
         return jsonify({'error': 'Failed to generate AI summary due to an internal error.'}), 500
 
-@app.route('/api/explain-feels-like', methods=['POST'])
-def explain_feels_like():
-    gemini_api_key = os.getenv('GEMINI_API_KEY')
-    if not gemini_api_key:
-        app.logger.error("GEMINI_API_KEY not set for feels like explanation.")
-        return jsonify({'error': 'Gemini API key not configured. Please contact administrator.'}), 500
+@app.route('/api/generate-summary/stream', methods=['POST'])
+def generate_summary_stream():
+    """
+    Streams the AI weather summary as Server-Sent Events while Gemini generates it.
+    Emits `data: {"text": ...}` events for each chunk, then `event: done` with the full
+    summary, or `event: error` if generation fails after the stream has started.
+    """
+    request_data = request.get_json(silent=True)
+    if not request_data or 'prompt' not in request_data:
+        return jsonify({'error': 'Prompt is required in the JSON body.'}), 400
+    prompt = request_data['prompt']
+    if not isinstance(prompt, str) or not prompt.strip():
+        return jsonify({'error': 'Prompt cannot be empty.'}), 400
 
-    try:
-        # This assumes genai is already imported and can be configured.
-        # If running in a multi-threaded server, consider if genai.configure is thread-safe
-        # or if the client should be initialized per request or managed differently.
-        # For typical Flask development server, this should be fine.
-        genai.configure(api_key=gemini_api_key)
-    except Exception as e:
-        app.logger.error(f"Failed to configure Gemini API for feels like: {e}", exc_info=True)
-        return jsonify({'error': 'Failed to configure AI explanation service.'}), 500
+    cache_key = summary_cache_key(prompt)
+    cached_summary = ai_response_cache.get(cache_key)
+    model = None
+    if cached_summary is None:
+        if not os.getenv('GEMINI_API_KEY'):
+            app.logger.error("GEMINI_API_KEY not set.")
+            return jsonify({'error': 'Gemini API key not configured. Please contact administrator.'}), 500
+        try:
+            model = get_gemini_model()
+        except Exception as e:
+            app.logger.error(f"Failed to configure Gemini API: {e}", exc_info=True)
+            return jsonify({'error': 'Failed to configure AI summarization service.'}), 500
+        if not gemini_budget.acquire(SECONDARY):
+            return _gemini_quota_refusal()
+
+    def sse(payload, event=None):
+        return (f"event: {event}\n" if event else "") + f"data: {json.dumps(payload)}\n\n"
+
+    def generate():
+        if cached_summary is not None:
+            yield sse({'text': cached_summary})
+            yield sse({'summary': cached_summary}, event='done')
+            return
+        pieces = []
+        started = time.perf_counter()
+        try:
+            for chunk in model.generate_content(prompt, stream=True):
+                text = _response_text(chunk)
+                if text:
+                    pieces.append(text)
+                    yield sse({'text': text})
+            _observe_gemini_call(started)
+        except Exception as e:
+            _observe_gemini_call(started, e)
+            if _is_gemini_rate_limited(e):
+                app.logger.warning(f"Gemini rate limit hit while streaming: {e}")
+                yield sse({'error': 'The AI service is busy right now. Please try again shortly.'}, event='error')
+                return
+            app.logger.error(f"Gemini streaming call failed: {e}", exc_info=True)
+            yield sse({'error': 'Failed to generate AI summary due to an internal error.'}, event='error')
+            return
+        summary_text = "".join(pieces)
+        if not summary_text.strip():
+            app.logger.warning(f"Gemini streamed an empty summary for prompt '{prompt[:50]}...'.")
+            yield sse({'error': 'AI service generated an empty summary.'}, event='error')
+            return
+        ai_response_cache.set(cache_key, summary_text)
+        yield sse({'summary': summary_text}, event='done')
 
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/explain-feels-like', methods=['POST'])
+def explain_feels_like():
     request_data = request.get_json()
     if not request_data:
         return jsonify({'error': 'No data provided.'}), 400
@@ -510,6 +1883,22 @@ def explain_feels_like():
     except ValueError:
         return jsonify({'error': 'Invalid data type for weather parameters. Temperature, feels_like, wind_speed should be numbers, and humidity an integer.'}), 400
 
+    cache_key = feels_like_cache_key(temp, feels_like, wind_speed, humidity, description)
+    cached_explanation = ai_response_cache.get(cache_key)
+    if cached_explanation is not None:
+        return jsonify({'explanation': cached_explanation}), 200
+
+    if not os.getenv('GEMINI_API_KEY'):
+        app.logger.error("GEMINI_API_KEY not set for feels like explanation.")
+        return jsonify({'error': 'Gemini API key not configured. Please contact administrator.'}), 500
+    try:
+        model = get_gemini_model()
+    except Exception as e:
+        app.logger.error(f"Failed to configure Gemini API for feels like: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to configure AI explanation service.'}), 500
+    if not gemini_budget.acquire(SECONDARY):
+        return _gemini_quota_refusal()
+
     # Construct the prompt
     # Added description to give more context for the explanation
     prompt = (
@@ -523,9 +1912,10 @@ def explain_feels_like():
         f"Avoid conversational filler like 'Okay, here's the explanation:'."
     )
 
+    started = time.perf_counter()
     try:
-        model = genai.GenerativeModel('gemini-pro')
         response = model.generate_content(prompt)
+        _observe_gemini_call(started)
 
         explanation_text = ""
         if response.parts:
@@ -533,7 +1923,7 @@ def explain_feels_like():
         elif hasattr(response, 'text'):
             explanation_text = response.text
         else:
-            app.logger.warning(f"Gemini response for 'feels like' prompt did not contain text. Response: {response}")
+            app.logger.warning(f"Gemini response for 'feels like' prompt did not contain text. Response: {_log_preview(response)}")
             if response.prompt_feedbacks:
                 for feedback in response.prompt_feedbacks:
                     app.logger.warning(f"Gemini prompt feedback (feels like): {feedback}")
@@ -541,18 +1931,64 @@ def explain_feels_like():
             return jsonify({'error': 'Failed to generate explanation, empty response from AI service.'}), 500
 
         if not explanation_text.strip():
-            app.logger.warning(f"Gemini generated an empty explanation for 'feels like' prompt. Response: {response}")
+            app.logger.warning(f"Gemini generated an empty explanation for 'feels like' prompt. Response: {_log_preview(response)}")
             return jsonify({'error': 'AI service generated an empty explanation.'}), 500
 
+        ai_response_cache.set(cache_key, explanation_text)
         return jsonify({'explanation': explanation_text}), 200
 
     except AttributeError as ae:
-        app.logger.error(f"Gemini API response attribute error (feels like): {ae}. Response: {response if 'response' in locals() else 'N/A'}", exc_info=True)
+        app.logger.error(f"Gemini API response attribute error (feels like): {ae}. Response: {_log_preview(response) if 'response' in locals() else 'N/A'}", exc_info=True)
         return jsonify({'error': 'Failed to parse AI explanation response.'}), 500
     except Exception as e:
+        if 'response' not in locals(): _observe_gemini_call(started, e)
+        if _is_gemini_rate_limited(e):
+            app.logger.warning(f"Gemini rate limit hit (feels like): {e}")
+            return jsonify({'error': 'The AI service is busy right now. Please try again shortly.'}), 429
         app.logger.error(f"Gemini API call failed (feels like): {e}", exc_info=True)
         return jsonify({'error': 'Failed to generate AI explanation due to an internal error.'}), 500
 
+# --- Metrics ---
+METRICS_CACHES = {'current_conditions': current_conditions_cache, 'forecast': forecast_cache, 'ai_response': ai_response_cache,
+                  'etag_index': etag_index}
+
+def _cache_request_samples():
+    samples = []
+    for name, cache in METRICS_CACHES.items():
+        stats = cache.stats()
+        samples += [((name, 'hit'), stats['hits']), ((name, 'miss'), stats['misses']), ((name, 'stale'), stats['stale_hits'])]
+    return samples
+
+def _breaker_state_samples():
+    states = {}
+    for host, state in upstream_client.breaker_states().items():
+        states[UPSTREAM_NAMES.get(host, host)] = state
+    return [((upstream, state), int(current == state)) for upstream, current in states.items()
+            for state in ('closed', 'open', 'half_open')]
+
+def _budget_refusal_samples():
+    return [((upstream, priority), refused) for upstream, bucket in UPSTREAM_BUDGETS.items()
+            for priority, refused in bucket.stats()['refused'].items()]
+
+metrics_registry.gauge_callback('climacast_cache_requests_total', 'In-process cache lookups by result.',
+                                ('cache', 'result'), _cache_request_samples, kind='counter')
+metrics_registry.gauge_callback('climacast_cache_entries', 'Entries held by each in-process cache.', ('cache',),
+                                lambda: [((name,), len(cache)) for name, cache in METRICS_CACHES.items()])
+metrics_registry.gauge_callback('climacast_circuit_breaker_state', 'Upstream circuit breaker state (1 for the current state).',
+                                ('upstream', 'state'), _breaker_state_samples)
+metrics_registry.gauge_callback('climacast_upstream_budget_tokens', 'Tokens left in each upstream call budget.', ('upstream',),
+                                lambda: [((name,), bucket.stats()['tokens']) for name, bucket in UPSTREAM_BUDGETS.items()])
+metrics_registry.gauge_callback('climacast_upstream_budget_refused_total', 'Upstream calls refused by the call budget.',
+                                ('upstream', 'priority'), _budget_refusal_samples, kind='counter')
+metrics_registry.gauge_callback('climacast_weather_refresher_total', 'Background refresh outcomes for hot weather entries.',
+                                ('result',), lambda: [((key,), weather_refresher.stats()[key]) for key in ('refreshed', 'failed', 'throttled')],
+                                kind='counter')
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, upstream, cache, breaker and budget metrics in the Prometheus text format."""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     # Ensure debug is False in production if GEMINI_API_KEY is sensitive
     app.run(debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true')
@@ -0,0 +1 @@
+"""Offline benchmarks: stub upstreams (stubs), a concurrent load driver (loadtest) and micro-benchmarks (micro)."""
@@ -0,0 +1,69 @@
+"""
+Import-time profile of the app: runs `python -X importtime -c "import app"` in a fresh
+interpreter and reports the total and the slowest modules by cumulative import time.
+
+    python -m bench.importtime                    # top 20 modules
+    python -m bench.importtime --top 40 --module google.generativeai
+    python -m bench.importtime --json importtime.json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def profile(module='app'):
+    """Returns [(module, self_us, cumulative_us, depth)] in import order for a fresh `import module`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True, env=dict(os.environ, PYTHONWARNINGS='ignore'))
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), (len(match.group(3)) - 1) // 2))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=20, help='Number of modules to list.')
+    parser.add_argument('--target', default='app', help='Module to import.')
+    parser.add_argument('--module', action='append', default=[], help='Also report whether/how long this module took.')
+    parser.add_argument('--json', dest='json_path', default=None, help='Also write the report to this JSON file.')
+    args = parser.parse_args()
+
+    rows = profile(args.target)
+    total_us = next((cumulative for name, _, cumulative, _ in rows if name == args.target), 0)
+    # Direct imports of the target show where its own startup time goes.
+    top_level = sorted(((cumulative, name) for name, _, cumulative, depth in rows if depth == 1), reverse=True)
+    slowest = sorted(((cumulative, self_us, name) for name, self_us, cumulative, _ in rows), reverse=True)[:args.top]
+
+    print(f"import {args.target}: {total_us / 1000:.1f} ms, {len(rows)} modules\n")
+    print("Direct imports by cumulative time:")
+    for cumulative, name in top_level[:args.top]:
+        print(f"  {cumulative / 1000:>9.1f} ms  {name}")
+    print(f"\nSlowest {len(slowest)} modules (cumulative / self):")
+    for cumulative, self_us, name in slowest:
+        print(f"  {cumulative / 1000:>9.1f} ms {self_us / 1000:>8.1f} ms  {name}")
+    loaded = {name: cumulative for name, _, cumulative, _ in rows}
+    for module in args.module:
+        state = f"{loaded[module] / 1000:.1f} ms" if module in loaded else 'not imported'
+        print(f"\n{module}: {state}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'target': args.target, 'total_ms': total_us / 1000,
+                       'direct_imports_ms': {name: cumulative / 1000 for cumulative, name in top_level},
+                       'modules': [{'module': name, 'self_ms': s / 1000, 'cumulative_ms': c / 1000, 'depth': d}
+                                   for name, s, c, d in rows]}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Concurrent load test of every ClimaCast route against the local stub upstreams.
+
+Starts the stubs (bench/stubs.py) in this process, launches the app in a subprocess pointed
+at them, drives each endpoint in turn with `--concurrency` client threads and reports
+throughput and p50/p95/p99 latency per endpoint. Nothing touches the network.
+
+    python -m bench.loadtest                              # Flask threaded server, defaults
+    python -m bench.loadtest --server gevent --concurrency 200 --owm-latency-ms 300
+    python -m bench.loadtest --only weather,dashboard --requests 2000 --json results.json
+    python -m bench.loadtest --target http://127.0.0.1:5000   # an already running app
+
+Call budgets are raised far above the stub traffic unless `--keep-budgets` is given, so the
+numbers measure the app rather than its quota shaping. Before a climatology run the store is
+filled for CLIMATOLOGY_POINTS from the stub archive, so that scenario measures real lookups
+rather than "no data yet" answers; against `--target`, fill them yourself first.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import requests
+
+from bench.stubs import add_stub_arguments, start_stubs, stub_configs, stub_environment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BANGLADESH_CITIES = ('Dhaka', 'Chittagong', 'Khulna', 'Rajshahi', 'Barisal', 'Sylhet', 'Rangpur', 'Mymensingh')
+
+
+def _city(rng, cities):
+    return rng.choice(cities)
+
+
+def _coords(rng):
+    return round(rng.uniform(20.5, 26.5), 3), round(rng.uniform(88.0, 92.5), 3)
+
+
+# The divisional capitals; the climatology scenario only asks for these cells, which are backfilled first.
+CLIMATOLOGY_POINTS = ((23.81, 90.41), (22.36, 91.78), (22.82, 89.55), (24.37, 88.6),
+                      (22.7, 90.37), (24.89, 91.87), (25.74, 89.28), (24.75, 90.41))
+
+
+# name -> (method, build(rng, cities) -> (path, json_body))
+SCENARIOS = {
+    'index': ('GET', lambda rng, cities: ('/', None)),
+    'weather': ('GET', lambda rng, cities: (f"/api/weather?city={_city(rng, cities)}", None)),
+    'weather_batch': ('POST', lambda rng, cities: ('/api/weather/batch', {
+        'locations': [_city(rng, cities) for _ in range(8)] + [dict(zip(('latitude', 'longitude'), _coords(rng)))]})),
+    'perfect_day': ('GET', lambda rng, cities: (
+        f"/api/perfect_day_forecast?city={_city(rng, cities)}&activities=running,cycling,picnic,stargazing", None)),
+    'perfect_day_forecast': ('GET', lambda rng, cities: (
+        f"/api/perfect_day_forecast?city={_city(rng, cities)}&activities=running,hiking&mode=forecast", None)),
+    'health': ('GET', lambda rng, cities: (
+        f"/api/health_weather_advice?city={_city(rng, cities)}&concerns=flu_respiratory,heatstroke_exhaustion,dengue_risk", None)),
+    'history': ('GET', lambda rng, cities: (
+        "/api/weather_history_on_this_day?latitude={}&longitude={}&current_date={}".format(*_coords(rng), date.today()), None)),
+    'dashboard': ('GET', lambda rng, cities: (
+        f"/api/city_dashboard?city={_city(rng, cities)}&current_date={date.today()}", None)),
+    'climatology': ('GET', lambda rng, cities: (
+        "/api/climatology?latitude={}&longitude={}&temperature={}".format(*rng.choice(CLIMATOLOGY_POINTS), rng.randint(15, 38)), None)),
+    'summary': ('POST', lambda rng, cities: ('/api/generate-summary', {
+        'prompt': f"Summarize the weather in {_city(rng, cities)}: {rng.randint(15, 38)}°C, humidity {rng.randint(40, 95)}%."})),
+    'summary_stream': ('POST', lambda rng, cities: ('/api/generate-summary/stream', {
+        'prompt': f"Summarize the weather in {_city(rng, cities)}: {rng.randint(15, 38)}°C, humidity {rng.randint(40, 95)}%."})),
+    'feels_like': ('POST', lambda rng, cities: ('/api/explain-feels-like', {
+        'temp': rng.randint(15, 38), 'feels_like': rng.randint(15, 45), 'wind_speed': rng.randint(0, 10),
+        'humidity': rng.randint(40, 95), 'description': rng.choice(('clear sky', 'light rain', 'haze'))})),
+    'metrics': ('GET', lambda rng, cities: ('/metrics', None)),
+}
+
+# Keeps quota shaping out of the way; --keep-budgets uses the production defaults instead.
+UNLIMITED_BUDGETS = {
+    'OWM_CALLS_PER_MIN': '1000000', 'OWM_BURST': '100000', 'NOMINATIM_RATE_PER_SEC': '100000',
+    'OPEN_METEO_CALLS_PER_MIN': '1000000', 'GEMINI_CALLS_PER_MIN': '1000000',
+}
+
+SERVER_COMMANDS = {
+    'flask': lambda port: [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port),
+                           '--with-threads', '--no-reload', '--no-debugger'],
+    'gevent': lambda port: [sys.executable, 'wsgi_async.py'],
+    'gunicorn': lambda port: ['gunicorn', '-w', '2', '--threads', '16', '-b', f'127.0.0.1:{port}', 'app:app'],
+}
+
+
+def seed_climatology(env):
+    """Backfills the climatology store for CLIMATOLOGY_POINTS through the app's CLI, against the stubs."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'climatology-backfill']
+                   + [f"{lat},{lon}" for lat, lon in CLIMATOLOGY_POINTS],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    print(f"Seeded climatology for {len(CLIMATOLOGY_POINTS)} cells in {time.perf_counter() - started:.1f} s.", flush=True)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(base_url, name, total, concurrency, cities, seed):
+    """Sends `total` requests for one scenario from `concurrency` threads. Returns the result dict."""
+    method, build = SCENARIOS[name]
+    local = threading.local()
+    rng_lock = threading.Lock()
+    rng = random.Random(seed)
+
+    def one(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        with rng_lock:
+            path, body = build(rng, cities)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=60)
+            response.content  # read streamed bodies (SSE) to the end
+            status = response.status_code
+        except requests.exceptions.RequestException:
+            status = 'error'
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    statuses = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ms = lambda value: round(value * 1000, 2)
+    return {
+        'endpoint': name, 'requests': total, 'concurrency': concurrency, 'seconds': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1), 'statuses': statuses,
+        'p50_ms': ms(percentile(latencies, 0.50)), 'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)), 'max_ms': ms(latencies[-1]),
+    }
+
+
+def wait_until_ready(base_url, process=None, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"App server exited with status {process.returncode}.")
+        try:
+            if requests.get(base_url + '/metrics', timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"App server at {base_url} did not become ready within {timeout}s.")
+
+
+def print_table(results):
+    header = f"{'endpoint':<22}{'reqs':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  statuses"
+    print(header)
+    print('-' * len(header))
+    for result in results:
+        statuses = ' '.join(f"{status}:{count}" for status, count in sorted(result['statuses'].items()))
+        print(f"{result['endpoint']:<22}{result['requests']:>7}{result['throughput_rps']:>9}{result['p50_ms']:>10}"
+              f"{result['p95_ms']:>10}{result['p99_ms']:>10}{result['max_ms']:>10}  {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint.')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client threads.')
+    parser.add_argument('--cities', type=int, default=50, help='Distinct city names drawn from (more means more cache misses).')
+    parser.add_argument('--only', default=None, help=f"Comma-separated subset of: {', '.join(SCENARIOS)}.")
+    parser.add_argument('--server', choices=sorted(SERVER_COMMANDS), default='flask', help='How to run the app.')
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--target', default=None, help='Base URL of an app that is already running (stubs are still started).')
+    parser.add_argument('--keep-budgets', action='store_true', help='Leave the production upstream call budgets in place.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', default=None, help='Also write the results to this JSON file.')
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.only.split(',')] if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(unknown)}")
+    cities = list(BANGLADESH_CITIES) + [f"Stubville {i:03d}" for i in range(max(0, args.cities - len(BANGLADESH_CITIES)))]
+
+    servers, counters = start_stubs(stub_configs(args))
+    process = None
+    if args.target:
+        base_url = args.target.rstrip('/')
+        print("Point the target app at the stubs with:")
+        for name, value in stub_environment(servers).items():
+            print(f"  export {name}={value}")
+    else:
+        env = dict(os.environ, **stub_environment(servers), PORT=str(args.port),
+                   CLIMACAST_INSTANCE_DIR=tempfile.mkdtemp(prefix='climacast-bench-'))
+        if not args.keep_budgets:
+            env.update(UNLIMITED_BUDGETS)
+        if 'climatology' in names:
+            seed_climatology(env)
+        process = subprocess.Popen(SERVER_COMMANDS[args.server](args.port), cwd=ROOT, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_ready(base_url, process)
+        results = []
+        for offset, name in enumerate(names):
+            results.append(run_scenario(base_url, name, args.requests, args.concurrency, cities, args.seed + offset))
+            print(f"{name}: {results[-1]['throughput_rps']} req/s, p99 {results[-1]['p99_ms']} ms", flush=True)
+        print()
+        print_table(results)
+        print(f"\nUpstream requests served by the stubs: {counters}")
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump({'server': args.server if not args.target else args.target, 'results': results,
+                           'upstream_requests': counters}, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        for server in servers.values():
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Micro-benchmarks of the rule evaluation hot paths: the per-call `analyze_activity_conditions`
+and `check_health_condition_triggers`, and the vectorized rule sets they are compiled into.
+
+    python -m bench.micro                                   # print ns per call
+    python -m bench.micro --save bench/baseline.json        # record a baseline
+    python -m bench.micro --baseline bench/baseline.json    # exit 1 on a >25% regression
+
+Importing the app makes no network calls; the benchmarks only run the pure functions.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import app as climacast  # noqa: E402
+
+WEATHER_MAINS = ('Clear', 'Clouds', 'Rain', 'Mist', 'Thunderstorm', 'Snow', 'Fog')
+
+
+def sample_weather(count, seed=7):
+    """Synthetic current-weather dicts covering every rule branch."""
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        wind_ms = rng.uniform(0, 15)
+        samples.append({
+            'temperature': round(rng.uniform(-5, 45), 1), 'feels_like': round(rng.uniform(-8, 50), 1),
+            'humidity': rng.randint(10, 100), 'wind_speed_ms': wind_ms, 'wind_speed_kmh': round(wind_ms * 3.6, 1),
+            'weather_main': rng.choice(WEATHER_MAINS),
+            'description': rng.choice(('clear sky', 'heavy intensity rain', 'light rain', 'shower rain', 'haze')),
+        })
+    return samples
+
+
+def benchmarks(samples):
+    """name -> (callable, operations per call) pairs to time."""
+    activities = list(climacast.PERFECT_DAY_ACTIVITIES.items())
+    concerns = [definition['triggers'] for definition in climacast.HEALTH_CONCERNS_BN.values()]
+    columns = {
+        'temp': np.array([s['temperature'] for s in samples]), 'feels': np.array([s['feels_like'] for s in samples]),
+        'wind': np.array([s['wind_speed_kmh'] for s in samples]), 'humidity': np.array([s['humidity'] for s in samples]),
+        'main': [s['weather_main'] for s in samples], 'description': [s['description'] for s in samples],
+    }
+
+    def analyze_all():
+        for weather in samples:
+            for key, prefs in activities:
+                climacast.analyze_activity_conditions(key, prefs, weather)
+
+    def health_all():
+        for weather in samples:
+            for triggers in concerns:
+                climacast.check_health_condition_triggers(triggers, weather)
+
+    def activity_vectorized():
+        climacast.ACTIVITY_RULES.evaluate(columns['temp'], columns['wind'], columns['humidity'], columns['main'])
+
+    def health_vectorized():
+        climacast.HEALTH_RULES.evaluate(columns['temp'], columns['feels'], columns['humidity'],
+                                        columns['main'], columns['description'])
+
+    return {
+        'analyze_activity_conditions': (analyze_all, len(samples) * len(activities)),
+        'check_health_condition_triggers': (health_all, len(samples) * len(concerns)),
+        'activity_rules_vectorized': (activity_vectorized, len(samples) * len(activities)),
+        'health_rules_vectorized': (health_vectorized, len(samples) * len(concerns)),
+    }
+
+
+def measure(function, operations, repeat=5):
+    """Best-of-`repeat` nanoseconds per operation."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number / operations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=1000, help='Weather observations per benchmark pass.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', default=None, help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', default=None, help='Compare against a JSON file written by --save.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown vs. the baseline (0.25 = 25%%).')
+    args = parser.parse_args()
+
+    results = {name: round(measure(function, operations, args.repeat), 1)
+               for name, (function, operations) in benchmarks(sample_weather(args.samples)).items()}
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    for name, ns in results.items():
+        line = f"{name:<34}{ns:>10.1f} ns/op"
+        if name in baseline:
+            change = ns / baseline[name] - 1
+            line += f"   {change:+.1%} vs baseline"
+            if change > args.tolerance:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print(f"\nSlower than baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Cold-start benchmark: wall time from spawning a fresh interpreter to the first `/api/weather`
+response, the way a serverless instance starts. The OWM call is answered by the local stub
+(bench/stubs.py), so the number is import + app setup + one request.
+
+    python -m bench.startup                  # 10 cold starts, median/min/max
+    python -m bench.startup --runs 20 --ai   # also time the first AI request in the same process
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.stubs import StubConfig, start_stubs, stub_environment
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the cold process: import the app, answer one weather request through the WSGI
+# test client, optionally one AI request, and report the in-process timings as JSON.
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get('/api/weather?city=Dhaka')
+weather_done = time.perf_counter()
+result = {"import_s": imported - started, "first_weather_s": weather_done - started,
+          "weather_status": response.status_code, "gemini_sdk_loaded": "google.generativeai" in sys.modules}
+if "--ai" in sys.argv:
+    ai_started = time.perf_counter()
+    response = client.post('/api/generate-summary', json={"prompt": "Summarize: 31C, humid, light wind."})
+    result.update(first_ai_s=time.perf_counter() - ai_started, ai_status=response.status_code)
+print(json.dumps(result), flush=True)
+'''
+
+
+def cold_start(env, ai=False):
+    """Spawns one fresh interpreter. Returns its timing dict plus `process_to_weather_s`."""
+    spawned = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', CHILD] + (['--ai'] if ai else []), cwd=ROOT, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    received = time.perf_counter()
+    _, stderr = process.communicate(timeout=60)
+    if not line:
+        raise RuntimeError(f"Cold start failed:\n{stderr[-2000:]}")
+    result = json.loads(line)
+    # Everything the child did after its first weather response (the AI request) is excluded.
+    result['process_to_weather_s'] = received - spawned - result.get('first_ai_s', 0.0)
+    return result
+
+
+def summarize(values):
+    return {'median_ms': round(statistics.median(values) * 1000, 1), 'min_ms': round(min(values) * 1000, 1),
+            'max_ms': round(max(values) * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--ai', action='store_true', help='Also time the first /api/generate-summary in each process.')
+    parser.add_argument('--json', dest='json_path', default=None, help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+
+    servers, _ = start_stubs({name: StubConfig(latency_ms=0, jitter_ms=0) for name in ('owm', 'nominatim', 'open_meteo', 'gemini')})
+    env = dict(os.environ, **stub_environment(servers), PYTHONWARNINGS='ignore', WEATHER_REFRESH_ENABLED='false')
+    try:
+        runs = []
+        for _ in range(args.runs):
+            env['CLIMACAST_INSTANCE_DIR'] = tempfile.mkdtemp(prefix='climacast-startup-')
+            runs.append(cold_start(env, ai=args.ai))
+    finally:
+        for server in servers.values():
+            server.shutdown()
+
+    report = {
+        'runs': args.runs,
+        'process_start_to_first_weather': summarize([run['process_to_weather_s'] for run in runs]),
+        'import_app': summarize([run['import_s'] for run in runs]),
+        'import_to_first_weather_in_process': summarize([run['first_weather_s'] for run in runs]),
+        'weather_statuses': sorted({run['weather_status'] for run in runs}),
+        'gemini_sdk_loaded_before_ai_request': any(run['gemini_sdk_loaded'] for run in runs),
+    }
+    if args.ai:
+        report['first_ai_request'] = summarize([run['first_ai_s'] for run in runs])
+        report['ai_statuses'] = sorted({run['ai_status'] for run in runs})
+    for key, value in report.items():
+        print(f"{key:<40}{value}")
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'report': report, 'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+Local stub servers standing in for OpenWeatherMap, Nominatim, the Open-Meteo archive and Gemini,
+so ClimaCast can be benchmarked without network access or API quota.
+
+Each upstream gets its own port (the app keys call budgets and circuit breakers by host) and
+answers with deterministic synthetic data derived from the query. Latency, jitter, the share
+of 5xx errors and the share of 429s (with Retry-After) are configurable per upstream.
+
+Run standalone and point the app at the printed environment:
+    python -m bench.stubs --latency-ms 80 --error-rate 0.01 --rate-limit-rate 0.005
+    python -m bench.stubs --owm-latency-ms 150 --gemini-latency-ms 900
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+UPSTREAMS = ('owm', 'nominatim', 'open_meteo', 'gemini')
+WEATHER_MAINS = ('Clear', 'Clouds', 'Rain', 'Mist', 'Thunderstorm', 'Drizzle')
+
+
+@dataclass
+class StubConfig:
+    """Behaviour of one stub upstream."""
+
+    latency_ms: float = 50.0
+    jitter_ms: float = 10.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+
+
+def _seed(text):
+    return zlib.crc32(text.casefold().encode('utf-8'))
+
+
+def owm_current(query, lat=None, lon=None):
+    """Synthetic OWM current-weather payload, stable for the same query."""
+    seed = _seed(query)
+    if lat is None:
+        lat, lon = round((seed % 12000) / 100 - 60, 4), round((seed // 12000 % 36000) / 100 - 180, 4)
+    temp = round(5 + (seed % 3500) / 100, 2)
+    return {
+        'cod': 200, 'name': query.title(), 'coord': {'lat': lat, 'lon': lon},
+        'main': {'temp': temp, 'feels_like': round(temp + (seed % 7) - 2, 2), 'humidity': 30 + seed % 70, 'pressure': 990 + seed % 40},
+        'weather': [{'id': 800, 'main': WEATHER_MAINS[seed % len(WEATHER_MAINS)], 'description': 'stub conditions'}],
+        'wind': {'speed': round((seed % 1200) / 100, 2)},
+    }
+
+
+def owm_forecast(query):
+    """Synthetic 5-day/3-hour forecast (40 steps) for a city."""
+    rng = random.Random(_seed(query))
+    start = int(time.time()) // 10800 * 10800 + 10800
+    steps = [{
+        'dt': start + i * 10800,
+        'main': {'temp': round(rng.uniform(5, 38), 2), 'humidity': rng.randint(30, 100)},
+        'wind': {'speed': round(rng.uniform(0, 12), 2)},
+        'weather': [{'main': rng.choice(WEATHER_MAINS)}],
+    } for i in range(40)]
+    return {'cod': '200', 'list': steps, 'city': {'name': query.title(), 'timezone': 21600}}
+
+
+def open_meteo_daily(lat, lon, start, end):
+    """Synthetic Open-Meteo archive `daily` block for an inclusive date range."""
+    days = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    base = 10 + abs(lat) % 20
+    return {'daily': {
+        'time': days,
+        'temperature_2m_max': [round(base + 8 + (i * 7) % 11, 1) for i in range(len(days))],
+        'temperature_2m_min': [round(base + (i * 5) % 7, 1) for i in range(len(days))],
+        'precipitation_sum': [round(((i * 13) % 17) / 3, 1) for i in range(len(days))],
+    }}
+
+
+def gemini_candidate(text):
+    return {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP', 'index': 0}]}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    upstream = None
+    config = None
+    counters = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _injected_failure(self):
+        """Sleeps for the configured latency, then answers with a 429 or 5xx if one is drawn."""
+        time.sleep(self.config.delay())
+        self.counters[self.upstream] = self.counters.get(self.upstream, 0) + 1
+        roll = random.random()
+        if roll < self.config.rate_limit_rate:
+            self._send_json(429, {'cod': 429, 'message': 'stub rate limit', 'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED', 'message': 'stub rate limit'}},
+                            headers={'Retry-After': str(self.config.retry_after)})
+            return True
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            self._send_json(503, {'cod': 503, 'message': 'stub upstream error', 'error': {'code': 503, 'status': 'UNAVAILABLE', 'message': 'stub upstream error'}})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self._injected_failure():
+            return
+        if self.upstream == 'owm' and url.path.endswith('/forecast'):
+            query = params.get('q', '')
+            if 'nowhere' in query.casefold():
+                return self._send_json(404, {'cod': '404', 'message': 'city not found'})
+            return self._send_json(200, owm_forecast(query))
+        if self.upstream == 'owm':
+            if 'q' in params:
+                if 'nowhere' in params['q'].casefold():
+                    return self._send_json(404, {'cod': '404', 'message': 'city not found'})
+                return self._send_json(200, owm_current(params['q']))
+            lat, lon = float(params.get('lat', 0)), float(params.get('lon', 0))
+            return self._send_json(200, owm_current(f"{lat:.2f},{lon:.2f}", lat, lon))
+        if self.upstream == 'nominatim':
+            query = params.get('q', '')
+            if 'nowhere' in query.casefold():
+                return self._send_json(200, [])
+            coord = owm_current(query)['coord']
+            return self._send_json(200, [{'lat': str(coord['lat']), 'lon': str(coord['lon']), 'display_name': query}])
+        if self.upstream == 'open_meteo':
+            try:
+                start = date.fromisoformat(params['start_date']); end = date.fromisoformat(params['end_date'])
+                lat = float(params['latitude']); lon = float(params['longitude'])
+            except (KeyError, ValueError):
+                return self._send_json(400, {'error': True, 'reason': 'Invalid parameters'})
+            return self._send_json(200, open_meteo_daily(lat, lon, start, end))
+        self._send_json(404, {'error': 'unknown stub path'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        if self.upstream != 'gemini':
+            return self._send_json(404, {'error': 'unknown stub path'})
+        if self._injected_failure():
+            return
+        text = 'Stub summary: mild conditions with a light breeze; a comfortable day to be outside.'
+        if self.path.split('?')[0].endswith(':streamGenerateContent'):
+            # The REST transport reads a streamed JSON array of GenerateContentResponse objects.
+            words = text.split(' ')
+            chunks = [gemini_candidate(' '.join(words[i:i + 4]) + ' ') for i in range(0, len(words), 4)]
+            return self._send_json(200, chunks)
+        self._send_json(200, gemini_candidate(text))
+
+
+def start_stubs(configs=None, host='127.0.0.1', base_port=0):
+    """
+    Starts one threaded stub server per upstream (on `base_port + i`, or free ports when 0)
+    and returns ({upstream: server}, counters) where `counters` maps upstream -> requests served.
+    """
+    configs = configs or {}
+    counters = {}
+    servers = {}
+    for offset, upstream in enumerate(UPSTREAMS):
+        handler = type(f'{upstream.title()}StubHandler', (_StubHandler,),
+                       {'upstream': upstream, 'config': configs.get(upstream, StubConfig()), 'counters': counters})
+        server = ThreadingHTTPServer((host, base_port + offset if base_port else 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f'stub-{upstream}', daemon=True).start()
+        servers[upstream] = server
+    return servers, counters
+
+
+def stub_environment(servers):
+    """Environment variables that point ClimaCast at the running stubs."""
+    base = {name: f"http://{server.server_address[0]}:{server.server_address[1]}" for name, server in servers.items()}
+    return {
+        'OWM_BASE_URL': f"{base['owm']}/data/2.5/weather",
+        'OWM_FORECAST_URL': f"{base['owm']}/data/2.5/forecast",
+        'NOMINATIM_BASE_URL': f"{base['nominatim']}/search",
+        'OPEN_METEO_HISTORICAL_URL': f"{base['open_meteo']}/v1/archive",
+        'GEMINI_API_ENDPOINT': base['gemini'],
+        'GEMINI_TRANSPORT': 'rest',
+        'OPENWEATHERMAP_API_KEY': 'stub-key',
+        'GEMINI_API_KEY': 'stub-key',
+    }
+
+
+def add_stub_arguments(parser):
+    """Adds --latency-ms/--jitter-ms/--error-rate/--rate-limit-rate, plus --<upstream>-... overrides."""
+    defaults = StubConfig()
+    for option, field in (('latency-ms', 'latency_ms'), ('jitter-ms', 'jitter_ms'),
+                          ('error-rate', 'error_rate'), ('rate-limit-rate', 'rate_limit_rate')):
+        parser.add_argument(f'--{option}', dest=field, type=float, default=getattr(defaults, field),
+                            help=f'Stub {field.replace("_", " ")} for every upstream (default {getattr(defaults, field)}).')
+        for upstream in UPSTREAMS:
+            parser.add_argument(f'--{upstream.replace("_", "-")}-{option}', dest=f'{upstream}_{field}', type=float,
+                                default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--retry-after', type=int, default=defaults.retry_after, help='Retry-After seconds sent with stub 429s.')
+
+
+def stub_configs(args):
+    """Per-upstream StubConfig from parsed add_stub_arguments() options."""
+    configs = {}
+    for upstream in UPSTREAMS:
+        values = {}
+        for field in ('latency_ms', 'jitter_ms', 'error_rate', 'rate_limit_rate'):
+            override = getattr(args, f'{upstream}_{field}')
+            values[field] = getattr(args, field) if override is None else override
+        configs[upstream] = StubConfig(retry_after=args.retry_after, **values)
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_stub_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--base-port', type=int, default=8101, help='Port of the first stub; the others follow.')
+    args = parser.parse_args()
+    servers, counters = start_stubs(stub_configs(args), host=args.host, base_port=args.base_port)
+    for name, value in stub_environment(servers).items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"Requests served: {counters}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+In-process caches shared by the ClimaCast routes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Flight:
+    """An in-progress load that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire `ttl` seconds after being stored.
+
+    `get_or_load` collapses concurrent misses for the same key into a single
+    call of the loader ("single-flight"); the other callers block until that
+    call finishes and then share its result or its exception.
+
+    Expired entries are kept for a further `stale_ttl` seconds. While a reload
+    of such an entry is in flight, `get_or_load` answers with the stale value
+    instead of waiting for the reload.
+    """
+
+    def __init__(self, maxsize=256, ttl=600, clock=time.monotonic, stale_ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        """Returns the cached value for `key`, or `default` if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                now = self._clock()
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                if entry[0] + self.stale_ttl <= now:
+                    del self._data[key]
+            self.misses += 1
+            return default
+
+    def get_stale(self, key, default=None):
+        """Returns the value for `key` even if it has expired but is still within `stale_ttl`, or `default`."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] + self.stale_ttl <= self._clock():
+                return default
+            return entry[1]
+
+    def expires_in(self, key):
+        """Returns the seconds until `key` expires (negative once stale), or None if it is not cached."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            remaining = entry[0] - self._clock()
+            if remaining + self.stale_ttl <= 0:
+                del self._data[key]
+                return None
+            return remaining
+
+    def set(self, key, value, ttl=None):
+        """Stores `value` under `key`, evicting the least recently used entries if full."""
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_load(self, key, loader, cacheable=None):
+        """
+        Returns the cached value for `key`, calling `loader()` on a miss.
+        The loaded value is stored unless `cacheable(value)` returns False.
+        Exceptions raised by the loader propagate to every waiting caller and are not cached.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            if flight is not None and entry is not None and entry[0] + self.stale_ttl > self._clock():
+                # Someone is already reloading this entry; answer with the stale value meanwhile.
+                self.stale_hits += 1
+                return entry[1]
+            self.misses += 1
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        return self._run_flight(key, flight, loader, cacheable)
+
+    def refresh(self, key, loader, cacheable=None):
+        """
+        Reloads `key` regardless of its age, unless a load for it is already in flight.
+        Callers of `get_or_load` keep getting the current (possibly stale) value until it finishes.
+        Returns True if this call performed the reload; loader exceptions propagate.
+        """
+        with self._lock:
+            if key in self._flights:
+                return False
+            flight = self._flights[key] = _Flight()
+        self._run_flight(key, flight, loader, cacheable)
+        return True
+
+    def _run_flight(self, key, flight, loader, cacheable):
+        try:
+            value = loader()
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            flight.value = value
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'stale_ttl': self.stale_ttl, 'hits': self.hits, 'misses': self.misses,
+                    'stale_hits': self.stale_hits}
@@ -0,0 +1,143 @@
+"""
+Climatology store: multi-decade daily max/min/precipitation series per grid cell,
+kept as compact NumPy arrays on disk and read through memory mapping.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+
+# Column order of the per-cell arrays.
+MAX_TEMP, MIN_TEMP, PRECIPITATION = 0, 1, 2
+
+
+class ClimatologyStore:
+    """
+    One `.npy` file per grid cell holding a float32 array of shape (days, 3), where row `i`
+    is the day `base_date + i` and missing days are NaN. Loaded cells are kept memory-mapped
+    in a small LRU so repeat requests only touch the rows they index.
+    """
+
+    def __init__(self, directory, grid_deg=0.25, base_date=date(1980, 1, 1), max_loaded=64):
+        self.directory = directory
+        self.grid_deg = grid_deg
+        self.base_date = base_date
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_locks = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def cell(self, lat, lon):
+        return round(lat / self.grid_deg), round(lon / self.grid_deg)
+
+    def cell_center(self, lat, lon):
+        cell_lat, cell_lon = self.cell(lat, lon)
+        return round(cell_lat * self.grid_deg, 6), round(cell_lon * self.grid_deg, 6)
+
+    def _path(self, cell):
+        return os.path.join(self.directory, f"{cell[0]}_{cell[1]}.npy")
+
+    def has_cell(self, lat, lon):
+        return os.path.exists(self._path(self.cell(lat, lon)))
+
+    def load(self, lat, lon):
+        """Returns the memory-mapped array for the cell containing (lat, lon), or None if not backfilled."""
+        cell = self.cell(lat, lon)
+        with self._lock:
+            array = self._loaded.get(cell)
+            if array is not None:
+                self._loaded.move_to_end(cell)
+                return array
+        path = self._path(cell)
+        if not os.path.exists(path):
+            return None
+        array = np.load(path, mmap_mode='r')
+        with self._lock:
+            self._loaded[cell] = array
+            self._loaded.move_to_end(cell)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return array
+
+    def _write_lock(self, cell):
+        with self._lock:
+            return self._write_locks.setdefault(cell, threading.Lock())
+
+    def backfill(self, lat, lon, end_date, fetch_range, chunk_days=3653):
+        """
+        Fills the cell from `base_date` through `end_date`, requesting only days that are not
+        stored yet, in chunks of `chunk_days`. `fetch_range(lat, lon, start, end)` must return
+        (iso_date, max_temp, min_temp, precipitation) tuples for the cell center.
+        Returns the number of days written.
+        """
+        cell = self.cell(lat, lon)
+        center_lat, center_lon = self.cell_center(lat, lon)
+        with self._write_lock(cell):
+            path = self._path(cell)
+            existing = np.load(path) if os.path.exists(path) else np.empty((0, 3), dtype=np.float32)
+            length = max((end_date - self.base_date).days + 1, len(existing))
+            array = np.full((length, 3), np.nan, dtype=np.float32)
+            array[:len(existing)] = existing
+            # Resume after the last stored day; earlier gaps are days the upstream has no data for.
+            stored = np.flatnonzero(~np.isnan(array).all(axis=1))
+            start_index = int(stored[-1]) + 1 if len(stored) else 0
+            written = 0
+            for chunk_start in range(start_index, length, chunk_days):
+                chunk_end = min(chunk_start + chunk_days, length) - 1
+                rows = fetch_range(center_lat, center_lon,
+                                   self.base_date + timedelta(days=chunk_start),
+                                   self.base_date + timedelta(days=chunk_end))
+                if not rows:
+                    continue
+                days, values = zip(*((row[0], row[1:]) for row in rows))
+                index = (np.array(days, dtype='datetime64[D]')
+                         - np.datetime64(self.base_date, 'D')).astype(np.int64)
+                in_range = (index >= 0) & (index < length)
+                array[index[in_range]] = np.array(values, dtype=np.float64)[in_range]
+                written += int(in_range.sum())
+            tmp_path = path + '.tmp.npy'
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._loaded.pop(cell, None)
+            return written
+
+    def window_indices(self, target, years, window_days):
+        """
+        Row indices for `target`'s day-of-year +/- `window_days` in each of the `years`
+        calendar years before `target`.
+        """
+        # datetime64[Y] counts years from 1970.
+        year_starts = (np.arange(target.year - years, target.year) - 1970).astype('datetime64[Y]').astype('datetime64[D]')
+        day_of_year = (target - date(target.year, 1, 1)).days
+        centers = (year_starts - np.datetime64(self.base_date, 'D')).astype(np.int64) + day_of_year
+        return (centers[:, None] + np.arange(-window_days, window_days + 1)).ravel()
+
+    def sample(self, array, target, years=30, window_days=7):
+        """Returns the (n, 3) float array of historical days in the window, or an empty array."""
+        index = self.window_indices(target, years, window_days)
+        index = index[(index >= 0) & (index < len(array))]
+        return np.asarray(array[index], dtype=np.float64)
+
+
+def percentile_of(values, value):
+    """Percentile rank (0-100) of `value` within `values`, ignoring NaNs; ties count half."""
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return None
+    below = np.count_nonzero(values < value)
+    equal = np.count_nonzero(values == value)
+    return float(100.0 * (below + 0.5 * equal) / values.size)
+
+
+def summarize(values):
+    """Mean and 10th/50th/90th percentiles of `values`, ignoring NaNs, or None if empty."""
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return None
+    p10, p50, p90 = np.percentile(values, [10, 50, 90])
+    return {'mean': round(float(values.mean()), 2), 'p10': round(float(p10), 2),
+            'p50': round(float(p50), 2), 'p90': round(float(p90), 2), 'samples': int(values.size)}
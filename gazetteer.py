@@ -0,0 +1,285 @@
+"""
+Local city gazetteer: prefix autocomplete, typo-tolerant name resolution and nearest-city
+lookup without network calls, over the GeoNames cities extract shipped with the
+`geonamescache` package.
+"""
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left
+
+try:
+    import geonamescache
+except ImportError:  # Optional; without it city names are resolved by the network geocoders only.
+    geonamescache = None
+
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]+')
+# Sorts after every character a normalized key can contain, so `prefix + _END` bounds a prefix range.
+_END = '\x7f'
+# Names matched through an alternate spelling rank below places that carry the name as their own.
+ALIAS_WEIGHT = 0.1
+# Prefix ranges wider than this have their best keys memoized instead of scanned on every query.
+_SCAN_LIMIT = 256
+_MEMO_KEYS = 64
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres between two coordinates in degrees."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _unit_vector(latitude, longitude):
+    phi, lam = math.radians(latitude), math.radians(longitude)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def normalize(text):
+    """Lowercase ASCII form of a place name: accents stripped, punctuation and extra spaces collapsed."""
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(_NON_ALNUM_RE.sub(' ', text.lower()).split())
+
+
+def _is_latin(text):
+    if text.isascii():
+        return True
+    return all(ch.isascii() or unicodedata.combining(ch) for ch in unicodedata.normalize('NFKD', text))
+
+
+def _next_row(previous, query, char):
+    """Levenshtein DP row for one more character `char` of a key, given the row of its prefix."""
+    left = previous[0] + 1
+    row = [left]
+    append = row.append
+    diagonal = previous[0]
+    for above, query_char in zip(previous[1:], query):
+        left = min(left + 1, above + 1, diagonal + (query_char != char))
+        append(left)
+        diagonal = above
+    return row
+
+
+def load_geonames(min_population=15000):
+    """
+    Returns place dicts (name, country, latitude, longitude, population, alternate_names) for the
+    GeoNames cities with at least `min_population` inhabitants (500, 1000, 5000 or 15000).
+    """
+    if geonamescache is None:
+        raise RuntimeError("The geonamescache package is not installed.")
+    cities = geonamescache.GeonamesCache(min_city_population=min_population).get_cities()
+    return [{'name': city['name'], 'country': city['countrycode'], 'latitude': city['latitude'],
+             'longitude': city['longitude'], 'population': city['population'],
+             'alternate_names': city.get('alternatenames', ())} for city in cities.values()]
+
+
+class Gazetteer:
+    """
+    In-memory index of places by name.
+
+    Names and Latin-script alternate names are normalized and kept in one sorted list of
+    unique keys, which serves as a compact prefix trie: the keys under a prefix form a
+    contiguous range found by binary search, and a node's children are the sub-ranges that
+    share the next character. `complete` ranks the keys in a prefix range by population;
+    misspellings are matched by walking that implicit trie with a Levenshtein row per node
+    and pruning branches whose best distance already exceeds the limit.
+
+    Places are also bucketed into a `grid_deg` latitude/longitude grid; `nearest` searches
+    rings of cells outwards from the query until no unsearched cell can hold a closer place.
+    """
+
+    def __init__(self, places, grid_deg=1.0):
+        self.grid_deg = grid_deg
+        self._grid_columns = int(round(360 / grid_deg))
+        self._grid = {}  # (row, column) -> place indices
+        self._vectors = []  # unit (x, y, z) per place; a larger dot product means a nearer place
+        self.names, self.countries, self.latitudes, self.longitudes, self.populations = [], [], [], [], []
+        by_key = {}
+        for place in places:
+            index = len(self.names)
+            population = place.get('population') or 0
+            self.names.append(place['name'])
+            self.countries.append(place.get('country'))
+            self.latitudes.append(float(place['latitude']))
+            self.longitudes.append(float(place['longitude']))
+            self.populations.append(population)
+            self._grid.setdefault(self._cell(self.latitudes[index], self.longitudes[index]), []).append(index)
+            self._vectors.append(_unit_vector(self.latitudes[index], self.longitudes[index]))
+            primary = normalize(place['name'])
+            if primary:
+                by_key.setdefault(primary, {})[index] = population
+            for alternate in place.get('alternate_names') or ():
+                if len(alternate) < 3 or (alternate.isupper() and len(alternate) <= 4) or not _is_latin(alternate):
+                    continue  # airport codes and non-Latin scripts
+                key = normalize(alternate)
+                if len(key) >= 3 and key != primary:
+                    scores = by_key.setdefault(key, {})
+                    scores[index] = max(scores.get(index, 0), population * ALIAS_WEIGHT)
+        self._keys = sorted(by_key)
+        # Per key: (score, place index) pairs, best first; and the best score as the key's rank.
+        self._entries = [sorted(((score, index) for index, score in by_key[key].items()), reverse=True) for key in self._keys]
+        self._key_scores = [entries[0][0] for entries in self._entries]
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def place(self, index, **extra):
+        """Returns the place at `index` as a JSON-ready dict, with any `extra` fields."""
+        return dict({'name': self.names[index], 'country': self.countries[index], 'latitude': self.latitudes[index],
+                     'longitude': self.longitudes[index], 'population': self.populations[index]}, **extra)
+
+    def _cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.grid_deg)), int(math.floor(longitude / self.grid_deg)) % self._grid_columns
+
+    def nearest(self, latitude, longitude, max_distance_km=None):
+        """
+        The place nearest to a coordinate, with its `distance_km`, or None if there is none
+        (within `max_distance_km`, when given).
+        """
+        row, column = self._cell(latitude, longitude)
+        x, y, z = _unit_vector(latitude, longitude)
+        vectors = self._vectors
+        best_distance, best_dot, best_index = math.inf, -2.0, None
+        for ring in range(int(180 / self.grid_deg) + 1):
+            if best_index is not None or max_distance_km is not None:
+                # Cells in this ring are at least ring - 1 cells away; longitude cells narrow towards the poles.
+                edge_latitude = min(89.999, abs(latitude) + (ring + 1) * self.grid_deg)
+                closest_possible = (ring - 1) * self.grid_deg * _KM_PER_DEGREE * math.cos(math.radians(edge_latitude))
+                if closest_possible > min(best_distance, max_distance_km if max_distance_km is not None else math.inf):
+                    break
+            for ring_row in range(row - ring, row + ring + 1):
+                # Latitude alone puts a whole row of cells out of reach of the best place so far.
+                band_gap = max(ring_row * self.grid_deg - latitude, latitude - (ring_row + 1) * self.grid_deg, 0)
+                if band_gap * _KM_PER_DEGREE > best_distance:
+                    continue
+                step = 1 if ring_row in (row - ring, row + ring) else 2 * ring or 1
+                for ring_column in range(column - ring, column + ring + 1, step):
+                    for index in self._grid.get((ring_row, ring_column % self._grid_columns), ()):
+                        px, py, pz = vectors[index]
+                        dot = x * px + y * py + z * pz
+                        if dot > best_dot:
+                            best_dot, best_index = dot, index
+                            best_distance = EARTH_RADIUS_KM * math.acos(min(1.0, dot))
+        if best_index is None or (max_distance_km is not None and best_distance > max_distance_km):
+            return None
+        distance = haversine_km(latitude, longitude, self.latitudes[best_index], self.longitudes[best_index])
+        return self.place(best_index, distance_km=round(distance, 3))
+
+    def _prefix_range(self, prefix):
+        return bisect_left(self._keys, prefix), bisect_left(self._keys, prefix + _END)
+
+    def _top_keys(self, prefix, lo, hi, count):
+        """Key indices in [lo, hi) with the highest scores, best first."""
+        if hi - lo <= _SCAN_LIMIT or count > _MEMO_KEYS:
+            return heapq.nlargest(count, range(lo, hi), key=self._key_scores.__getitem__)
+        top = self._memo.get(prefix)
+        if top is None:
+            top = self._memo[prefix] = heapq.nlargest(_MEMO_KEYS, range(lo, hi), key=self._key_scores.__getitem__)
+        return top[:count]
+
+    def _fuzzy(self, query, max_distance, prefix):
+        """
+        Levenshtein search over the sorted keys. Returns (distance, lo, hi, common prefix) for the key
+        ranges whose common prefix is within `max_distance` of `query` when `prefix` is true, else
+        (distance, key index) for whole keys within `max_distance`.
+        """
+        keys = self._keys
+        matches = []
+        # The first letter is taken as typed: misspellings rarely start there, and it cuts the search ~20-fold.
+        lo, hi = self._prefix_range(query[0])
+        stack = [(1, lo, hi, _next_row(list(range(len(query) + 1)), query, query[0]))]
+        while stack:
+            depth, lo, hi, previous = stack.pop()
+            i = lo
+            while i < hi:
+                key = keys[i]
+                char = key[depth]
+                node_prefix = key[:depth + 1]
+                j = bisect_left(keys, node_prefix + _END, i, hi)
+                row = _next_row(previous, query, char)
+                ends_here = len(key) == depth + 1
+                if prefix and row[-1] <= max_distance:
+                    matches.append((row[-1], i, j, node_prefix))
+                else:
+                    if not prefix and ends_here and row[-1] <= max_distance:
+                        matches.append((row[-1], i))
+                    if min(row) <= max_distance:
+                        stack.append((depth + 1, i + 1 if ends_here else i, j, row))
+                i = j
+        return matches
+
+    def _closest(self, query, max_distance, prefix):
+        """`_fuzzy` matches at the smallest distance up to `max_distance` that has any; cheap searches run first."""
+        for distance in range(1, max_distance + 1):
+            matches = self._fuzzy(query, distance, prefix)
+            if matches:
+                return matches
+        return []
+
+    @staticmethod
+    def max_distance(query):
+        """Edit distance tolerated for a normalized query: none below 4 characters, 1 up to 6, then 2."""
+        return 0 if len(query) < 4 else 1 if len(query) <= 6 else 2
+
+    def complete(self, text, limit=8):
+        """
+        Up to `limit` places whose name or alternate name starts with `text`, most populous first.
+        When nothing starts with `text`, places whose name starts with a close misspelling of it
+        are returned instead. Each place carries `match` ('prefix' or 'fuzzy').
+        """
+        query = normalize(text)
+        if not query:
+            return []
+        seen = set()
+        results = []
+
+        def add(key_indices, match):
+            candidates = sorted(((score, index) for key_index in key_indices for score, index in self._entries[key_index]),
+                                reverse=True)
+            for _, index in candidates:
+                if len(results) >= limit:
+                    return
+                if index not in seen:
+                    seen.add(index)
+                    results.append(self.place(index, match=match))
+
+        lo, hi = self._prefix_range(query)
+        add(self._top_keys(query, lo, hi, limit * 2), 'prefix')
+        max_distance = self.max_distance(query)
+        if not results and max_distance:
+            ranked = []
+            for distance, range_lo, range_hi, node_prefix in self._closest(query, max_distance, prefix=True):
+                top = self._top_keys(node_prefix, range_lo, range_hi, limit * 2)
+                ranked.append((distance, -self._key_scores[top[0]], top))
+            for _, _, top in sorted(ranked):
+                if len(results) >= limit:
+                    break
+                add(top, 'fuzzy')
+        return results
+
+    def resolve(self, text, fuzzy=True):
+        """
+        The place best matching a typed city name, or None. An exact name or alternate name wins
+        (most populous first, own names before alternates); otherwise, with `fuzzy`, the closest
+        misspelling within `max_distance`. The result carries `match` ('exact' or 'fuzzy') and `distance`.
+        """
+        query = normalize(text)
+        if not query:
+            return None
+        i = bisect_left(self._keys, query)
+        if i < len(self._keys) and self._keys[i] == query:
+            return self.place(self._entries[i][0][1], match='exact', distance=0)
+        max_distance = self.max_distance(query) if fuzzy else 0
+        if not max_distance:
+            return None
+        matches = self._closest(query, max_distance, prefix=False)
+        if not matches:
+            return None
+        distance, key_index = min(matches, key=lambda match: (match[0], -self._key_scores[match[1]]))
+        return self.place(self._entries[key_index][0][1], match='fuzzy', distance=distance)
@@ -0,0 +1,64 @@
+"""
+Disk-backed geocoding cache.
+"""
+import os
+import sqlite3
+import time
+
+
+class GeocodeStore:
+    """
+    SQLite-backed cache of geocoding results that survives restarts.
+    Both found coordinates and "not found" answers are stored, each with its own expiry.
+    """
+
+    def __init__(self, path, positive_ttl=30 * 86400, negative_ttl=86400):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " query TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    @staticmethod
+    def normalize(query):
+        return ' '.join(query.split()).casefold()
+
+    def lookup(self, query):
+        """
+        Returns (hit, coords). `hit` is False when nothing unexpired is stored;
+        otherwise `coords` is a (lat, lon) tuple, or None for a cached "not found".
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT lat, lon, expires_at FROM geocode WHERE query = ?", (self.normalize(query),)
+            ).fetchone()
+        if row is None or row[2] <= time.time():
+            return False, None
+        if row[0] is None or row[1] is None:
+            return True, None
+        return True, (row[0], row[1])
+
+    def store(self, query, coords):
+        """Stores a (lat, lon) result, or a "not found" result when `coords` is None."""
+        ttl = self.positive_ttl if coords is not None else self.negative_ttl
+        lat, lon = coords if coords is not None else (None, None)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode (query, lat, lon, expires_at) VALUES (?, ?, ?, ?)",
+                (self.normalize(query), lat, lon, time.time() + ttl),
+            )
+
+    def purge_expired(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM geocode WHERE expires_at <= ?", (time.time(),))
+
@@ -0,0 +1,77 @@
+"""
+Permanent on-disk archive of past daily observations from the Open-Meteo archive API.
+
+Past days never change, so rows are written once and never invalidated.
+"""
+import os
+import sqlite3
+
+
+class HistoryArchive:
+    """
+    SQLite table of daily max/min temperature and precipitation keyed by a quantized
+    grid cell and ISO date. Coordinates are snapped to a `grid_deg` grid so that nearby
+    lookups share rows.
+    """
+
+    def __init__(self, path, grid_deg=0.1):
+        self.path = path
+        self.grid_deg = grid_deg
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily ("
+                " cell_lat INTEGER NOT NULL, cell_lon INTEGER NOT NULL, date TEXT NOT NULL,"
+                " max_temp REAL, min_temp REAL, precipitation REAL,"
+                " PRIMARY KEY (cell_lat, cell_lon, date)) WITHOUT ROWID"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def cell(self, lat, lon):
+        """Returns the integer grid cell for a coordinate."""
+        return round(lat / self.grid_deg), round(lon / self.grid_deg)
+
+    def cell_center(self, lat, lon):
+        """Returns the coordinate the cell's data is fetched for."""
+        cell_lat, cell_lon = self.cell(lat, lon)
+        return round(cell_lat * self.grid_deg, 6), round(cell_lon * self.grid_deg, 6)
+
+    def get_many(self, lat, lon, dates):
+        """Returns {date: {'max_temp', 'min_temp', 'precipitation'}} for the archived subset of `dates`."""
+        dates = list(dates)
+        if not dates:
+            return {}
+        cell_lat, cell_lon = self.cell(lat, lon)
+        placeholders = ','.join('?' * len(dates))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT date, max_temp, min_temp, precipitation FROM daily"
+                f" WHERE cell_lat = ? AND cell_lon = ? AND date IN ({placeholders})",
+                (cell_lat, cell_lon, *dates),
+            ).fetchall()
+        return {row[0]: {'max_temp': row[1], 'min_temp': row[2], 'precipitation': row[3]} for row in rows}
+
+    def get_range(self, lat, lon, start_date, end_date):
+        """Returns archived rows between two ISO dates (inclusive) as (date, max, min, precipitation) tuples."""
+        cell_lat, cell_lon = self.cell(lat, lon)
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT date, max_temp, min_temp, precipitation FROM daily"
+                " WHERE cell_lat = ? AND cell_lon = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (cell_lat, cell_lon, start_date, end_date),
+            ).fetchall()
+
+    def put_many(self, lat, lon, rows):
+        """Stores (date, max_temp, min_temp, precipitation) tuples for the cell containing (lat, lon)."""
+        cell_lat, cell_lon = self.cell(lat, lon)
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO daily (cell_lat, cell_lon, date, max_temp, min_temp, precipitation)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [(cell_lat, cell_lon, *row) for row in rows],
+            )
@@ -0,0 +1,133 @@
+"""
+HTTP-level caching for ClimaCast responses: Cache-Control policies, ETags, response
+compression and content-hashed static asset URLs.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Optional; without it responses are only gzip-compressed.
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = frozenset({
+    'application/json', 'text/html', 'text/css', 'text/javascript', 'application/javascript',
+    'text/plain', 'image/svg+xml',
+})
+# Bodies smaller than this gain too little from compression to be worth the CPU.
+MIN_COMPRESS_SIZE = 512
+IMMUTABLE_MAX_AGE = 365 * 86400
+
+
+class CachePolicy:
+    """
+    How a route's successful GET responses may be reused.
+
+    `max_age` and `stale_while_revalidate` go to browsers and shared caches in Cache-Control;
+    `immutable` marks responses that never change for their URL. `revalidate_for` is how long
+    the server trusts the last ETag it sent for a URL: a matching If-None-Match within that
+    time is answered with 304 without running the route (0 always runs it).
+    """
+
+    def __init__(self, max_age=0, stale_while_revalidate=0, immutable=False, revalidate_for=0):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        self.immutable = immutable
+        self.revalidate_for = revalidate_for
+
+    def header(self):
+        """Returns the Cache-Control header value."""
+        if self.max_age <= 0:
+            return 'no-cache'
+        directives = ['public', f'max-age={self.max_age}']
+        if self.immutable:
+            directives.append('immutable')
+        elif self.stale_while_revalidate:
+            directives.append(f'stale-while-revalidate={self.stale_while_revalidate}')
+        return ', '.join(directives)
+
+
+def content_etag(data):
+    """
+    Returns an ETag value (unquoted) for a response body: a hash of its exact bytes. Callers
+    send it as a weak validator, since one value covers every content-encoding of the body.
+    """
+    return hashlib.sha1(data).hexdigest()
+
+
+def negotiate_encoding(accept_encodings):
+    """Returns 'br', 'gzip' or None for a request's parsed Accept-Encoding header."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, best=False):
+    """
+    Returns `data` compressed with `encoding` ('br' or 'gzip'). `best` uses the slowest,
+    smallest settings, meant for static assets that are compressed once and reused.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else 5)
+    return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+
+
+def is_compressible(mimetype):
+    return mimetype in COMPRESSIBLE_MIMETYPES
+
+
+class StaticAssets:
+    """
+    Content fingerprints and pre-compressed bodies of the files in a static folder.
+    Both are computed on first use and recomputed when a file's size or mtime changes.
+    """
+
+    def __init__(self, folder, fingerprint_length=12):
+        self.folder = folder
+        self.fingerprint_length = fingerprint_length
+        self._entries = {}  # filename -> {'version': (mtime_ns, size), 'fingerprint': str, encoding: bytes}
+        self._lock = threading.Lock()
+
+    def _entry(self, filename):
+        path = safe_join(self.folder, filename) if self.folder else None
+        try:
+            stat = os.stat(path) if path else None
+        except OSError:
+            stat = None
+        if stat is None:
+            return None, None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry['version'] == version:
+                return path, entry
+        with open(path, 'rb') as f:
+            data = f.read()
+        entry = {'version': version, 'fingerprint': hashlib.sha256(data).hexdigest()[:self.fingerprint_length]}
+        with self._lock:
+            self._entries[filename] = entry
+        return path, entry
+
+    def fingerprint(self, filename):
+        """Returns a short content hash of `filename`, or None if it does not exist."""
+        _, entry = self._entry(filename)
+        return entry['fingerprint'] if entry else None
+
+    def compressed(self, filename, encoding):
+        """Returns the body of `filename` compressed with `encoding`, or None if it does not exist."""
+        path, entry = self._entry(filename)
+        if entry is None:
+            return None
+        body = entry.get(encoding)
+        if body is None:
+            with open(path, 'rb') as f:
+                body = compress(f.read(), encoding, best=True)
+            with self._lock:
+                entry[encoding] = body
+        return body
@@ -0,0 +1,221 @@
+"""
+Minimal in-process metrics (counters, histograms, scrape-time gauges) rendered in the
+Prometheus text exposition format.
+"""
+import threading
+import weakref
+from bisect import bisect_left
+from collections import deque
+
+# Upper bounds in seconds; spans cache hits (sub-millisecond) to upstream read timeouts.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labels, extra=''):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Owner:
+    """Kept in a thread's local storage; it is released when the thread (or greenlet) finishes."""
+
+    __slots__ = ('__weakref__',)
+
+
+class _PerThread:
+    """
+    One dict per writing thread, so updates take no lock: a thread only ever writes its own
+    dict, and scrapes copy each dict in a single step under the GIL. Each dict is tied to a
+    token in the thread's local storage (a greenlet's, once gevent has patched `threading`);
+    when that storage is released at exit, the dict is queued and later folded into one dict
+    for all finished threads, so the number of dicts follows the live threads.
+    """
+
+    def __init__(self, fold):
+        self._fold = fold  # fold(into, values): adds one dict's values into another
+        self.local = threading.local()  # .values: the calling thread's dict, once registered
+        self._shards = {}  # id(dict) -> (dict, weakref to its thread's _Owner)
+        self._finished = deque()  # dicts of finished threads; appended from weakref callbacks, so lock-free
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def register(self):
+        """Creates and returns the calling thread's dict."""
+        values = {}
+        owner = _Owner()
+        finished = self._finished
+        with self._lock:
+            self._fold_finished()
+            self._shards[id(values)] = (values, weakref.ref(owner, lambda _, values=values: finished.append(values)))
+        self.local.owner = owner
+        self.local.values = values
+        return values
+
+    def _fold_finished(self):
+        while self._finished:
+            values = self._finished.popleft()
+            if self._shards.pop(id(values), None) is not None:
+                self._fold(self._retired, values)
+
+    def shard_count(self):
+        """Returns the number of per-thread dicts not yet folded."""
+        with self._lock:
+            self._fold_finished()
+            return len(self._shards)
+
+    def merged(self):
+        """Returns every thread's values folded into a new dict."""
+        merged = {}
+        with self._lock:
+            self._fold_finished()
+            self._fold(merged, self._retired)
+            for values, _ in self._shards.values():
+                self._fold(merged, values.copy())
+        return merged
+
+
+def _fold_counts(into, values):
+    for labels, value in values.items():
+        into[labels] = into.get(labels, 0) + value
+
+
+def _fold_series(into, values):
+    for labels, series in values.items():
+        series = list(series)
+        total = into.get(labels)
+        if total is None:
+            into[labels] = series
+        else:
+            for i, value in enumerate(series):
+                total[i] += value
+
+
+class Counter:
+    """Monotonic count per label tuple. `inc` is one unlocked update of the calling thread's dict."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = _PerThread(_fold_counts)
+        self._local = self._values.local
+
+    def inc(self, labels=(), amount=1):
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._values.register()
+        values[labels] = values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.merged().get(labels, 0)
+
+    def samples(self):
+        return [(self.name, self.labelnames, labels, '', value) for labels, value in self._values.merged().items()]
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label tuple. `observe` bisects into a fixed bucket list and
+    bumps two numbers in the calling thread's series, without a lock; counts are only made
+    cumulative, and the total count derived from the buckets, when scraped.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = _PerThread(_fold_series)  # labels -> [per-bucket counts (+Inf last)..., sum]
+        self._local = self._series.local
+
+    def observe(self, value, labels=()):
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._series.register()
+        series = values.get(labels)
+        if series is None:
+            series = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def snapshot(self, labels=()):
+        """Returns (bucket_counts, sum, count) for one series, or None if never observed."""
+        series = self._series.merged().get(labels)
+        return None if series is None else (series[:-1], series[-1], sum(series[:-1]))
+
+    def samples(self):
+        samples = []
+        for labels, series in self._series.merged().items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), series):
+                cumulative += bucket_count
+                samples.append((self.name + '_bucket', self.labelnames, labels, f'le="{_format_value(bound)}"', cumulative))
+            samples.append((self.name + '_sum', self.labelnames, labels, '', series[-1]))
+            samples.append((self.name + '_count', self.labelnames, labels, '', cumulative))
+        return samples
+
+
+class GaugeCallback:
+    """Gauge whose samples come from `collect()` at scrape time, as (labels, value) pairs."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, collect):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        return [(self.name, self.labelnames, tuple(labels), '', value) for labels, value in self.collect()]
+
+
+class MetricsRegistry:
+    """Named collection of metrics with a Prometheus text renderer."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, labelnames, collect, kind='gauge'):
+        """Registers a scrape-time metric; `kind='counter'` for totals kept elsewhere (e.g. cache hits)."""
+        metric = self.register(GaugeCallback(name, documentation, labelnames, collect))
+        metric.kind = kind
+        return metric
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labelnames, labels, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labelnames, labels, extra)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,191 @@
+"""
+Server-side store for the Daily Prediction Challenge: submitted predictions, their scores
+against observed temperatures and per-player leaderboard totals.
+"""
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+# (largest absolute error in °C, points), checked in order; larger errors score nothing.
+POINTS_TABLE = ((0.0, 10), (0.5, 7), (1.0, 5), (1.5, 3), (2.0, 1))
+
+
+def points_for(predicted_max_temp, actual_max_temp):
+    """Points for a prediction, by how far it was from the observed maximum (rounded to 0.1 °C)."""
+    error = round(abs(actual_max_temp - predicted_max_temp), 1)
+    for max_error, points in POINTS_TABLE:
+        if error <= max_error:
+            return points
+    return 0
+
+
+class PredictionStore:
+    """
+    SQLite store of predictions. Predictions and scores are append-only: a prediction is never
+    changed after submission and is scored exactly once. Unscored predictions are also listed in
+    a small `pending` table, so the resolver never scans the full history, and every batch of
+    scores updates the `leaderboard` totals in the same transaction.
+
+    Locations are snapped to the same `grid_deg` cells as the history archive, so predictions
+    for nearby places are resolved from one series of observations.
+    """
+
+    def __init__(self, path, grid_deg=0.1):
+        self.path = path
+        self.grid_deg = grid_deg
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " id INTEGER PRIMARY KEY, player_id TEXT NOT NULL, player_name TEXT NOT NULL,"
+                " city TEXT NOT NULL, latitude REAL NOT NULL, longitude REAL NOT NULL,"
+                " cell_lat INTEGER NOT NULL, cell_lon INTEGER NOT NULL, date TEXT NOT NULL,"
+                " predicted_max_temp REAL NOT NULL, submitted_at TEXT NOT NULL,"
+                " UNIQUE (player_id, cell_lat, cell_lon, date))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                " prediction_id INTEGER PRIMARY KEY, actual_max_temp REAL NOT NULL,"
+                " points INTEGER NOT NULL, resolved_at TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                " cell_lat INTEGER NOT NULL, cell_lon INTEGER NOT NULL, date TEXT NOT NULL, prediction_id INTEGER NOT NULL,"
+                " PRIMARY KEY (cell_lat, cell_lon, date, prediction_id)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leaderboard ("
+                " player_id TEXT PRIMARY KEY, player_name TEXT NOT NULL, predictions INTEGER NOT NULL,"
+                " points INTEGER NOT NULL, total_error REAL NOT NULL, updated_at TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS leaderboard_rank ON leaderboard (points DESC, total_error)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def cell(self, lat, lon):
+        """Returns the integer grid cell for a coordinate."""
+        return round(lat / self.grid_deg), round(lon / self.grid_deg)
+
+    def cell_center(self, cell_lat, cell_lon):
+        """Returns the coordinate of a grid cell."""
+        return round(cell_lat * self.grid_deg, 6), round(cell_lon * self.grid_deg, 6)
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    def add(self, player_id, player_name, city, lat, lon, date, predicted_max_temp):
+        """
+        Stores a prediction for an ISO `date`. Returns it as a dict, or None if the player already
+        predicted that date for the same grid cell.
+        """
+        cell_lat, cell_lon = self.cell(lat, lon)
+        submitted_at = self._now()
+        try:
+            with self._connect() as conn:
+                prediction_id = conn.execute(
+                    "INSERT INTO predictions (player_id, player_name, city, latitude, longitude, cell_lat, cell_lon,"
+                    " date, predicted_max_temp, submitted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (player_id, player_name, city, lat, lon, cell_lat, cell_lon, date, predicted_max_temp, submitted_at),
+                ).lastrowid
+                conn.execute("INSERT INTO pending (cell_lat, cell_lon, date, prediction_id) VALUES (?, ?, ?, ?)",
+                             (cell_lat, cell_lon, date, prediction_id))
+        except sqlite3.IntegrityError:
+            return None
+        return {'id': prediction_id, 'city': city, 'date': date, 'predicted_max_temp': predicted_max_temp,
+                'submitted_on': submitted_at, 'status': 'Pending', 'actual_max_temp': None, 'points': 0}
+
+    def for_player(self, player_id, limit=50):
+        """Returns the player's latest predictions with their scores, newest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT p.id, p.city, p.date, p.predicted_max_temp, p.submitted_at, s.actual_max_temp, s.points"
+                " FROM predictions p LEFT JOIN scores s ON s.prediction_id = p.id"
+                " WHERE p.player_id = ? ORDER BY p.id DESC LIMIT ?",
+                (player_id, limit),
+            ).fetchall()
+        return [{'id': row[0], 'city': row[1], 'date': row[2], 'predicted_max_temp': row[3], 'submitted_on': row[4],
+                 'status': 'Pending' if row[5] is None else 'Checked', 'actual_max_temp': row[5], 'points': row[6] or 0}
+                for row in rows]
+
+    def pending_groups(self, until_date):
+        """
+        Returns (cell_lat, cell_lon, first_date, last_date, count) for the grid cells with unscored
+        predictions dated up to `until_date`, most predictions first.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT cell_lat, cell_lon, MIN(date), MAX(date), COUNT(*) FROM pending WHERE date <= ?"
+                " GROUP BY cell_lat, cell_lon ORDER BY COUNT(*) DESC",
+                (until_date,),
+            ).fetchall()
+
+    def pending_in_cell(self, cell_lat, cell_lon, first_date, last_date):
+        """Returns (prediction_id, date, predicted_max_temp) for a cell's unscored predictions in a date range."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT p.id, p.date, p.predicted_max_temp FROM pending q JOIN predictions p ON p.id = q.prediction_id"
+                " WHERE q.cell_lat = ? AND q.cell_lon = ? AND q.date BETWEEN ? AND ?",
+                (cell_lat, cell_lon, first_date, last_date),
+            ).fetchall()
+
+    def record_scores(self, scores):
+        """
+        Stores (prediction_id, actual_max_temp, points) tuples in one transaction and adds them to the
+        leaderboard. Predictions that are already scored are skipped. Returns the number stored.
+        """
+        if not scores:
+            return 0
+        resolved_at = self._now()
+        with self._connect() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch (prediction_id INTEGER PRIMARY KEY, actual_max_temp REAL, points INTEGER)")
+            conn.execute("DELETE FROM batch")
+            conn.executemany("INSERT OR IGNORE INTO batch VALUES (?, ?, ?)", scores)
+            conn.execute("DELETE FROM batch WHERE prediction_id IN (SELECT prediction_id FROM scores)")
+            stored = conn.execute(
+                "INSERT INTO scores (prediction_id, actual_max_temp, points, resolved_at)"
+                " SELECT prediction_id, actual_max_temp, points, ? FROM batch", (resolved_at,),
+            ).rowcount
+            conn.execute("DELETE FROM pending WHERE (cell_lat, cell_lon, date, prediction_id) IN"
+                         " (SELECT p.cell_lat, p.cell_lon, p.date, p.id FROM batch b JOIN predictions p ON p.id = b.prediction_id)")
+            # The latest name a player submitted under is the one shown.
+            conn.execute(
+                "INSERT INTO leaderboard (player_id, player_name, predictions, points, total_error, updated_at)"
+                " SELECT p.player_id, (SELECT player_name FROM predictions WHERE player_id = p.player_id ORDER BY id DESC LIMIT 1),"
+                " COUNT(*), SUM(b.points), SUM(ABS(b.actual_max_temp - p.predicted_max_temp)), ?"
+                " FROM batch b JOIN predictions p ON p.id = b.prediction_id GROUP BY p.player_id"
+                " ON CONFLICT (player_id) DO UPDATE SET player_name = excluded.player_name,"
+                " predictions = predictions + excluded.predictions, points = points + excluded.points,"
+                " total_error = total_error + excluded.total_error, updated_at = excluded.updated_at",
+                (resolved_at,),
+            )
+            conn.execute("DELETE FROM batch")
+        return stored
+
+    def leaderboard(self, limit=10):
+        """Returns the top players by points (ties: smaller total error first)."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT player_name, predictions, points, total_error FROM leaderboard"
+                " ORDER BY points DESC, total_error LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{'rank': rank, 'player_name': row[0], 'predictions': row[1], 'points': row[2],
+                 'mean_error': round(row[3] / row[1], 2) if row[1] else None}
+                for rank, row in enumerate(rows, start=1)]
+
+    def player_standing(self, player_id):
+        """Returns the player's leaderboard entry with its rank, or None before their first scored prediction."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT player_name, predictions, points, total_error FROM leaderboard WHERE player_id = ?",
+                               (player_id,)).fetchone()
+            if row is None:
+                return None
+            ahead = conn.execute("SELECT COUNT(*) FROM leaderboard WHERE points > ? OR (points = ? AND total_error < ?)",
+                                 (row[2], row[2], row[3])).fetchone()[0]
+        return {'rank': ahead + 1, 'player_name': row[0], 'predictions': row[1], 'points': row[2],
+                'mean_error': round(row[3] / row[1], 2) if row[1] else None}
@@ -0,0 +1,115 @@
+"""
+Call budgets for the upstream services, shared by every outbound call of the process.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+# Priority classes, highest first. Lower classes stop drawing while the bucket is low
+# so the interactive lookups keep headroom.
+INTERACTIVE, SECONDARY, BACKGROUND = 0, 1, 2
+PRIORITY_NAMES = ('interactive', 'secondary', 'background')
+
+
+class QuotaExhaustedError(requests.exceptions.RequestException):
+    """Raised without contacting the upstream when its call budget is used up."""
+
+    def __init__(self, *args, retry_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a `Retry-After` header (delta-seconds or HTTP date), or None if unparsable."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Holds up to `capacity` tokens, refilled at `rate` tokens per second; each upstream call
+    takes one. A call of priority `p` only draws while `reserve[p] * capacity` tokens remain
+    afterwards, and may wait up to `max_wait[p]` seconds for that; otherwise it is refused.
+    Waiting callers reserve their token up front, so queued calls stay `1 / rate` apart.
+
+    `defer(seconds)` empties the bucket until `seconds` from now, e.g. after a 429 with Retry-After.
+    """
+
+    def __init__(self, rate, capacity=1, reserve=(0.0, 0.25, 0.5), max_wait=(2.0, 0.5, 0.0),
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+        self.granted = [0] * len(PRIORITY_NAMES)
+        self.refused = [0] * len(PRIORITY_NAMES)
+        self.deferrals = 0
+
+    @classmethod
+    def per_minute(cls, calls, burst, **kwargs):
+        """A bucket that never lets more than `calls` through in any 60-second window."""
+        burst = min(burst, calls)
+        return cls(rate=(calls - burst) / 60.0, capacity=burst, **kwargs)
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _wait(self, priority):
+        needed = self.reserve[priority] * self.capacity + 1 - self._tokens
+        if needed <= 0:
+            return 0.0
+        return needed / self.rate if self.rate > 0 else float('inf')
+
+    def wait_time(self, priority=INTERACTIVE):
+        """Seconds until a call of `priority` could draw a token."""
+        with self._lock:
+            self._refill(self._clock())
+            return self._wait(priority)
+
+    def acquire(self, priority=INTERACTIVE):
+        """Takes a token, waiting up to `max_wait[priority]` seconds. Returns False if refused."""
+        with self._lock:
+            self._refill(self._clock())
+            wait = self._wait(priority)
+            if wait > self.max_wait[priority]:
+                self.refused[priority] += 1
+                return False
+            self._tokens -= 1
+            self.granted[priority] += 1
+        if wait > 0:
+            self._sleep(wait)
+        return True
+
+    def defer(self, seconds):
+        """Blocks every priority class for `seconds`, after which the bucket refills from empty."""
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+            self.deferrals += 1
+
+    def stats(self):
+        with self._lock:
+            self._refill(self._clock())
+            return {'tokens': round(self._tokens, 2), 'capacity': self.capacity, 'rate_per_min': round(self.rate * 60, 2),
+                    'granted': dict(zip(PRIORITY_NAMES, self.granted)),
+                    'refused': dict(zip(PRIORITY_NAMES, self.refused)), 'deferrals': self.deferrals}
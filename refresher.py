@@ -0,0 +1,186 @@
+"""
+Background refresh of frequently requested cache entries ("stale-while-revalidate").
+"""
+import random
+import threading
+import time
+
+from quota import QuotaExhaustedError
+
+
+class _Tracked:
+    """Decayed request count, reload recipe and failure backoff for one cache key."""
+
+    __slots__ = ('score', 'updated_at', 'loader', 'cacheable', 'pinned', 'failures', 'retry_at')
+
+    def __init__(self, loader, cacheable, now, pinned=False):
+        self.score = 0.0
+        self.updated_at = now
+        self.loader = loader
+        self.cacheable = cacheable
+        self.pinned = pinned
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+class HotKeyRefresher:
+    """
+    Counts requests per cache key with an exponentially decaying score (`half_life` seconds)
+    and, every `interval` seconds, reloads the `top_n` hottest keys that expire within a
+    jittered `lead_time`. Pinned keys are always refreshed regardless of their score, and are
+    also loaded when nothing is cached for them; other keys with nothing cached are left to
+    their next request.
+
+    A reload that raises or leaves no fresh value cached (e.g. a 404 the cache rejects) backs
+    its key off exponentially, from `interval` up to `max_backoff` seconds, so keys that never
+    load do not spend the limiter on every pass.
+
+    Reloads go through `TTLCache.refresh`, so readers keep getting the cached value while a
+    reload runs. Each reload must take a token from `limiter` (a `TokenBucket`); when none is
+    free, or the loader's upstream budget refuses the call, the remaining refreshes wait for
+    the next pass.
+    """
+
+    def __init__(self, cache, top_n=32, lead_time=60.0, interval=5.0, half_life=900.0,
+                 limiter=None, max_tracked=1024, max_backoff=1800.0, logger=None, clock=time.monotonic):
+        self.cache = cache
+        self.top_n = top_n
+        self.lead_time = lead_time
+        self.interval = interval
+        self.half_life = half_life
+        self.limiter = limiter
+        self.max_tracked = max_tracked
+        self.max_backoff = max_backoff
+        self.logger = logger
+        self._clock = clock
+        self._tracked = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.refreshed = 0
+        self.failed = 0
+        self.throttled = 0
+
+    def _decayed(self, entry, now):
+        return entry.score * 0.5 ** ((now - entry.updated_at) / self.half_life)
+
+    def touch(self, key, loader, cacheable=None):
+        """Records a request for `key`; `loader`/`cacheable` are what a refresh will call."""
+        now = self._clock()
+        with self._lock:
+            entry = self._tracked.get(key)
+            if entry is None:
+                if len(self._tracked) >= self.max_tracked:
+                    self._evict_coldest(now)
+                entry = self._tracked[key] = _Tracked(loader, cacheable, now)
+            entry.score = self._decayed(entry, now) + 1.0
+            entry.updated_at = now
+            entry.loader = loader
+            entry.cacheable = cacheable
+
+    def pin(self, key, loader, cacheable=None):
+        """Keeps `key` warm even if it is never requested."""
+        with self._lock:
+            self._tracked[key] = _Tracked(loader, cacheable, self._clock(), pinned=True)
+
+    def _evict_coldest(self, now):
+        unpinned = [(self._decayed(entry, now), key) for key, entry in self._tracked.items() if not entry.pinned]
+        if unpinned:
+            del self._tracked[min(unpinned, key=lambda item: item[0])[1]]
+
+    def hottest(self):
+        """Returns the keys eligible for refresh: every pinned key plus the `top_n` highest scores."""
+        now = self._clock()
+        with self._lock:
+            ranked = sorted(((self._decayed(entry, now), key, entry) for key, entry in self._tracked.items()
+                             if not entry.pinned), key=lambda item: item[0], reverse=True)
+            pinned = [(key, entry) for key, entry in self._tracked.items() if entry.pinned]
+        return pinned + [(key, entry) for _, key, entry in ranked[:self.top_n]]
+
+    def due(self):
+        """Returns (key, entry) pairs among the hottest keys that are about to expire (or pinned and missing)."""
+        due = []
+        now = self._clock()
+        for key, entry in self.hottest():
+            if entry.retry_at > now:
+                continue
+            remaining = self.cache.expires_in(key)
+            if remaining is None:
+                if entry.pinned:
+                    due.append((key, entry))
+            # Spread reloads of entries cached at the same moment over the second half of the lead time.
+            elif remaining <= self.lead_time * random.uniform(0.5, 1.0):
+                due.append((key, entry))
+        return due
+
+    def _back_off(self, entry):
+        with self._lock:
+            entry.failures += 1
+            delay = min(self.max_backoff, self.interval * 2 ** entry.failures)
+            entry.retry_at = self._clock() + delay * random.uniform(0.5, 1.0)
+
+    def run_once(self):
+        """Performs one refresh pass and returns the number of keys reloaded."""
+        refreshed = 0
+        for key, entry in self.due():
+            if self.limiter is not None and not self.limiter.acquire():
+                self.throttled += 1
+                break
+            try:
+                if not self.cache.refresh(key, entry.loader, entry.cacheable):
+                    continue # A request is loading it right now
+            except QuotaExhaustedError:
+                self.throttled += 1
+                break
+            except Exception as e:
+                self.failed += 1
+                self._back_off(entry)
+                if self.logger is not None:
+                    self.logger.warning(f"Background refresh of {key} failed: {e}")
+                continue
+            remaining = self.cache.expires_in(key)
+            if remaining is None or remaining <= 0:
+                self.failed += 1
+                self._back_off(entry)
+                continue
+            entry.failures = 0
+            refreshed += 1
+        self.refreshed += refreshed
+        return refreshed
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"Background refresh pass failed: {e}", exc_info=True)
+            if self._stop.wait(self.interval * random.uniform(0.8, 1.2)):
+                return
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Starts the daemon refresh thread once per process; later calls are no-ops."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='climacast-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout=self.interval * 2)
+
+    def stats(self):
+        with self._lock:
+            tracked = len(self._tracked)
+            pinned = sum(1 for entry in self._tracked.values() if entry.pinned)
+        return {'tracked': tracked, 'pinned': pinned, 'top_n': self.top_n, 'refreshed': self.refreshed,
+                'failed': self.failed, 'throttled': self.throttled, 'running': self.running}
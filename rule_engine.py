@@ -0,0 +1,225 @@
+"""
+Compiled, vectorized forms of the PERFECT_DAY_ACTIVITIES and HEALTH_CONCERNS_BN rule tables.
+
+The rule dicts are compiled once into threshold arrays so that a whole batch of weather
+observations can be scored against every rule in one NumPy pass. Verdicts and reason
+texts match `analyze_activity_conditions` and `check_health_condition_triggers` exactly.
+"""
+import numpy as np
+
+# Activity check kinds, in the order analyze_activity_conditions applies them.
+NO_CHECK, AVOID_MAIN, EXTREME_HEAT, STRONG_WIND, REQUIRE, BELOW_IDEAL, ABOVE_IDEAL, BELOW_ABS, TOO_WINDY, TOO_HUMID = range(10)
+# Outcome value for an activity whose checks all pass.
+FAVORABLE = -1
+
+_HEAVY_RAIN_WORDS = ("heavy", "extreme", "shower")
+
+
+def _main_codes(weather_mains, vocabulary):
+    """Integer code of each weather_main (case-insensitive) in `vocabulary`, or -1 if unknown."""
+    lowered = np.char.lower(np.asarray(weather_mains, dtype=str))
+    unique, inverse = np.unique(lowered, return_inverse=True)
+    unique_codes = np.array([vocabulary.get(name, -1) for name in unique], dtype=np.int64)
+    return unique_codes[inverse].reshape(lowered.shape)
+
+
+class ActivityRuleSet:
+    """
+    PERFECT_DAY_ACTIVITIES compiled to a (rules x checks) table of check kinds, thresholds
+    and condition codes. `evaluate` returns, per sample and rule, the index of the first
+    failing check (or FAVORABLE), which `reason` turns into the same text as
+    analyze_activity_conditions.
+    """
+
+    def __init__(self, activities):
+        self.keys = list(activities)
+        self.prefs = [activities[key] for key in self.keys]
+        self.display_names = [prefs.get("display_name", key.capitalize()) for key, prefs in zip(self.keys, self.prefs)]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+
+        names = set()
+        for prefs in self.prefs:
+            names.update(c.lower() for c in prefs.get("avoid_conditions", []))
+            names.update(c.lower() for c in prefs.get("require_conditions", []))
+        self.vocabulary = {name: code for code, name in enumerate(sorted(names))}
+
+        checks = [self._compile_checks(prefs) for prefs in self.prefs]
+        width = max(1, max(len(rule_checks) for rule_checks in checks))
+        self.kind = np.full((len(checks), width), NO_CHECK, dtype=np.int8)
+        self.threshold = np.full((len(checks), width), np.nan)
+        self.code = np.full((len(checks), width), -2, dtype=np.int64)
+        self.mask = np.zeros((len(checks), width), dtype=np.int64)
+        for r, rule_checks in enumerate(checks):
+            for k, (kind, threshold, code, mask) in enumerate(rule_checks):
+                self.kind[r, k] = kind
+                self.threshold[r, k] = threshold
+                self.code[r, k] = code
+                self.mask[r, k] = mask
+        self._temp_above = np.isin(self.kind, (EXTREME_HEAT, ABOVE_IDEAL))
+        self._temp_below = np.isin(self.kind, (BELOW_IDEAL, BELOW_ABS))
+        self._wind_above = np.isin(self.kind, (STRONG_WIND, TOO_WINDY))
+        self._humid_above = self.kind == TOO_HUMID
+        self._avoid = self.kind == AVOID_MAIN
+        self._require = self.kind == REQUIRE
+
+    def _compile_checks(self, prefs):
+        checks = []
+        for condition in prefs.get("avoid_conditions", []):
+            checks.append((AVOID_MAIN, np.nan, self.vocabulary[condition.lower()], 0))
+            if condition == "Extreme Heat":
+                checks.append((EXTREME_HEAT, prefs.get("temp_range_c", (0, 100))[1] + 5, -2, 0))
+            if condition == "Strong Wind":
+                checks.append((STRONG_WIND, prefs.get("max_wind_kmh", 100) + 10, -2, 0))
+        required = prefs.get("require_conditions", [])
+        if required:
+            # Met only when every required condition equals the current one.
+            mask = 0
+            for condition in required:
+                mask |= 1 << self.vocabulary[condition.lower()]
+            checks.append((REQUIRE, np.nan, -2, mask))
+        min_temp_ideal, max_temp_ideal = prefs.get("temp_range_c", (None, None))
+        if min_temp_ideal is not None: checks.append((BELOW_IDEAL, min_temp_ideal, -2, 0))
+        if max_temp_ideal is not None: checks.append((ABOVE_IDEAL, max_temp_ideal, -2, 0))
+        if prefs.get("min_temp_c") is not None: checks.append((BELOW_ABS, prefs["min_temp_c"], -2, 0))
+        if prefs.get("max_wind_kmh") is not None: checks.append((TOO_WINDY, prefs["max_wind_kmh"], -2, 0))
+        if prefs.get("max_humidity_percent") is not None: checks.append((TOO_HUMID, prefs["max_humidity_percent"], -2, 0))
+        return checks
+
+    def _failures(self, temperature, wind_speed_kmh, humidity, weather_main):
+        """(N, rules, checks) bool array of which checks each observation fails."""
+        temp = np.asarray(temperature, dtype=np.float64)[:, None, None]
+        wind = np.asarray(wind_speed_kmh, dtype=np.float64)[:, None, None]
+        humid = np.asarray(humidity, dtype=np.float64)[:, None, None]
+        codes = _main_codes(weather_main, self.vocabulary)
+        bits = np.where(codes >= 0, np.left_shift(1, np.maximum(codes, 0)), 0)[:, None, None]
+        codes = codes[:, None, None]
+        return ((self._avoid & (codes == self.code))
+                | (self._require & (bits != self.mask))
+                | (self._temp_above & (temp > self.threshold))
+                | (self._temp_below & (temp < self.threshold))
+                | (self._wind_above & (wind > self.threshold))
+                | (self._humid_above & (humid > self.threshold)))
+
+    def evaluate(self, temperature, wind_speed_kmh, humidity, weather_main):
+        """
+        Scores N observations against every rule. Inputs are length-N sequences.
+        Returns an (N, rules) int array: the failing check index per rule, or FAVORABLE.
+        """
+        fails = self._failures(temperature, wind_speed_kmh, humidity, weather_main)
+        return np.where(fails.any(axis=2), fails.argmax(axis=2), FAVORABLE)
+
+    def score(self, temperature, wind_speed_kmh, humidity, weather_main):
+        """
+        Like `evaluate`, but also returns an (N, rules) float array grading each observation
+        from 0 (every check fails) to 1 (favorable) by the share of the rule's checks it passes.
+        """
+        fails = self._failures(temperature, wind_speed_kmh, humidity, weather_main)
+        outcome = np.where(fails.any(axis=2), fails.argmax(axis=2), FAVORABLE)
+        checks_per_rule = np.maximum((self.kind != NO_CHECK).sum(axis=1), 1)
+        return outcome, 1.0 - fails.sum(axis=2) / checks_per_rule
+
+    def evaluate_samples(self, samples):
+        """`evaluate` over a list of current_weather dicts as passed to analyze_activity_conditions."""
+        return self.evaluate([s['temperature'] for s in samples], [s['wind_speed_kmh'] for s in samples],
+                             [s['humidity'] for s in samples], [s['weather_main'] for s in samples])
+
+    def reason(self, rule_index, outcome, current_weather):
+        """The analyze_activity_conditions text for one rule's outcome on one observation."""
+        name = self.display_names[rule_index]
+        prefs = self.prefs[rule_index]
+        if outcome == FAVORABLE:
+            return f"{name}: Current conditions are favorable."
+        kind = self.kind[rule_index, outcome]
+        temp_c = current_weather['temperature']
+        wind_kmh = current_weather['wind_speed_kmh']
+        weather_main = current_weather['weather_main']
+        if kind == AVOID_MAIN: return f"{name}: Unsuitable due to current {weather_main.lower()} conditions."
+        if kind == EXTREME_HEAT: return f"{name}: Unsuitable due to extreme heat ({temp_c}°C)."
+        if kind == STRONG_WIND: return f"{name}: Unsuitable due to strong winds ({wind_kmh} km/h)."
+        if kind == REQUIRE: return f"{name}: Current weather ({weather_main}) does not meet required conditions (e.g., requires {', '.join(prefs['require_conditions'])})."
+        min_temp_ideal, max_temp_ideal = prefs.get("temp_range_c", (None, None))
+        if kind == BELOW_IDEAL: return f"{name}: Current temperature ({temp_c}°C) is below the ideal range of {min_temp_ideal}-{max_temp_ideal}°C."
+        if kind == ABOVE_IDEAL: return f"{name}: Current temperature ({temp_c}°C) is above the ideal range of {min_temp_ideal}-{max_temp_ideal}°C."
+        if kind == BELOW_ABS: return f"{name}: Current temperature ({temp_c}°C) is too cold (below {prefs['min_temp_c']}°C)."
+        if kind == TOO_WINDY: return f"{name}: It's currently too windy ({wind_kmh} km/h, max {prefs['max_wind_kmh']} km/h)."
+        return f"{name}: Humidity ({current_weather['humidity']}%) is too high (max {prefs['max_humidity_percent']}%)."
+
+
+class HealthRuleSet:
+    """
+    HEALTH_CONCERNS_BN triggers compiled to per-concern threshold arrays (NaN where a
+    trigger is absent). `evaluate` returns the same booleans as check_health_condition_triggers.
+    """
+
+    # How the humidity trigger is gated, mirroring check_health_condition_triggers.
+    HUMIDITY_OFF, HUMIDITY_IF_HOT, HUMIDITY_IF_COLD, HUMIDITY_ALWAYS = range(4)
+
+    def __init__(self, concerns):
+        self.keys = list(concerns)
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        n = len(self.keys)
+        self.low_temp = np.full(n, np.nan)
+        self.high_temp = np.full(n, np.nan)
+        self.high_feels_like = np.full(n, np.nan)
+        self.extreme_temp = np.full(n, np.nan)
+        self.humidity = np.full(n, np.nan)
+        self.humidity_mode = np.full(n, self.HUMIDITY_OFF, dtype=np.int8)
+        self.humidity_temp = np.full(n, np.nan)
+        self.heavy_rain = np.zeros(n, dtype=bool)
+        self.moderate_min = np.full(n, -np.inf)
+        self.moderate_max = np.full(n, np.inf)
+        for i, key in enumerate(self.keys):
+            triggers = concerns[key]["triggers"]
+            if "low_temp_c" in triggers: self.low_temp[i] = triggers["low_temp_c"]
+            if "high_temp_c" in triggers: self.high_temp[i] = triggers["high_temp_c"]
+            if "high_feels_like_c" in triggers: self.high_feels_like[i] = triggers["high_feels_like_c"]
+            if "high_temp_c_extreme" in triggers: self.extreme_temp[i] = triggers["high_temp_c_extreme"]
+            if "high_humidity_thresh_percent" in triggers:
+                self.humidity[i] = triggers["high_humidity_thresh_percent"]
+                if "temp_thresh_for_humidity_check_c" in triggers:
+                    self.humidity_mode[i] = self.HUMIDITY_IF_HOT
+                    self.humidity_temp[i] = triggers["temp_thresh_for_humidity_check_c"]
+                elif "low_temp_c" in triggers:
+                    self.humidity_mode[i] = self.HUMIDITY_IF_COLD
+                else:
+                    self.humidity_mode[i] = self.HUMIDITY_ALWAYS
+            if triggers.get("recent_heavy_rain"):
+                self.heavy_rain[i] = True
+                if "moderate_temp_c" in triggers:
+                    self.moderate_min[i], self.moderate_max[i] = triggers["moderate_temp_c"]
+
+    def evaluate(self, temperature, feels_like, humidity, weather_main, description):
+        """Scores N observations against every concern. Returns an (N, concerns) bool array."""
+        temp = np.asarray(temperature, dtype=np.float64)[:, None]
+        feels = np.asarray(feels_like, dtype=np.float64)[:, None]
+        humid = np.asarray(humidity, dtype=np.float64)[:, None]
+        mains = np.char.lower(np.asarray(weather_main, dtype=str))
+        descriptions = np.char.lower(np.asarray(description, dtype=str))
+        heavy = np.zeros(descriptions.shape, dtype=bool)
+        for word in _HEAVY_RAIN_WORDS:
+            heavy |= np.char.find(descriptions, word) >= 0
+        raining_heavily = ((np.char.find(mains, "rain") >= 0) & heavy)[:, None]
+
+        humidity_gate = ((self.humidity_mode == self.HUMIDITY_ALWAYS)
+                         | ((self.humidity_mode == self.HUMIDITY_IF_HOT) & (temp > self.humidity_temp))
+                         | ((self.humidity_mode == self.HUMIDITY_IF_COLD) & (temp < self.low_temp)))
+        return ((temp < self.low_temp)
+                | (temp > self.high_temp)
+                | (feels > self.high_feels_like)
+                | (temp > self.extreme_temp)
+                | ((humid > self.humidity) & humidity_gate)
+                | (self.heavy_rain & raining_heavily & (temp >= self.moderate_min) & (temp <= self.moderate_max)))
+
+    def evaluate_samples(self, samples):
+        """`evaluate` over a list of current_weather dicts as passed to check_health_condition_triggers."""
+        return self.evaluate([s['temperature'] for s in samples], [s['feels_like'] for s in samples],
+                             [s['humidity'] for s in samples], [s['weather_main'] for s in samples],
+                             [s['description'] for s in samples])
+
+
+def compile_activity_rules(activities):
+    return ActivityRuleSet(activities)
+
+
+def compile_health_rules(concerns):
+    return HealthRuleSet(concerns)
@@ -4,6 +4,8 @@
 let currentCityName = '';
 let currentLatitude = null;
 let currentLongitude = null;
+// History returned with the last /api/city_dashboard response, reused by the history button.
+let prefetchedHistory = null;
 
 // Initialize Leaflet map and set default view
 var map = L.map('map').setView([0, 0], 2);
@@ -246,11 +248,13 @@ function updateWeatherDisplay(weatherData) {
 }
 
 // --- AI Weather Summary Functions ---
-async function getAiWeatherSummary(promptText) {
-    const response = await fetch('/api/generate-summary', {
+// Streams the summary from the server as Server-Sent Events, calling onText with the text received so far.
+async function getAiWeatherSummary(promptText, onText) {
+    const response = await fetch('/api/generate-summary/stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
         },
         body: JSON.stringify({ prompt: promptText }),
     });
@@ -258,8 +262,34 @@ async function getAiWeatherSummary(promptText) {
         const errorData = await response.json().catch(() => ({})); // Catch if error response is not JSON
         throw new Error(errorData.error || `AI summary generation failed: ${response.statusText}`);
     }
-    const data = await response.json();
-    return data.summary;
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let summary = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventName = 'message';
+            let dataText = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataText += line.slice(5).trim();
+            });
+            if (!dataText) continue;
+            const payload = JSON.parse(dataText);
+            if (eventName === 'error') throw new Error(payload.error || 'AI summary generation failed.');
+            if (eventName === 'done') return payload.summary;
+            summary += payload.text || '';
+            if (onText) onText(summary);
+        }
+    }
+    return summary;
 }
 
 function displayAiSummary(summaryText) {
@@ -383,69 +413,107 @@ function hideFeelsLikeData() {
 // --- End Feels Like Explanation Functions ---
 
 // --- Daily Prediction Challenge Logic ---
-function displayStoredPredictions() { 
-    if (!predictionsListEl) return;
-    predictionsListEl.innerHTML = ''; 
-    let predictions = JSON.parse(localStorage.getItem('weatherPredictions')) || [];
-    if (predictions.length === 0) {
-        predictionsListEl.innerHTML = '<p class="no-predictions-text">No predictions made yet. Make your first one!</p>';
-        return;
+// Predictions live on the server and are scored nightly against observed temperatures; the
+// browser only keeps the random id they are filed under.
+function getPlayerId() {
+    let playerId = localStorage.getItem('weatherPlayerId');
+    if (!playerId) {
+        playerId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+            : Date.now().toString(36) + Math.random().toString(36).slice(2, 12);
+        localStorage.setItem('weatherPlayerId', playerId);
+        localStorage.removeItem('weatherPredictions'); // Locally "resolved" predictions from older versions
     }
+    return playerId;
+}
 
-    predictions.sort((a, b) => {
-        if (a.status === 'Pending' && b.status !== 'Pending') return -1;
-        if (a.status !== 'Pending' && b.status === 'Pending') return 1;
-        return new Date(b.submitted_on) - new Date(a.submitted_on);
-    });
+function renderPredictionItem(prediction, today) {
+    const item = document.createElement('div');
+    item.classList.add('prediction-item', `prediction-status-${prediction.status.toLowerCase()}`);
 
-    const today = getFormattedDate(new Date());
-    let needsStorageUpdate = false;
-
-    predictions.forEach(prediction => {
-        if (prediction.date < today && prediction.status === 'Pending') { 
-            prediction.actual_max_temp = parseFloat((prediction.predicted_max_temp - (Math.random() * 4 - 2)).toFixed(1));
-            const diff = Math.abs(prediction.actual_max_temp - prediction.predicted_max_temp);
-            if (diff === 0) prediction.points = 10;
-            else if (diff <= 0.5) prediction.points = 7;
-            else if (diff <= 1.0) prediction.points = 5;
-            else if (diff <= 1.5) prediction.points = 3;
-            else if (diff <= 2.0) prediction.points = 1;
-            else prediction.points = 0;
-            prediction.status = 'Checked';
-            needsStorageUpdate = true;
-        }
+    let actualTempDisplay = 'Pending';
+    if (prediction.status === 'Checked') {
+        actualTempDisplay = `${prediction.actual_max_temp !== null ? prediction.actual_max_temp + '&deg;C' : 'N/A'}`;
+    } else if (prediction.date < today) {
+        actualTempDisplay = 'Awaiting update...';
+    }
 
-        const item = document.createElement('div');
-        item.classList.add('prediction-item', `prediction-status-${prediction.status.toLowerCase()}`);
-        
-        let actualTempDisplay = 'Pending';
-        if (prediction.status === 'Checked') {
-            actualTempDisplay = `${prediction.actual_max_temp !== null ? prediction.actual_max_temp + '&deg;C' : 'N/A'}`;
-        } else if (prediction.date < today && prediction.status === 'Pending') {
-            actualTempDisplay = 'Awaiting update...';
+    item.innerHTML = `
+        <div class="prediction-meta">
+            <span class="prediction-city"></span> - 
+            <span class="prediction-date">Forecast for: ${prediction.date}</span>
+        </div>
+        <div class="prediction-values">
+            <span>Predicted: ${prediction.predicted_max_temp}&deg;C</span>
+            <span>Actual: ${actualTempDisplay}</span>
+        </div>
+        <div class="prediction-result">
+            <span class="prediction-status-text">Status: ${prediction.status}</span>
+            <span class="prediction-points">Points: ${prediction.points}</span>
+        </div>
+        <small class="prediction-submitted-on">Submitted: ${new Date(prediction.submitted_on).toLocaleDateString()} ${new Date(prediction.submitted_on).toLocaleTimeString()}</small>
+    `;
+    item.querySelector('.prediction-city').textContent = prediction.city;
+    return item;
+}
+
+function displayLeaderboard(standing) {
+    const leaderboardListEl = document.getElementById('prediction-leaderboard-list');
+    if (!leaderboardListEl) return;
+    fetch('/api/predictions/leaderboard?limit=10')
+    .then(response => {
+        if (!response.ok) throw new Error(`Leaderboard request failed: ${response.status}`);
+        return response.json();
+    })
+    .then(data => {
+        leaderboardListEl.innerHTML = '';
+        const entries = data.leaderboard || [];
+        if (entries.length === 0) {
+            leaderboardListEl.innerHTML = '<li class="no-predictions-text">No predictions have been scored yet.</li>';
+            return;
+        }
+        const describe = entry => `${entry.player_name}: ${entry.points} pts (${entry.predictions} predictions, ±${entry.mean_error}°C)`;
+        entries.forEach(entry => {
+            const item = document.createElement('li');
+            item.textContent = describe(entry);
+            if (standing && entry.rank === standing.rank && entry.player_name === standing.player_name) item.classList.add('own-standing');
+            leaderboardListEl.appendChild(item);
+        });
+        if (standing && standing.rank > entries.length) {
+            const item = document.createElement('li');
+            item.value = standing.rank;
+            item.classList.add('own-standing');
+            item.textContent = describe(standing);
+            leaderboardListEl.appendChild(item);
         }
+    })
+    .catch(error => console.warn('Could not load the leaderboard:', error));
+}
 
-        item.innerHTML = `
-            <div class="prediction-meta">
-                <span class="prediction-city">${prediction.city}</span> - 
-                <span class="prediction-date">Forecast for: ${prediction.date}</span>
-            </div>
-            <div class="prediction-values">
-                <span>Predicted: ${prediction.predicted_max_temp}&deg;C</span>
-                <span>Actual: ${actualTempDisplay}</span>
-            </div>
-            <div class="prediction-result">
-                <span class="prediction-status-text">Status: ${prediction.status}</span>
-                <span class="prediction-points">Points: ${prediction.points}</span>
-            </div>
-            <small class="prediction-submitted-on">Submitted: ${new Date(prediction.submitted_on).toLocaleDateString()} ${new Date(prediction.submitted_on).toLocaleTimeString()}</small>
-        `;
-        predictionsListEl.appendChild(item);
+function displayStoredPredictions() { 
+    if (!predictionsListEl) return;
+    fetch(`/api/predictions?player_id=${encodeURIComponent(getPlayerId())}`)
+    .then(response => {
+        if (!response.ok) throw new Error(`Predictions request failed: ${response.status}`);
+        return response.json();
+    })
+    .then(data => {
+        predictionsListEl.innerHTML = '';
+        const predictions = data.predictions || [];
+        if (predictions.length === 0) {
+            predictionsListEl.innerHTML = '<p class="no-predictions-text">No predictions made yet. Make your first one!</p>';
+        } else {
+            // Pending first, then newest first (the server returns newest first).
+            const today = getFormattedDate(new Date());
+            predictions
+                .filter(p => p.status === 'Pending').concat(predictions.filter(p => p.status !== 'Pending'))
+                .forEach(prediction => predictionsListEl.appendChild(renderPredictionItem(prediction, today)));
+        }
+        displayLeaderboard(data.standing);
+    })
+    .catch(error => {
+        console.error('Could not load predictions:', error);
+        predictionsListEl.innerHTML = '<p class="no-predictions-text">Could not load your predictions right now.</p>';
     });
-
-    if (needsStorageUpdate) {
-        localStorage.setItem('weatherPredictions', JSON.stringify(predictions));
-    }
 }
 
 // --- Weather History On This Day Logic ---
@@ -467,6 +535,9 @@ if (getHistoryBtnEl) {
         this.textContent = 'Fetching...';
         const button = this; // Store reference to button
 
+        const usePrefetched = prefetchedHistory && prefetchedHistory.date === currentDateStr &&
+            prefetchedHistory.latitude === currentLatitude && prefetchedHistory.longitude === currentLongitude;
+        const historyRequest = usePrefetched ? Promise.resolve(prefetchedHistory.data) :
         fetch(`/api/weather_history_on_this_day?latitude=${currentLatitude}&longitude=${currentLongitude}&current_date=${currentDateStr}`)
         .then(response => {
             if (!response.ok) { 
@@ -477,7 +548,8 @@ if (getHistoryBtnEl) {
                 });
             }
             return response.json();
-        })
+        });
+        historyRequest
         .then(data => {
             if (historicalDisplayAreaEl) historicalDisplayAreaEl.innerHTML = ''; // Clear loading
 
@@ -549,6 +621,41 @@ document.addEventListener('DOMContentLoaded', () => {
 });
 
 
+// --- City autocomplete (served from the local gazetteer, no third-party calls) ---
+const cityInputEl = document.getElementById('city-input');
+const citySuggestionsEl = document.getElementById('city-suggestions');
+let autocompleteTimer = null;
+let autocompleteController = null;
+
+function fetchCitySuggestions(text, limit = 8) {
+    if (autocompleteController) autocompleteController.abort();
+    autocompleteController = new AbortController();
+    return fetch(`/api/cities/autocomplete?q=${encodeURIComponent(text)}&limit=${limit}`, { signal: autocompleteController.signal })
+        .then(response => response.ok ? response.json() : { suggestions: [] })
+        .then(data => data.suggestions || []);
+}
+
+if (cityInputEl && citySuggestionsEl) {
+    cityInputEl.addEventListener('input', function() {
+        const text = cityInputEl.value.trim();
+        clearTimeout(autocompleteTimer);
+        if (text.length < 2 || text.toLowerCase() === 'geolocation') { citySuggestionsEl.innerHTML = ''; return; }
+        autocompleteTimer = setTimeout(() => {
+            fetchCitySuggestions(text)
+                .then(suggestions => {
+                    citySuggestionsEl.innerHTML = '';
+                    suggestions.forEach(place => {
+                        const option = document.createElement('option');
+                        option.value = place.name;
+                        option.label = place.country ? `${place.name}, ${place.country}` : place.name;
+                        citySuggestionsEl.appendChild(option);
+                    });
+                })
+                .catch(error => { if (error.name !== 'AbortError') console.warn('City suggestions failed:', error); });
+        }, 120);
+    });
+}
+
 // --- Event listener for general weather search form submission ---
 const searchForm = document.getElementById('search-form');
 if (searchForm) {
@@ -565,16 +672,19 @@ if (searchForm) {
                 navigator.geolocation.getCurrentPosition(function(position) {
                     var latitude = position.coords.latitude;
                     var longitude = position.coords.longitude;
-                    fetch(`https://nominatim.openstreetmap.org/reverse?format=json&lat=${latitude}&lon=${longitude}`)
+                    // The nearest city comes from the server's local gazetteer; weather is then looked up
+                    // by that city's coordinates, so no name has to be geocoded again.
+                    fetch(`/api/cities/reverse?latitude=${latitude}&longitude=${longitude}`)
                     .then(response => {
-                        if (!response.ok) throw new Error(`Nominatim reverse geocoding failed: ${response.status}`);
+                        if (response.status === 404) return null;
+                        if (!response.ok) throw new Error(`Reverse geocoding failed: ${response.status}`);
                         return response.json();
                     })
                     .then(data => {
-                        const foundCity = data.address?.city || data.address?.town || data.address?.village;
-                        if (foundCity) {
-                            document.getElementById('city-input').value = foundCity;
-                            getWeather(foundCity);
+                        const place = data && data.city;
+                        if (place) {
+                            document.getElementById('city-input').value = place.name;
+                            getWeather(place.name, { latitude: place.latitude, longitude: place.longitude });
                         } else {
                             displayError("Could not determine city from your location. Please enter manually.");
                         }
@@ -586,8 +696,15 @@ if (searchForm) {
     });
 }
 
-function getWeather(city) {
-    fetch(`/api/weather?city=${encodeURIComponent(city)}`)
+function getWeather(city, coords) {
+    // One round trip for the conditions and the "on this day" history. With `coords` the lookup is
+    // by coordinate and `city` is only the name to display.
+    const currentDateStr = getFormattedDate(new Date());
+    prefetchedHistory = null;
+    const location = coords
+        ? `latitude=${coords.latitude}&longitude=${coords.longitude}`
+        : `city=${encodeURIComponent(city)}`;
+    fetch(`/api/city_dashboard?${location}&sections=weather,history&current_date=${currentDateStr}`)
     .then(response => {
         if (!response.ok) {
             return response.json().then(errData => { throw new Error(errData.error || `Weather service error (Status: ${response.status})`); })
@@ -595,9 +712,14 @@ function getWeather(city) {
         }
         return response.json();
     })
-    .then(weatherData => {
-        if (weatherData.error) { displayError(weatherData.error); return; }
-        
+    .then(dashboard => {
+        if (dashboard.error) { displayError(dashboard.error); return; }
+        const weatherData = dashboard.weather;
+        if (coords) weatherData.city = city;
+        if (dashboard.history && !dashboard.history.error) {
+            prefetchedHistory = { date: currentDateStr, latitude: weatherData.latitude, longitude: weatherData.longitude, data: dashboard.history };
+        }
+
         updateWeatherDisplay(weatherData);
 
         // After main weather data is displayed, fetch and display AI summary
@@ -615,7 +737,7 @@ function getWeather(city) {
         if (aiSummaryTextEl) aiSummaryTextEl.textContent = 'Generating AI summary...'; // Placeholder
         if (aiSummaryCardEl) aiSummaryCardEl.style.display = 'block';
 
-        getAiWeatherSummary(prompt)
+        getAiWeatherSummary(summaryPrompt, partialSummary => displayAiSummary(partialSummary))
             .then(aiSummary => {
                 if (aiSummary && aiSummary.trim() !== "") {
                     displayAiSummary(aiSummary);
@@ -673,19 +795,19 @@ function getWeather(city) {
              marker.setLatLng([weatherData.latitude, weatherData.longitude]);
              updatePopup(weatherData);
         } else {
-            fetch(`https://nominatim.openstreetmap.org/search?city=${encodeURIComponent(city)}&format=json&limit=1`)
-            .then(response => { if (!response.ok) throw new Error(`Nominatim search failed: ${response.status}`); return response.json(); })
+            fetch(`/api/cities/autocomplete?q=${encodeURIComponent(city)}&limit=1`)
+            .then(response => { if (!response.ok) throw new Error(`City lookup failed: ${response.status}`); return response.json(); })
             .then(geoData => {
-                if (geoData && geoData.length > 0) {
-                    var lat = parseFloat(geoData[0].lat); var lon = parseFloat(geoData[0].lon);
+                if (geoData.suggestions && geoData.suggestions.length > 0) {
+                    var lat = geoData.suggestions[0].latitude; var lon = geoData.suggestions[0].longitude;
                     map.setView([lat, lon], 10); marker.setLatLng([lat, lon]);
                     updatePopup(weatherData); 
                 } else {
-                    console.warn(`Could not find coordinates for city: ${city} via Nominatim.`);
+                    console.warn(`Could not find coordinates for city: ${city}.`);
                     updatePopup(weatherData); 
                 }
             })
-            .catch(error => { console.error('Nominatim API error:', error); updatePopup(weatherData); });
+            .catch(error => { console.error('City lookup error:', error); updatePopup(weatherData); });
         }
     })
     .catch(error => { displayError(error.message); console.error('Get weather error:', error); });
@@ -876,21 +998,23 @@ if (submitPredictionBtnEl) {
             return; 
         }
         const tomorrowsDate = getTomorrowsDateString();
-        let predictions = JSON.parse(localStorage.getItem('weatherPredictions')) || [];
-        const existingPrediction = predictions.find(p => p.city === currentCityName && p.date === tomorrowsDate);
-        if (existingPrediction) { 
-            displayAppFeedback(predictionFeedbackMsgEl, `Prediction already made for ${currentCityName} for tomorrow (${tomorrowsDate}).`, 'error'); 
-            return; 
-        }
-        const newPrediction = {
-            id: Date.now().toString(), city: currentCityName, date: tomorrowsDate,
-            predicted_max_temp: predictedTemp, actual_max_temp: null,
-            submitted_on: new Date().toISOString(), status: 'Pending', points: 0
-        };
-        predictions.push(newPrediction);
-        localStorage.setItem('weatherPredictions', JSON.stringify(predictions));
-        displayAppFeedback(predictionFeedbackMsgEl, `Prediction for ${currentCityName} (${predictedTemp}°C for ${tomorrowsDate}) submitted!`, 'success');
-        if (maxTempPredictionInputEl) maxTempPredictionInputEl.value = '';
-        displayStoredPredictions();
+        submitPredictionBtnEl.disabled = true;
+        fetch('/api/predictions', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                player_id: getPlayerId(), city: currentCityName, latitude: currentLatitude, longitude: currentLongitude,
+                date: tomorrowsDate, predicted_max_temp: predictedTemp
+            })
+        })
+        .then(response => response.json().then(data => ({ ok: response.ok, data })))
+        .then(({ ok, data }) => {
+            if (!ok) { displayAppFeedback(predictionFeedbackMsgEl, data.error || 'Could not submit your prediction.', 'error'); return; }
+            displayAppFeedback(predictionFeedbackMsgEl, `Prediction for ${currentCityName} (${predictedTemp}°C for ${tomorrowsDate}) submitted!`, 'success');
+            if (maxTempPredictionInputEl) maxTempPredictionInputEl.value = '';
+            displayStoredPredictions();
+        })
+        .catch(error => { displayAppFeedback(predictionFeedbackMsgEl, 'Could not submit your prediction. Please try again.', 'error'); console.error(error); })
+        .finally(() => { submitPredictionBtnEl.disabled = !currentCityName; });
     });
 }
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Importing app creates its on-disk stores and may start background work; keep both out of the way.
+os.environ.setdefault('CLIMACAST_INSTANCE_DIR', tempfile.mkdtemp(prefix='climacast-tests-'))
+os.environ.setdefault('WEATHER_REFRESH_ENABLED', 'false')
+os.environ.setdefault('GAZETTEER_ENABLED', 'false')
@@ -0,0 +1,47 @@
+import pytest
+
+import app as climacast
+
+PROMPT = 'Summarize: 31°C, humid, light wind in Dhaka.'
+FEELS_LIKE = {'temp': 31.0, 'feels_like': 38.0, 'wind_speed': 2.0, 'humidity': 80, 'description': 'haze'}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A client with no Gemini key and an SDK that fails to load."""
+    def unavailable():
+        raise ImportError('google.generativeai is not installed')
+
+    monkeypatch.delenv('GEMINI_API_KEY', raising=False)
+    monkeypatch.setattr(climacast, 'get_gemini_model', unavailable)
+    climacast.ai_response_cache.clear()
+    yield climacast.app.test_client()
+    climacast.ai_response_cache.clear()
+
+
+def test_cached_summary_needs_no_model(client):
+    climacast.ai_response_cache.set(climacast.summary_cache_key(PROMPT), 'Hot and sticky.')
+    response = client.post('/api/generate-summary', json={'prompt': PROMPT})
+    assert response.status_code == 200
+    assert response.get_json() == {'summary': 'Hot and sticky.'}
+
+
+def test_cached_summary_streams_without_model(client):
+    climacast.ai_response_cache.set(climacast.summary_cache_key(PROMPT), 'Hot and sticky.')
+    response = client.post('/api/generate-summary/stream', json={'prompt': PROMPT})
+    assert response.status_code == 200
+    assert 'event: done' in response.get_data(as_text=True)
+
+
+def test_cached_explanation_needs_no_model(client):
+    key = climacast.feels_like_cache_key(*(FEELS_LIKE[name] for name in ('temp', 'feels_like', 'wind_speed', 'humidity', 'description')))
+    climacast.ai_response_cache.set(key, 'Humidity slows sweat evaporation.')
+    response = client.post('/api/explain-feels-like', json=FEELS_LIKE)
+    assert response.status_code == 200
+    assert response.get_json() == {'explanation': 'Humidity slows sweat evaporation.'}
+
+
+def test_miss_without_key_is_reported(client):
+    response = client.post('/api/generate-summary', json={'prompt': PROMPT})
+    assert response.status_code == 500
+    assert 'not configured' in response.get_json()['error']
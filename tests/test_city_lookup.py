@@ -0,0 +1,109 @@
+import pytest
+import requests
+
+import app as climacast
+from gazetteer import Gazetteer
+from geocode_store import GeocodeStore
+
+PLACES = [
+    {'name': 'Dhaka', 'country': 'BD', 'latitude': 23.7104, 'longitude': 90.40744, 'population': 10356500},
+    {'name': 'Sylhet', 'country': 'BD', 'latitude': 24.89904, 'longitude': 91.87198, 'population': 237000},
+    {'name': 'Chittagong', 'country': 'BD', 'latitude': 22.3384, 'longitude': 91.83168, 'population': 3920222,
+     'alternate_names': ['Chattogram']},
+]
+KNOWN_TO_OWM = {'dhaka', 'sylhet'}
+
+
+class FakeResponse:
+    def __init__(self, payload, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Client Error", response=self)
+
+
+def owm_payload(name, lat, lon):
+    return {'cod': 200, 'name': name, 'coord': {'lat': lat, 'lon': lon},
+            'main': {'temp': 30.0, 'feels_like': 34.0, 'humidity': 70, 'pressure': 1005},
+            'weather': [{'id': 800, 'main': 'Clear', 'description': 'clear sky'}], 'wind': {'speed': 3.0}}
+
+
+@pytest.fixture
+def upstream(monkeypatch, tmp_path):
+    """Stubs OWM and Nominatim, with an empty gazetteer-backed lookup state; returns the calls made."""
+    calls = []
+
+    def get(url, params=None, headers=None, timeout=None, priority=None):
+        if url == climacast.NOMINATIM_BASE_URL:
+            calls.append(('nominatim', params['q']))
+            return FakeResponse([{'lat': '21.82', 'lon': '90.12'}] if params['q'] == 'Kuakata' else [])
+        if 'q' in params:
+            calls.append(('owm_name', params['q']))
+            if params['q'].lower() not in KNOWN_TO_OWM:
+                return FakeResponse({'cod': '404', 'message': 'city not found'}, status_code=404)
+            return FakeResponse(owm_payload(params['q'], 0.0, 0.0))
+        calls.append(('owm_coords', (params['lat'], params['lon'])))
+        return FakeResponse(owm_payload('Station', params['lat'], params['lon']))
+
+    monkeypatch.setenv('OPENWEATHERMAP_API_KEY', 'test-key')
+    monkeypatch.setattr(climacast.upstream_client, 'get', get)
+    monkeypatch.setattr(climacast, '_gazetteer', Gazetteer(PLACES))
+    monkeypatch.setattr(climacast, 'geocode_store', GeocodeStore(str(tmp_path / 'geocode.sqlite3')))
+    climacast.current_conditions_cache.clear()
+    climacast.gazetteer_fuzzy_cache.clear()
+    yield calls
+    climacast.current_conditions_cache.clear()
+    climacast.gazetteer_fuzzy_cache.clear()
+
+
+@pytest.fixture
+def client():
+    return climacast.app.test_client()
+
+
+def test_exact_gazetteer_name_is_looked_up_by_coordinates(upstream, client):
+    response = client.get('/api/weather?city=Chattogram')
+    assert response.status_code == 200
+    assert response.get_json()['city'] == 'Chittagong'
+    assert upstream == [('owm_coords', (22.3384, 91.83168))]
+
+
+def test_misspelled_city_resolves_to_the_gazetteer_city(upstream, client):
+    response = client.get('/api/weather?city=Dhakka')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['city'] == 'Dhaka'
+    assert (body['latitude'], body['longitude']) == (23.7104, 90.40744)
+    assert upstream == [('owm_name', 'Dhakka'), ('owm_coords', (23.7104, 90.40744))]
+
+
+def test_unknown_city_is_a_404(upstream, client):
+    response = client.get('/api/weather?city=Qwxzv')
+    assert response.status_code == 404
+    assert upstream == [('owm_name', 'Qwxzv'), ('nominatim', 'Qwxzv')]
+
+
+def test_geocoded_city_is_served_from_the_store_on_later_lookups(upstream, client, monkeypatch, tmp_path):
+    response = client.get('/api/weather?city=Kuakata')
+    assert response.status_code == 200
+    assert upstream == [('owm_name', 'Kuakata'), ('nominatim', 'Kuakata'), ('owm_coords', (21.82, 90.12))]
+
+    # A restart: fresh store object on the same file, nothing in the weather cache.
+    monkeypatch.setattr(climacast, 'geocode_store', GeocodeStore(str(tmp_path / 'geocode.sqlite3')))
+    climacast.current_conditions_cache.clear()
+    upstream.clear()
+    response = client.get('/api/weather?city=Kuakata')
+    assert response.status_code == 200
+    assert upstream == [('owm_coords', (21.82, 90.12))]
+
+
+def test_not_found_answers_are_remembered(upstream, client):
+    assert client.get('/api/weather?city=Qwxzv').status_code == 404
+    upstream.clear()
+    assert client.get('/api/weather?city=Qwxzv').status_code == 404
+    assert upstream == [('owm_name', 'Qwxzv')]
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram
+
+
+def run_threads(target, count, batch=50):
+    for _ in range(count // batch):
+        threads = [threading.Thread(target=target) for _ in range(batch)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def test_short_lived_threads_fold_into_bounded_shards():
+    counter = Counter('requests', 'Requests.', ('route',))
+    histogram = Histogram('latency', 'Latency.')
+
+    def work():
+        counter.inc(('home',))
+        histogram.observe(0.003)
+
+    run_threads(work, 2000)
+    assert counter.value(('home',)) == 2000
+    assert histogram.snapshot()[2] == 2000
+    assert counter._values.shard_count() <= 51
+    assert histogram._series.shard_count() <= 51
+
+
+def test_short_lived_greenlets_fold_into_bounded_shards(monkeypatch):
+    gevent = pytest.importorskip('gevent')
+    from gevent.local import local
+    # What gevent's monkey patching does to `threading.local` in wsgi_async.
+    monkeypatch.setattr(metrics.threading, 'local', local)
+    counter = Counter('requests', 'Requests.')
+
+    def work():
+        counter.inc()
+        gevent.sleep(0)
+
+    for _ in range(10):
+        gevent.joinall([gevent.spawn(work) for _ in range(500)])
+    assert counter.value() == 5000
+    assert counter._values.shard_count() <= 501
+
+
+def test_histogram_render_is_cumulative():
+    registry = metrics.MetricsRegistry()
+    histogram = registry.histogram('latency', 'Latency.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+    text = registry.render()
+    assert 'latency_bucket{le="0.1"} 1\n' in text
+    assert 'latency_bucket{le="1.0"} 2\n' in text
+    assert 'latency_bucket{le="+Inf"} 3\n' in text
+    assert 'latency_count 3\n' in text
@@ -0,0 +1,85 @@
+"""
+Parity of the compiled rule sets with the original if/elif rule chains in app.py.
+"""
+import itertools
+
+import pytest
+
+from app import (HEALTH_CONCERNS_BN, PERFECT_DAY_ACTIVITIES, analyze_activity_conditions,
+                 check_health_condition_triggers)
+from rule_engine import compile_activity_rules, compile_health_rules
+
+WEATHER_MAINS = ['Clear', 'Clouds', 'Rain', 'Drizzle', 'Snow', 'Thunderstorm', 'Fog', 'Mist', 'Haze', 'clear', 'RAIN']
+DESCRIPTIONS = ['clear sky', 'light rain', 'heavy intensity rain', 'shower rain', 'extreme rain', 'overcast clouds']
+
+
+def _around(thresholds, extra):
+    """Every threshold, values just either side of it, and a coarse sweep."""
+    values = set(extra)
+    for threshold in thresholds:
+        values.update((threshold - 0.5, threshold, threshold + 0.5))
+    return sorted(values)
+
+
+def _activity_thresholds(key):
+    values = []
+    for prefs in PERFECT_DAY_ACTIVITIES.values():
+        if key == 'temperature':
+            values.extend(prefs.get('temp_range_c', ()))
+            if 'min_temp_c' in prefs: values.append(prefs['min_temp_c'])
+            if 'temp_range_c' in prefs: values.append(prefs['temp_range_c'][1] + 5)
+        elif key == 'wind':
+            if 'max_wind_kmh' in prefs: values.extend((prefs['max_wind_kmh'], prefs['max_wind_kmh'] + 10))
+        elif 'max_humidity_percent' in prefs:
+            values.append(prefs['max_humidity_percent'])
+    return values
+
+
+def _health_thresholds():
+    values = []
+    for concern in HEALTH_CONCERNS_BN.values():
+        for value in concern['triggers'].values():
+            if isinstance(value, tuple): values.extend(value)
+            elif not isinstance(value, bool): values.append(value)
+    return values
+
+
+ACTIVITY_TEMPERATURES = _around(_activity_thresholds('temperature'), range(-10, 50, 10))
+ACTIVITY_WINDS = _around(_activity_thresholds('wind'), range(0, 70, 20))
+ACTIVITY_HUMIDITIES = _around(_activity_thresholds('humidity'), range(0, 101, 25))
+HEALTH_TEMPERATURES = _around(_health_thresholds(), range(-10, 50, 10))
+HEALTH_HUMIDITIES = _around(_health_thresholds(), range(0, 101, 25))
+# Only the heatstroke trigger reads feels_like.
+FEELS_LIKE = _around([HEALTH_CONCERNS_BN['heatstroke_exhaustion']['triggers']['high_feels_like_c']], (0, 25, 50))
+
+
+@pytest.fixture(scope='module')
+def activity_rules():
+    return compile_activity_rules(PERFECT_DAY_ACTIVITIES)
+
+
+@pytest.fixture(scope='module')
+def health_rules():
+    return compile_health_rules(HEALTH_CONCERNS_BN)
+
+
+@pytest.mark.parametrize('weather_main', WEATHER_MAINS)
+def test_activity_rules_match_legacy_chain(activity_rules, weather_main):
+    samples = [{'temperature': t, 'wind_speed_kmh': w, 'humidity': h, 'weather_main': weather_main}
+               for t, w, h in itertools.product(ACTIVITY_TEMPERATURES, ACTIVITY_WINDS, ACTIVITY_HUMIDITIES)]
+    outcomes = activity_rules.evaluate_samples(samples)
+    for sample, row in zip(samples, outcomes):
+        for rule_index, key in enumerate(activity_rules.keys):
+            expected = analyze_activity_conditions(key, PERFECT_DAY_ACTIVITIES[key], sample)
+            assert activity_rules.reason(rule_index, row[rule_index], sample) == expected, (key, sample)
+
+
+@pytest.mark.parametrize('weather_main, description', list(itertools.product(WEATHER_MAINS, DESCRIPTIONS)))
+def test_health_rules_match_legacy_chain(health_rules, weather_main, description):
+    samples = [{'temperature': t, 'feels_like': f, 'humidity': h, 'weather_main': weather_main, 'description': description}
+               for t, f, h in itertools.product(HEALTH_TEMPERATURES, FEELS_LIKE, HEALTH_HUMIDITIES)]
+    triggered = health_rules.evaluate_samples(samples)
+    for sample, row in zip(samples, triggered):
+        for concern_index, key in enumerate(health_rules.keys):
+            expected = check_health_condition_triggers(HEALTH_CONCERNS_BN[key]['triggers'], sample)
+            assert bool(row[concern_index]) == expected, (key, sample)
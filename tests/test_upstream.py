@@ -0,0 +1,86 @@
+import pytest
+import requests
+
+from quota import BACKGROUND, INTERACTIVE, QuotaExhaustedError
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+URL = 'https://upstream.test/data'
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return FakeResponse(outcome)
+
+
+class FakeBudget:
+    def __init__(self, refuse=()):
+        self.refuse = set(refuse)
+
+    def acquire(self, priority):
+        return priority not in self.refuse
+
+    def wait_time(self, priority):
+        return 1.0
+
+    def defer(self, seconds):
+        pass
+
+
+def make_client(outcomes, budget=None):
+    client = UpstreamClient(retries=0, failure_threshold=1, reset_timeout=0.0)
+    client.session = FakeSession(outcomes)
+    if budget is not None:
+        client.set_budget(URL, budget)
+    return client
+
+
+def test_failed_call_opens_the_circuit():
+    client = make_client([requests.exceptions.ConnectionError()])
+    client.breaker('upstream.test').reset_timeout = 60.0
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get(URL)
+    with pytest.raises(CircuitOpenError):
+        client.get(URL)
+    assert client.session.calls == 1
+
+
+def test_budget_refusal_gives_back_the_half_open_trial():
+    client = make_client([requests.exceptions.ConnectionError(), 200], FakeBudget(refuse={BACKGROUND}))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get(URL)
+    assert client.breaker_states()['upstream.test'] == CircuitBreaker.OPEN
+
+    # The refused call made no request, so it must not leave the circuit stuck half-open.
+    with pytest.raises(QuotaExhaustedError):
+        client.get(URL, priority=BACKGROUND)
+    assert client.breaker_states()['upstream.test'] == CircuitBreaker.OPEN
+
+    assert client.get(URL, priority=INTERACTIVE).status_code == 200
+    assert client.breaker_states()['upstream.test'] == CircuitBreaker.CLOSED
+    assert client.session.calls == 2
+
+
+def test_unexpected_request_exception_is_reported_to_the_breaker():
+    client = make_client([requests.exceptions.TooManyRedirects(), 200])
+    with pytest.raises(requests.exceptions.TooManyRedirects):
+        client.get(URL)
+    assert client.breaker_states()['upstream.test'] == CircuitBreaker.OPEN
+    assert client.get(URL).status_code == 200
+    assert client.breaker_states()['upstream.test'] == CircuitBreaker.CLOSED
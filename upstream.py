@@ -0,0 +1,211 @@
+"""
+Shared HTTP client for the upstream services (OpenWeatherMap, Open-Meteo, Nominatim).
+"""
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from quota import INTERACTIVE, PRIORITY_NAMES, QuotaExhaustedError, parse_retry_after
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without contacting the upstream while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker. After `failure_threshold` consecutive failed calls the circuit opens and
+    calls fail fast for `reset_timeout` seconds; then a single trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit. A call counts once however
+    many attempts it made.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def release(self):
+        """Gives back a half-open trial slot that was granted but not used; the next call becomes the trial."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class UpstreamClient:
+    """
+    Keep-alive `requests.Session` with one connection pool per host, default connect/read
+    timeouts, bounded retries with jittered exponential backoff on 5xx responses and
+    connection errors, and a circuit breaker per host.
+
+    Read timeouts are not retried so a stalled upstream costs at most one read timeout.
+    A call that ends in a 5xx or any `requests` exception, after its retries, is one failure
+    for the host's breaker; any other response is a success.
+
+    Hosts with a budget (`set_budget`) draw one token per attempt from their `TokenBucket`
+    at the caller's priority. A 429 response defers the bucket by its `Retry-After`
+    (or `default_retry_after` seconds).
+
+    `on_call(host, outcome, seconds)` is invoked after every attempt, with `outcome` one of
+    '2xx'..'5xx', 'timeout' or 'error'; `on_event(host, event)` for 'retry', 'timeout',
+    'circuit_open', 'quota_refused' and 'rate_limited'. Both default to None (no instrumentation).
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, retries=2, backoff_base=0.2,
+                 backoff_max=2.0, pool_maxsize=20, failure_threshold=5, reset_timeout=30.0,
+                 default_retry_after=60.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.default_retry_after = default_retry_after
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._budgets = {}
+        self.on_call = None
+        self.on_event = None
+
+    def breaker(self, host):
+        with self._breakers_lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def breaker_states(self):
+        with self._breakers_lock:
+            return {host: breaker.state for host, breaker in self._breakers.items()}
+
+    def set_budget(self, url, bucket):
+        """Makes every call to the host of `url` draw from `bucket`."""
+        self._budgets[urlsplit(url).netloc] = bucket
+
+    def budget(self, url):
+        return self._budgets.get(urlsplit(url).netloc)
+
+    def budget_stats(self):
+        return {host: bucket.stats() for host, bucket in self._budgets.items()}
+
+    def _event(self, host, event):
+        if self.on_event is not None:
+            self.on_event(host, event)
+
+    def _backoff(self, attempt):
+        # "Full jitter": sleep a random time up to the exponential bound.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, url, params=None, headers=None, timeout=None, priority=INTERACTIVE):
+        """
+        Performs a GET and returns the `requests.Response`. A 5xx response is returned
+        once retries are exhausted so callers keep using `raise_for_status()`.
+        Raises `CircuitOpenError` (a `requests.exceptions.ConnectionError`) while the host's circuit is open,
+        and `QuotaExhaustedError` (a `requests.exceptions.RequestException`) when the host's budget refuses the call.
+        """
+        host = urlsplit(url).netloc
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            self._event(host, 'circuit_open')
+            raise CircuitOpenError(f"Circuit open for upstream host '{host}'.")
+        bucket = self._budgets.get(host)
+        if bucket is not None and not bucket.acquire(priority):
+            # No request is made, so this call must not hold on to a half-open trial.
+            breaker.release()
+            self._event(host, 'quota_refused')
+            raise QuotaExhaustedError(f"Call budget for upstream host '{host}' exhausted ({PRIORITY_NAMES[priority]}).",
+                                      retry_after=bucket.wait_time(priority))
+        if timeout is None:
+            timeout = self.timeout
+        elif not isinstance(timeout, tuple):
+            timeout = (min(self.timeout[0], timeout), timeout)
+
+        # The breaker hears one outcome per call, however many attempts it took, and hears it on
+        # every exit path, so a half-open trial can never be left unreported.
+        succeeded = False
+        attempt = 0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = self.session.get(url, params=params, headers=headers, timeout=timeout)
+                except requests.exceptions.ReadTimeout:
+                    if self.on_call is not None:
+                        self.on_call(host, 'timeout', time.perf_counter() - started)
+                    self._event(host, 'timeout')
+                    raise
+                except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as e:
+                    timed_out = isinstance(e, requests.exceptions.Timeout)
+                    if self.on_call is not None:
+                        self.on_call(host, 'timeout' if timed_out else 'error', time.perf_counter() - started)
+                    if timed_out:
+                        self._event(host, 'timeout')
+                    if attempt >= self.retries or not breaker.allow():
+                        raise
+                    time.sleep(self._backoff(attempt))
+                    if bucket is not None and not bucket.acquire(priority):
+                        raise
+                except requests.exceptions.RequestException:
+                    if self.on_call is not None:
+                        self.on_call(host, 'error', time.perf_counter() - started)
+                    raise
+                else:
+                    if self.on_call is not None:
+                        self.on_call(host, f"{response.status_code // 100}xx", time.perf_counter() - started)
+                    if response.status_code < 500:
+                        succeeded = True
+                        if response.status_code == 429:
+                            self._event(host, 'rate_limited')
+                        if response.status_code == 429 and bucket is not None:
+                            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                            bucket.defer(self.default_retry_after if retry_after is None else retry_after)
+                        return response
+                    if attempt >= self.retries or not breaker.allow():
+                        return response
+                    time.sleep(self._backoff(attempt))
+                    if bucket is not None and not bucket.acquire(priority):
+                        return response
+                    response.close()
+                self._event(host, 'retry')
+                attempt += 1
+        finally:
+            if succeeded:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
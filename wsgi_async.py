@@ -0,0 +1,29 @@
+"""
+Cooperative-I/O entry point for ClimaCast.
+
+gevent patches sockets, locks, sleeps and threads before the app is imported, so every
+upstream call (OWM, Nominatim, Open-Meteo, Gemini over REST) yields to other requests
+while it waits instead of holding a worker thread. Thread pools used for fan-out
+(batch lookups, the dashboard's history fetch) become greenlet pools, so independent
+calls run concurrently. Routes and JSON responses are the same as under app.py.
+
+Run with gunicorn:
+    gunicorn -k gevent --worker-connections 1000 -w 2 wsgi_async:app
+or standalone:
+    python wsgi_async.py
+"""
+from gevent import monkey
+
+monkey.patch_all()
+
+import os  # noqa: E402
+
+os.environ.setdefault('CLIMACAST_ASYNC_IO', 'true')
+
+from app import app  # noqa: E402,F401
+
+if __name__ == '__main__':
+    from gevent.pywsgi import WSGIServer
+
+    port = int(os.getenv('PORT', '5000'))
+    WSGIServer(('0.0.0.0', port), app).serve_forever()